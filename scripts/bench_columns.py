@@ -0,0 +1,78 @@
+"""Summarize a large profile with reader.read and with pynytprof.columns.
+
+Writes a profile of ``--records`` S records spread over 1 MiB chunks, then
+finds the 20 most expensive lines both ways: decoding tuples with
+``reader.read`` and summing in a dict, versus NumPy views with
+``group_by`` and ``top_k``.  Needs NumPy.
+Usage: ``python scripts/bench_columns.py [--records 10000000] [--skip-tuples]``.
+"""
+
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import numpy as np
+
+from pynytprof import columns, reader
+
+PER_CHUNK = (1 << 20) // 28
+
+
+def write_profile(path: str, n: int) -> None:
+    rng = np.random.default_rng(1)
+    recs = np.empty(n, dtype=columns.record_dtype())
+    recs["fid"] = rng.integers(1, 50, n)
+    recs["line"] = rng.integers(1, 2000, n)
+    recs["calls"] = 1
+    recs["incl"] = rng.lognormal(5, 2, n).astype(np.uint64)
+    recs["excl"] = recs["incl"] // 2
+    with open(path, "wb") as fh:
+        fh.write(b"NYTProf 5 0\n:nv_size=8\nP" + struct.pack("<IId", 1, 1, 0.0))
+        for lo in range(0, n, PER_CHUNK):
+            payload = recs[lo : lo + PER_CHUNK].tobytes()
+            fh.write(b"S" + struct.pack("<I", len(payload)) + payload)
+        fh.write(b"E")
+
+
+def with_tuples(path: str) -> list:
+    totals: dict[tuple[int, int], int] = {}
+    for fid, line, _calls, incl, _excl in reader.read(path)["records"]:
+        totals[fid, line] = totals.get((fid, line), 0) + incl
+    return sorted(totals.items(), key=lambda kv: kv[1], reverse=True)[:20]
+
+
+def with_columns(path: str) -> list:
+    lines = columns.read_arrays(path)["lines"]
+    top = columns.top_k(columns.group_by(lines), "incl", 20)
+    return [((int(r["fid"]), int(r["line"])), int(r["incl"])) for r in top]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=10_000_000)
+    parser.add_argument("--skip-tuples", action="store_true")
+    ns = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nytprof.out")
+        write_profile(path, ns.records)
+        cases = [("columns", with_columns)]
+        if not ns.skip_tuples:
+            cases.append(("reader.read", with_tuples))
+        print("summary      | seconds")
+        results = []
+        for name, fn in cases:
+            t0 = time.perf_counter()
+            results.append(fn(path))
+            print(f"{name:<12} | {time.perf_counter() - t0:7.3f}")
+        assert all(r == results[0] for r in results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+"""Measure _ctrace with NYTPROF_FILTER on a loop in a matched file.
+
+Writes a script whose ``main()`` runs a tight loop, sets ``NYTPROF_FILTER``
+to match it and reports the best time of a traced run, including
+``dump()``.  The filter verdict is cached per code object, so this should
+cost the same as tracing without a filter.
+Usage: ``python scripts/bench_ctrace_filter.py [-n REPEAT] [--loops N]``.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", type=int, default=5)
+    parser.add_argument("--loops", type=int, default=500_000)
+    ns = parser.parse_args()
+    try:
+        from pynytprof import _ctrace
+    except ImportError:
+        print("_ctrace is not built for this interpreter", file=sys.stderr)
+        return 1
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "loop.py"
+        script.write_text(
+            f"def main():\n    t = 0\n    for i in range({ns.loops}):\n        t += i\n"
+            "    return t\n\n\nmain()\n"
+        )
+        code = compile(script.read_text(), str(script), "exec")
+        os.environ["NYTPROF_FILTER"] = str(Path(tmp) / "*.py")
+        best = float("inf")
+        for _ in range(ns.repeat):
+            t0 = time.perf_counter()
+            _ctrace.enable(str(script), 0)
+            try:
+                exec(code, {"__name__": "__main__"})
+            finally:
+                _ctrace.dump()
+            best = min(best, time.perf_counter() - t0)
+        os.environ.pop("NYTPROF_FILTER")
+    print(f"{ns.loops} iterations with NYTPROF_FILTER: {best:.3f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+"""Measure _ctrace overhead on deeply recursive code.
+
+Runs a recursive workload untraced and under the ``_ctrace`` extension for
+several recursion depths, reporting time per call and whether every call was
+recorded.  Usage: ``python scripts/bench_deep_recursion.py [-n REPEAT]``.
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def recurse(n):
+    return 0 if n == 0 else 1 + recurse(n - 1)
+
+
+def run(depth: int, calls: int, ctrace) -> tuple[float, int]:
+    t0 = time.perf_counter()
+    if ctrace is None:
+        for _ in range(calls // depth):
+            recurse(depth)
+        return time.perf_counter() - t0, 0
+    ctrace.enable(__file__, 0)
+    try:
+        for _ in range(calls // depth):
+            recurse(depth)
+    finally:
+        _defs, records, _lines = ctrace.dump()
+    elapsed = time.perf_counter() - t0
+    return elapsed, sum(rec[5] for rec in records)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=200_000)
+    ns = parser.parse_args()
+    try:
+        from pynytprof import _ctrace
+    except ImportError:
+        print("_ctrace extension not built", file=sys.stderr)
+        return 1
+    sys.setrecursionlimit(10_000)
+    print("depth  | untraced ns/call | traced ns/call | recorded/expected")
+    for depth in (10, 1000, 5000):
+        expected = (ns.calls // depth) * (depth + 1)
+        base = min(run(depth, ns.calls, None)[0] for _ in range(ns.repeat))
+        traced, recorded = min(run(depth, ns.calls, _ctrace) for _ in range(ns.repeat))
+        per = 1e9 / expected
+        print(f"{depth:<6} | {base * per:16.0f} | {traced * per:14.0f} | {recorded}/{expected}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Compare _ctrace.dump() plus Python packing with dump_packed().
+
+Traces a generated script with one statement per line, then times turning
+the collected line table into an S chunk payload: ``dump()`` with a fid
+remap and ``struct.pack`` per record, against ``dump_packed()`` which
+packs in C.  Usage: ``python scripts/bench_dump_packed.py [-n REPEAT] [--lines N]``.
+"""
+
+import argparse
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def via_dump(ctrace) -> int:
+    _defs, _calls, lines = ctrace.dump()
+    fids: dict[str, int] = {}
+    payload = bytearray()
+    for path, line, calls, inc, exc in lines:
+        fid = fids.setdefault(path, len(fids) + 1)
+        payload += struct.pack("<IIIQQ", fid, line, calls, inc, exc)
+    return len(payload)
+
+
+def via_dump_packed(ctrace) -> int:
+    _paths, s_payload, _d_payload, _c_payload = ctrace.dump_packed()
+    return len(s_payload)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    parser.add_argument("--lines", type=int, default=300_000)
+    ns = parser.parse_args()
+    try:
+        from pynytprof import _ctrace
+    except ImportError:
+        print("_ctrace is not built for this interpreter", file=sys.stderr)
+        return 1
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "flat.py"
+        script.write_text("".join(f"x{i} = {i}\n" for i in range(ns.lines)))
+        code = compile(script.read_text(), str(script), "exec")
+        for name, fn in (("dump + struct.pack", via_dump), ("dump_packed", via_dump_packed)):
+            best = float("inf")
+            for _ in range(ns.repeat):
+                _ctrace.enable(str(script), 0)
+                exec(code, {"__name__": "__main__"})
+                t0 = time.perf_counter()
+                size = fn(_ctrace)
+                best = min(best, time.perf_counter() - t0)
+            print(f"{name:<18} | {best:.3f}s | {size // 28} records")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""Measure tracer overhead on a script that spends its time in library code.
+
+Compares an untraced run with the settrace tracer before and after out-of-scope
+frames stopped being line-traced, and with the sys.monitoring backend where
+available.  Usage: ``python scripts/bench_out_of_scope.py [-n REPEAT]``.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+WORKLOAD = """\
+import fractions
+import ipaddress
+import statistics
+import textwrap
+
+
+def main():
+    total = fractions.Fraction(0)
+    for i in range(1, 1500):
+        total += fractions.Fraction(1, i)
+    statistics.pstdev([float(i % 97) for i in range(20000)])
+    textwrap.fill("lorem ipsum dolor " * 3000, width=40)
+    for i in range(3000):
+        ipaddress.ip_address(f"10.0.{i % 256}.{i // 256}")
+
+
+main()
+"""
+
+
+_scoped_trace = tracer._trace
+
+
+def _line_trace_everything(frame, event, arg):
+    # pre-change behaviour: keep a local trace function on every frame
+    _scoped_trace(frame, event, arg)
+    return _line_trace_everything
+
+
+def run_once(script: Path, out: Path, mode: str) -> float:
+    tracer._ctrace = None
+    tracer._use_monitoring = mode == "monitoring"
+    if mode == "before":
+        tracer._trace = _line_trace_everything
+    t0 = time.perf_counter()
+    try:
+        if mode == "untraced":
+            code = compile(script.read_text(), str(script), "exec")
+            exec(code, {"__name__": "__main__"})
+        else:
+            tracer.profile_script(str(script), out)
+    finally:
+        tracer._trace = _scoped_trace
+    return time.perf_counter() - t0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    ns = parser.parse_args()
+    modes = ["untraced", "before", "after"]
+    if hasattr(sys, "monitoring"):
+        modes.append("monitoring")
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "libheavy.py"
+        script.write_text(WORKLOAD)
+        out = Path(tmp) / "nytprof.out"
+        best = {m: min(run_once(script, out, m) for _ in range(ns.repeat)) for m in modes}
+    base = best["untraced"]
+    print("mode       | seconds | overhead")
+    for m in modes:
+        print(f"{m:<10} | {best[m]:7.3f} | {best[m] / base:6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
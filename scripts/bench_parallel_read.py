@@ -0,0 +1,64 @@
+"""Time reader.read on an indexed profile, sequentially and with workers.
+
+Writes ``--records`` S records in 1 MiB chunks followed by a chunk index,
+then decodes the file with ``reader.read(path)`` and with
+``reader.read(path, workers=N)`` for each requested worker count.
+Usage: ``python scripts/bench_parallel_read.py [--records 5000000] [--workers 2,4]``.
+"""
+
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import reader
+from pynytprof._index import encode_index
+
+PER_CHUNK = (1 << 20) // 28
+
+
+def write_profile(path: str, n: int) -> None:
+    rec = struct.Struct("<IIIQQ")
+    entries = []
+    with open(path, "wb") as fh:
+        fh.write(b"NYTProf 5 0\n:nv_size=8\nP" + struct.pack("<IId", 1, 1, 0.0))
+        for lo in range(0, n, PER_CHUNK):
+            count = min(PER_CHUNK, n - lo)
+            payload = b"".join(
+                rec.pack(1 + i % 7, i % 5000, 1, i, i) for i in range(lo, lo + count)
+            )
+            fh.write(b"S" + struct.pack("<I", len(payload)))
+            entries.append((b"S", fh.tell(), len(payload), count))
+            fh.write(payload)
+        index = encode_index(entries, fh.tell())
+        fh.write(b"X" + struct.pack("<I", len(index)) + index + b"E")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=5_000_000)
+    parser.add_argument("--workers", default="2,4")
+    ns = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nytprof.out")
+        write_profile(path, ns.records)
+        print("workers | seconds")
+        expected = None
+        for workers in [None] + [int(w) for w in ns.workers.split(",")]:
+            t0 = time.perf_counter()
+            data = reader.read(path, workers=workers)
+            dt = time.perf_counter() - t0
+            if expected is None:
+                expected = data
+            assert data == expected
+            print(f"{workers or 1:>7} | {dt:7.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,136 @@
+"""Overhead and error of NYTPROF_SAMPLE_STRIDE against full tracing.
+
+Profiles a branchy CPU-bound script with every tracer available (the Python
+tracer and, when built, ``_ctrace``) at each stride, with fixed and random
+gaps.  Prints the overhead relative to an untraced run, the count error
+(summed absolute difference of per-line counts over the full-tracing total)
+and the time error (total variation distance between per-line time shares).
+Usage: ``python scripts/bench_sample_stride.py [-n REPEAT] [--strides 4,16,64]``.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+WORKLOAD = """\
+def collatz(n):
+    steps = 0
+    while n != 1:
+        if n % 2 == 0:
+            n //= 2
+        else:
+            n = 3 * n + 1
+        steps += 1
+    return steps
+
+
+def digits(n):
+    return sum(int(c) for c in str(n))
+
+
+def main():
+    best = 0
+    for i in range(1, 6000):
+        best = max(best, collatz(i))
+        if i % 3 == 0:
+            best += digits(i) % 2
+    return best
+
+
+main()
+"""
+
+
+def run_python(script: Path, out: Path) -> tuple[float, dict]:
+    tracer._ctrace = None
+    t0 = time.perf_counter()
+    tracer.profile_script(str(script), out)
+    dt = time.perf_counter() - t0
+    # the writer scales on the way out; apply the same factor here
+    k = tracer._sample_stride
+    lines = {line: (rec[0] * k, rec[3] * k) for (_fid, line), rec in tracer._line_hits.items()}
+    return dt, lines
+
+
+def run_ctrace(ctrace, script: Path) -> tuple[float, dict]:
+    code = compile(script.read_text(), str(script), "exec")
+    t0 = time.perf_counter()
+    ctrace.enable(str(script), 0)
+    try:
+        exec(code, {"__name__": "__main__"})
+    finally:
+        _defs, _calls, records = ctrace.dump()
+    dt = time.perf_counter() - t0
+    lines = {line: (calls, inc) for path, line, calls, inc, _exc in records if path == str(script)}
+    return dt, lines
+
+
+def errors(lines: dict, full: dict) -> tuple[float, float]:
+    keys = set(lines) | set(full)
+    total_calls = sum(c for c, _t in full.values())
+    count_err = (
+        sum(abs(lines.get(k, (0, 0))[0] - full.get(k, (0, 0))[0]) for k in keys) / total_calls
+    )
+    t_all, t_full = sum(t for _c, t in lines.values()) or 1, sum(t for _c, t in full.values())
+    time_err = (
+        sum(abs(lines.get(k, (0, 0))[1] / t_all - full.get(k, (0, 0))[1] / t_full) for k in keys)
+        / 2
+    )
+    return count_err, time_err
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    parser.add_argument("--strides", default="4,16,64")
+    ns = parser.parse_args()
+    try:
+        from pynytprof import _ctrace as ctrace
+    except ImportError:
+        ctrace = None
+    settings = [("1", "0")] + [(s, r) for s in ns.strides.split(",") for r in ("0", "1")]
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "branchy.py"
+        script.write_text(WORKLOAD)
+        out = Path(tmp) / "nytprof.out"
+        code = compile(WORKLOAD, str(script), "exec")
+        base = float("inf")
+        for _ in range(ns.repeat):
+            t0 = time.perf_counter()
+            exec(code, {"__name__": "__main__"})
+            base = min(base, time.perf_counter() - t0)
+        runners = [("python", lambda: run_python(script, out))]
+        if ctrace is not None:
+            runners.append(("ctrace", lambda: run_ctrace(ctrace, script)))
+        print(f"untraced {base:.3f}s")
+        print("tracer | stride | gaps   | seconds | overhead | count err | time err")
+        for name, run in runners:
+            full = None
+            for stride, rnd in settings:
+                os.environ["NYTPROF_SAMPLE_STRIDE"] = stride
+                os.environ["NYTPROF_SAMPLE_RANDOM"] = rnd
+                results = [run() for _ in range(ns.repeat)]
+                dt = min(r[0] for r in results)
+                lines = results[-1][1]
+                if full is None:
+                    full = lines
+                count_err, time_err = errors(lines, full)
+                gaps = "random" if rnd == "1" else "fixed"
+                print(
+                    f"{name:<6} | {stride:>6} | {gaps:<6} | {dt:7.3f} | {dt / base:7.1f}x"
+                    f" | {100 * count_err:8.2f}% | {100 * time_err:7.2f}%"
+                )
+    os.environ.pop("NYTPROF_SAMPLE_STRIDE", None)
+    os.environ.pop("NYTPROF_SAMPLE_RANDOM", None)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
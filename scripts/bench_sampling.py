@@ -0,0 +1,72 @@
+"""Measure the overhead of sampling against an untraced run.
+
+Runs a CPU-bound script untraced, under ``profile_script(sample_hz=...)`` for
+each requested rate, and under the full Python line tracer, then prints the
+best time of each and the overhead relative to the untraced run.
+Usage: ``python scripts/bench_sampling.py [-n REPEAT] [--hz 100,1000] [--clock cpu|wall]``.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+WORKLOAD = """\
+def collatz(n):
+    steps = 0
+    while n != 1:
+        n = n // 2 if n % 2 == 0 else 3 * n + 1
+        steps += 1
+    return steps
+
+
+def main():
+    return max(collatz(i) for i in range(1, 60000))
+
+
+main()
+"""
+
+
+def run_once(script: Path, out: Path, mode: str, clock: str) -> float:
+    tracer._ctrace = None
+    t0 = time.perf_counter()
+    if mode == "untraced":
+        code = compile(script.read_text(), str(script), "exec")
+        exec(code, {"__name__": "__main__"})
+    elif mode == "traced":
+        tracer.profile_script(str(script), out)
+    else:
+        tracer.profile_script(str(script), out, sample_hz=int(mode), sample_clock=clock)
+    return time.perf_counter() - t0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--repeat", type=int, default=3)
+    parser.add_argument("--hz", default="100,1000")
+    parser.add_argument("--clock", choices=("cpu", "wall"), default="cpu")
+    ns = parser.parse_args()
+    modes = ["untraced", *ns.hz.split(","), "traced"]
+    with tempfile.TemporaryDirectory() as tmp:
+        script = Path(tmp) / "cpu.py"
+        script.write_text(WORKLOAD)
+        out = Path(tmp) / "nytprof.out"
+        best = {
+            m: min(run_once(script, out, m, ns.clock) for _ in range(ns.repeat)) for m in modes
+        }
+    base = best["untraced"]
+    print("mode     | seconds | overhead")
+    for m in modes:
+        label = m if m in ("untraced", "traced") else f"{m} Hz"
+        print(f"{label:<8} | {best[m]:7.3f} | {100 * (best[m] / base - 1):+7.1f}%")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+"""Time the NYTProf token encoders on TIME_LINE records.
+
+Encodes the same line events with ``TokenWriter`` (one ``bytes`` per token),
+the pure Python ``TokenEncoder`` and, when built, ``_ctoken.Encoder`` one
+call per event and in batches from parallel arrays.
+Usage: ``python scripts/bench_token_encoder.py [--events 1000000] [--batch 4096]``.
+"""
+
+import argparse
+import sys
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof.token_writer import TokenEncoder, TokenWriter
+
+
+def make_events(n: int) -> tuple[array, array, array]:
+    fids = array("I", [1 + i % 3 for i in range(n)])
+    lines = array("I", [1 + i % 5000 for i in range(n)])
+    elapsed = array("i", [(i * 37) % 20000 for i in range(n)])
+    return fids, lines, elapsed
+
+
+def bench_token_writer(fids, lines, elapsed, batch) -> int:
+    tw = TokenWriter()
+    out = bytearray()
+    for fid, line, dt in zip(fids, lines, elapsed):
+        out += tw.write_time_line(fid, line, dt, 0)
+    return len(out)
+
+
+def bench_single(cls):
+    def run(fids, lines, elapsed, batch) -> int:
+        enc = cls()
+        total = 0
+        for fid, line, dt in zip(fids, lines, elapsed):
+            enc.time_line(fid, line, dt, 0)
+            if len(enc) >= 65536:
+                total += len(enc.take())
+        return total + len(enc.take())
+
+    return run
+
+
+def bench_batch(cls):
+    def run(fids, lines, elapsed, batch) -> int:
+        enc = cls()
+        total = 0
+        for lo in range(0, len(fids), batch):
+            hi = lo + batch
+            enc.time_lines(fids[lo:hi], lines[lo:hi], elapsed[lo:hi])
+            total += len(enc.take())
+        return total
+
+    return run
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--batch", type=int, default=4096)
+    ns = parser.parse_args()
+    cases = [
+        ("TokenWriter", bench_token_writer),
+        ("TokenEncoder", bench_single(TokenEncoder)),
+        ("TokenEncoder batch", bench_batch(TokenEncoder)),
+    ]
+    try:
+        from pynytprof._ctoken import Encoder
+    except ImportError:
+        print("_ctoken extension not built; timing Python encoders only", file=sys.stderr)
+    else:
+        cases += [
+            ("_ctoken", bench_single(Encoder)),
+            ("_ctoken batch", bench_batch(Encoder)),
+        ]
+    cols = make_events(ns.events)
+    print("encoder            | seconds | ns/event | bytes")
+    for name, run in cases:
+        t0 = time.perf_counter()
+        size = run(*cols, ns.batch)
+        dt = time.perf_counter() - t0
+        print(f"{name:<18} | {dt:7.3f} | {dt / ns.events * 1e9:8.1f} | {size}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
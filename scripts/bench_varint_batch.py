@@ -0,0 +1,73 @@
+"""Time batch varint encoding and decoding against the one-value encoder.
+
+Value mixes follow what the token stream carries: file ids (almost all one
+byte), line numbers (one or two bytes), elapsed ticks (mostly small with a
+long tail) and negative times stored as two's complement (five bytes).
+Every available implementation is run: the plain loop, NumPy (when
+installed) and the ``_ctoken`` extension (when built).
+Usage: ``python scripts/bench_varint_batch.py [--count 1000000]``.
+"""
+
+import argparse
+import random
+import sys
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import encoding
+
+
+def make_values(kind: str, n: int, rng: random.Random) -> array:
+    if kind == "fids":
+        vals = [1 + int(rng.expovariate(0.3)) % 200 for _ in range(n)]
+    elif kind == "lines":
+        vals = [1 + int(rng.expovariate(1 / 400)) % 20000 for _ in range(n)]
+    elif kind == "ticks":
+        vals = [min(int(rng.lognormvariate(3, 2.5)), 0xFFFFFFF) for _ in range(n)]
+    elif kind == "negative":
+        vals = [(-rng.randrange(1, 1000)) & 0xFFFFFFFF for _ in range(n)]
+    else:  # uniform over every varint width
+        vals = [rng.getrandbits(rng.choice((7, 14, 21, 28, 32))) for _ in range(n)]
+    return array("I", vals)
+
+
+def timed(fn, arg) -> tuple[float, object]:
+    t0 = time.perf_counter()
+    out = fn(arg)
+    return time.perf_counter() - t0, out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=1_000_000)
+    ns = parser.parse_args()
+    impls = [("loop", encoding._encode_u32_many_py, encoding._decode_u32_many_py)]
+    if encoding._numpy_available():
+        impls.append(("numpy", encoding._encode_u32_many_np, encoding._decode_u32_many_np))
+    if encoding._c_encode_many is not None:
+        impls.append(("_ctoken", encoding._c_encode_many, encoding._c_decode_many))
+    rng = random.Random(1)
+    print("values   | impl    | B/value | encode ns/value | decode ns/value")
+    for kind in ("fids", "lines", "ticks", "negative", "mixed"):
+        vals = make_values(kind, ns.count, rng)
+        t0 = time.perf_counter()
+        single = b"".join(encoding.encode_u32(v) for v in vals)
+        t_single = time.perf_counter() - t0
+        size = len(single) / ns.count
+        print(f"{kind:<8} | single  | {size:7.2f} | {t_single / ns.count * 1e9:15.1f} |")
+        for name, enc, dec in impls:
+            t_enc, data = timed(enc, vals)
+            t_dec, back = timed(dec, data)
+            assert data == single and back == vals
+            print(
+                f"{kind:<8} | {name:<7} | {size:7.2f} | {t_enc / ns.count * 1e9:15.1f} |"
+                f" {t_dec / ns.count * 1e9:15.1f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
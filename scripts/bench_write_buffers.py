@@ -0,0 +1,93 @@
+"""Compare _cwrite.write fed with tuples against packed record buffers.
+
+Writes the same S and C records once as lists of tuples and once as
+``array('I')`` buffers in the ``<IIIQQ`` chunk layout (and as NumPy structured
+arrays when NumPy is installed).  The tuple inputs need roughly 1.5 GB per 10M
+records.  Usage: ``python scripts/bench_write_buffers.py [--sizes 1000000,10000000]``.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from array import array
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+FILES = [(1, 0x10, 0, 0, "bench.py")]
+DEFS = [(1, 1, 1, 1, "main")]
+
+
+def make_tuples(n: int) -> list[tuple[int, int, int, int, int]]:
+    return [(1, i, 1, i * 100, i * 100) for i in range(n)]
+
+
+def make_array(n: int) -> array:
+    # each <IIIQQ record is seven uint32 words; the Q fields are split lo/hi
+    words = array("I", bytes(28 * n))
+    words[1::7] = array("I", range(n))
+    words[0::7] = array("I", [1]) * n
+    words[2::7] = array("I", [1]) * n
+    words[3::7] = array("I", range(n))
+    words[5::7] = array("I", range(n))
+    return words
+
+
+def make_numpy(n: int):
+    import numpy as np
+
+    dtype = np.dtype(
+        [("fid", "<u4"), ("line", "<u4"), ("n", "<u4"), ("inc", "<u8"), ("exc", "<u8")]
+    )
+    recs = np.zeros(n, dtype=dtype)
+    recs["fid"] = 1
+    recs["line"] = np.arange(n)
+    recs["n"] = 1
+    recs["inc"] = np.arange(n)
+    recs["exc"] = np.arange(n)
+    return recs
+
+
+def timed(cw, out: str, records) -> float:
+    t0 = time.perf_counter()
+    cw.write(out, FILES, DEFS, records, records, 0, 10_000_000)
+    return time.perf_counter() - t0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000000,10000000")
+    ns = parser.parse_args()
+    from pynytprof import _cwrite as cw
+
+    if getattr(cw, "__build__", "pystub") == "pystub":
+        print("_cwrite extension not built", file=sys.stderr)
+        return 1
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        have_numpy = False
+    else:
+        have_numpy = True
+    print("records    | input  | build s | write s | MB/s")
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "nytprof.out")
+        for n in (int(s) for s in ns.sizes.split(",")):
+            inputs = [("tuples", make_tuples), ("array", make_array)]
+            if have_numpy:
+                inputs.append(("numpy", make_numpy))
+            for name, make in inputs:
+                t0 = time.perf_counter()
+                records = make(n)
+                build = time.perf_counter() - t0
+                write = timed(cw, out, records)
+                mb = 2 * 28 * n / 1e6
+                print(f"{n:<10} | {name:<6} | {build:7.2f} | {write:7.3f} | {mb / write:6.0f}")
+                del records
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -40,11 +40,18 @@ extensions = [
         "pynytprof._cwrite",
         ["src/pynytprof/_writer.c"],
         optional=True,
+        libraries=["z"],
         define_macros=[
             ("PY_SSIZE_T_CLEAN", None),
             ("PYNYTPROF_BUILD_TAG", f'"{build_tag}"'),
         ],
     ),
+    Extension(
+        "pynytprof._ctoken",
+        ["src/pynytprof/_ctoken.c"],
+        optional=True,
+        define_macros=[("PY_SSIZE_T_CLEAN", None)],
+    ),
     Extension(
         "pynytprof._ctrace",
         ["src/pynytprof/_ctrace.c"],
@@ -56,8 +63,9 @@ extensions = [
     ),
 ]
 
-if sys.version_info >= (3, 12):
-    # Only skip _ctrace; keep _cwrite for binary output support
+if sys.version_info >= (3, 11):
+    # _ctrace hooks the PyFrameObject eval API, which ends with 3.10; newer
+    # interpreters use the Python tracer.  Keep _cwrite for binary output.
     extensions = [e for e in extensions if e.name != "pynytprof._ctrace"]
 
 setup(
@@ -1,6 +1,6 @@
 """Pynytprof package public API wrappers."""
-from .tracer import profile_script, profile
+from .tracer import Profiler, profile_script, profile
 from .cli import main
 
-__all__ = ["profile_script", "profile", "main"]
+__all__ = ["Profiler", "profile_script", "profile", "main"]
 
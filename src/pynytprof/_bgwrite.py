@@ -0,0 +1,215 @@
+"""Run a writer's I/O on a dedicated thread.
+
+``BackgroundWriter`` wraps any of the NYTProf writers.  Calls made by the
+profiled program are recorded into a front buffer; once it holds
+``buffer_size`` bytes of payload it is swapped for an empty back buffer and
+handed to the writer thread, which replays the calls against the wrapped
+writer.  The queue between the two is bounded: when the writer thread falls
+``depth`` buffers behind, the producer blocks until one drains and the wait
+is counted as a stall.
+"""
+
+from __future__ import annotations
+
+import copy
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Any
+
+__all__ = ["BackgroundWriter", "WriterStats"]
+
+_STOP = None
+# NEW_FID and TIME_LINE calls carry a path or a few integers; count each as
+# a nominal record size towards ``buffer_size``
+_RECORD_SIZE = 64
+
+
+class WriterStats:
+    """Counters describing how the writer thread kept up."""
+
+    __slots__ = ("buffers", "bytes", "stalls", "stall_ns", "max_depth", "io_ns")
+
+    def __init__(self) -> None:
+        self.buffers = 0
+        self.bytes = 0
+        self.stalls = 0
+        self.stall_ns = 0
+        self.max_depth = 0
+        self.io_ns = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{k}={v}" for k, v in self.as_dict().items())
+        return f"WriterStats({fields})"
+
+
+class BackgroundWriter:
+    """Forward writer calls to ``inner`` from a dedicated thread.
+
+    ``flush()`` hands the front buffer over without waiting for the data to
+    reach the file; ``drain()`` waits for it.  With ``fsync`` the writer
+    thread also syncs the file descriptor after every flush, when the wrapped
+    writer exposes one.  Once the writer thread fails, later records are
+    dropped and the error is raised by ``close()`` (or ``drain()``), never by
+    the calls the profiled program makes.
+    """
+
+    def __init__(
+        self,
+        inner,
+        buffer_size: int = 1 << 20,
+        depth: int = 2,
+        fsync: bool = False,
+    ) -> None:
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        self.inner = inner
+        self.buffer_size = max(1, buffer_size)
+        self.fsync = fsync
+        self.stats = WriterStats()
+        self._front: list[tuple[str, tuple[Any, ...]]] = []
+        self._front_bytes = 0
+        self._spare: list[list[tuple[str, tuple[Any, ...]]]] = []
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._error: BaseException | None = None
+        self._closed = False
+        # the token writer assigns file ids synchronously; emitting the
+        # NEW_FID record is ordinary I/O and goes through the queue
+        if hasattr(inner, "_register_file"):
+            self._register_file = inner._register_file
+            self._emit_new_fid = self._forward("_emit_new_fid")
+        if hasattr(inner, "write_time_line"):
+            self.write_time_line = self._forward("write_time_line")
+        if hasattr(inner, "write_time_lines"):
+            self.write_time_lines = self._write_time_lines
+        self._thread = threading.Thread(target=self._run, name="pynytprof-writer", daemon=True)
+        self._thread.start()
+
+    # producer side -------------------------------------------------------
+    def _forward(self, name: str):
+        def call(*args):
+            self._submit(name, args, _RECORD_SIZE)
+
+        call.__name__ = name
+        return call
+
+    def _submit(self, name: str, args: tuple[Any, ...], size: int = 0) -> None:
+        if self._closed:
+            raise ValueError("writer is closed")
+        if self._error is not None:
+            # the file is broken; drop records rather than raise inside the
+            # profiled program, and report the error from close()
+            return
+        self._front.append((name, args))
+        self._front_bytes += size
+        if self._front_bytes >= self.buffer_size:
+            self._handoff()
+
+    def _handoff(self) -> None:
+        if self._error is not None:
+            self._front.clear()
+            self._front_bytes = 0
+            return
+        if not self._front:
+            return
+        batch = self._front
+        self.stats.buffers += 1
+        self.stats.bytes += self._front_bytes
+        self._front = self._spare.pop() if self._spare else []
+        self._front_bytes = 0
+        try:
+            self._queue.put_nowait(batch)
+        except queue.Full:
+            t0 = time.perf_counter_ns()
+            self._queue.put(batch)
+            self.stats.stalls += 1
+            self.stats.stall_ns += time.perf_counter_ns() - t0
+        depth = self._queue.qsize()
+        if depth > self.stats.max_depth:
+            self.stats.max_depth = depth
+
+    def _write_time_lines(self, fids, lines, elapsed) -> None:
+        # the caller may refill its arrays as soon as this returns
+        cols = tuple(copy.copy(col) for col in (fids, lines, elapsed))
+        self._submit("write_time_lines", cols, len(fids) * _RECORD_SIZE // 8)
+
+    def write_chunk(self, token: bytes, payload: bytes) -> None:
+        payload = bytes(payload)
+        self._submit("write_chunk", (token, payload), len(payload))
+
+    def flush(self) -> None:
+        """Hand pending records to the writer thread and return.
+
+        Never raises for a failed writer thread; :meth:`close` does.
+        """
+        self._submit("flush", ())
+        self._handoff()
+
+    def drain(self) -> None:
+        """Wait until everything handed over so far has been written."""
+        self._handoff()
+        self._queue.join()
+        if self._error is not None:
+            raise RuntimeError("background writer failed") from self._error
+
+    # writer thread ---------------------------------------------------------
+    def _run(self) -> None:
+        inner = self.inner
+        while True:
+            batch = self._queue.get()
+            try:
+                if batch is _STOP:
+                    return
+                if self._error is None:
+                    t0 = time.perf_counter_ns()
+                    try:
+                        for name, args in batch:
+                            getattr(inner, name)(*args)
+                            if name == "flush" and self.fsync:
+                                self._sync()
+                    except BaseException as exc:  # reported to the producer
+                        self._error = exc
+                    self.stats.io_ns += time.perf_counter_ns() - t0
+                batch.clear()
+                self._spare.append(batch)
+            finally:
+                self._queue.task_done()
+
+    def _sync(self) -> None:
+        fh = getattr(self.inner, "_fh", None)
+        fileno = getattr(fh, "fileno", None)
+        if fileno is not None:
+            os.fsync(fileno())
+
+    # lifecycle ----------------------------------------------------------
+    def __enter__(self) -> "BackgroundWriter":
+        self.inner.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self._handoff()
+        finally:
+            self._queue.put(_STOP)
+            self._thread.join()
+        if os.environ.get("PYNYTPROF_DEBUG"):
+            print(f"DEBUG: background writer {self.stats!r}", file=sys.stderr)
+        if self._error is not None:
+            raise RuntimeError("background writer failed") from self._error
+        if getattr(self.inner, "finalize", None):
+            self.inner.finalize()
+        else:
+            self.inner.close()
+
+    finalize = close
@@ -0,0 +1,460 @@
+#include <Python.h>
+#include <ctype.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+/* NYTProf token encoder: tags and varints appended to one growable buffer.
+ * Mirrors token_writer.TokenEncoder byte for byte. */
+
+#define NYTP_TAG_NEW_FID '@'
+#define NYTP_TAG_TIME_LINE '+'
+#define NYTP_TAG_STRING '\''
+#define NYTP_TAG_STRING_UTF8 '"'
+#define MAX_U32 5 /* bytes in the longest varint */
+
+typedef struct {
+    PyObject_HEAD
+    unsigned char *buf;
+    size_t len;
+    size_t cap;
+} Encoder;
+
+static int reserve(Encoder *e, size_t extra) {
+    if (e->len + extra <= e->cap)
+        return 0;
+    size_t cap = e->cap ? e->cap : 4096;
+    while (cap < e->len + extra)
+        cap *= 2;
+    unsigned char *buf = realloc(e->buf, cap);
+    if (!buf) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    e->buf = buf;
+    e->cap = cap;
+    return 0;
+}
+
+/* same layout as output_tag_u32 in NYTProf's FileHandle.xs */
+static inline unsigned char *put_u32(unsigned char *p, uint32_t i) {
+    if (i < 0x80) {
+        *p++ = (unsigned char)i;
+    } else if (i < 0x4000) {
+        *p++ = (unsigned char)((i >> 8) | 0x80);
+        *p++ = (unsigned char)i;
+    } else if (i < 0x200000) {
+        *p++ = (unsigned char)((i >> 16) | 0xC0);
+        *p++ = (unsigned char)(i >> 8);
+        *p++ = (unsigned char)i;
+    } else if (i < 0x10000000) {
+        *p++ = (unsigned char)((i >> 24) | 0xE0);
+        *p++ = (unsigned char)(i >> 16);
+        *p++ = (unsigned char)(i >> 8);
+        *p++ = (unsigned char)i;
+    } else {
+        *p++ = 0xFF;
+        *p++ = (unsigned char)(i >> 24);
+        *p++ = (unsigned char)(i >> 16);
+        *p++ = (unsigned char)(i >> 8);
+        *p++ = (unsigned char)i;
+    }
+    return p;
+}
+
+static inline unsigned char *put_time_line(unsigned char *p, uint32_t elapsed,
+                                           uint32_t fid, uint32_t line) {
+    *p++ = NYTP_TAG_TIME_LINE;
+    p = put_u32(p, elapsed);
+    p = put_u32(p, fid);
+    return put_u32(p, line);
+}
+
+/* "O&" converter for an int in [0, 2**32) */
+static int u32_conv(PyObject *obj, void *out) {
+    unsigned long long v = PyLong_AsUnsignedLongLong(obj);
+    if (v == (unsigned long long)-1 && PyErr_Occurred())
+        return 0;
+    if (v > 0xFFFFFFFFULL) {
+        PyErr_SetString(PyExc_OverflowError, "value does not fit in 32 bits");
+        return 0;
+    }
+    *(uint32_t *)out = (uint32_t)v;
+    return 1;
+}
+
+/* "O&" converter for a signed time: two's complement, low 32 bits */
+static int i32_conv(PyObject *obj, void *out) {
+    unsigned long long v = PyLong_AsUnsignedLongLongMask(obj);
+    if (v == (unsigned long long)-1 && PyErr_Occurred())
+        return 0;
+    *(uint32_t *)out = (uint32_t)v;
+    return 1;
+}
+
+/* tagged string; str is written as UTF-8 with the UTF-8 tag */
+static int put_string(Encoder *e, PyObject *obj, int utf8) {
+    Py_buffer view;
+    const char *data;
+    Py_ssize_t n;
+    int have_view = 0;
+    if (PyUnicode_Check(obj)) {
+        data = PyUnicode_AsUTF8AndSize(obj, &n);
+        if (!data)
+            return -1;
+        utf8 = 1;
+    } else {
+        if (PyObject_GetBuffer(obj, &view, PyBUF_SIMPLE) < 0)
+            return -1;
+        have_view = 1;
+        data = view.buf;
+        n = view.len;
+    }
+    int rc = -1;
+    if ((uint64_t)n > 0xFFFFFFFFULL) {
+        PyErr_SetString(PyExc_OverflowError, "string too long");
+    } else if (reserve(e, 1 + MAX_U32 + (size_t)n) == 0) {
+        unsigned char *p = e->buf + e->len;
+        *p++ = utf8 ? NYTP_TAG_STRING_UTF8 : NYTP_TAG_STRING;
+        p = put_u32(p, (uint32_t)n);
+        memcpy(p, data, (size_t)n);
+        e->len = (size_t)(p - e->buf) + (size_t)n;
+        rc = 0;
+    }
+    if (have_view)
+        PyBuffer_Release(&view);
+    return rc;
+}
+
+static PyObject *Encoder_new_fid(Encoder *e, PyObject *args) {
+    uint32_t v[6];
+    PyObject *path;
+    if (!PyArg_ParseTuple(args, "O&O&O&O&O&O&O", u32_conv, &v[0], u32_conv, &v[1],
+                          u32_conv, &v[2], u32_conv, &v[3], u32_conv, &v[4], u32_conv,
+                          &v[5], &path))
+        return NULL;
+    if (reserve(e, 1 + 6 * MAX_U32) < 0)
+        return NULL;
+    unsigned char *p = e->buf + e->len;
+    *p++ = NYTP_TAG_NEW_FID;
+    for (int i = 0; i < 6; i++)
+        p = put_u32(p, v[i]);
+    size_t before = e->len;
+    e->len = (size_t)(p - e->buf);
+    if (put_string(e, path, 0) < 0) {
+        e->len = before;
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *Encoder_time_line(Encoder *e, PyObject *args) {
+    uint32_t fid, line, elapsed, overflow = 0;
+    if (!PyArg_ParseTuple(args, "O&O&O&|O&", u32_conv, &fid, u32_conv, &line, i32_conv,
+                          &elapsed, u32_conv, &overflow))
+        return NULL;
+    (void)overflow; /* NYTProf discards it too */
+    if (reserve(e, 1 + 3 * MAX_U32) < 0)
+        return NULL;
+    e->len = (size_t)(put_time_line(e->buf + e->len, elapsed, fid, line) - e->buf);
+    Py_RETURN_NONE;
+}
+
+/* One column of time_lines: an integer buffer, or any sequence of ints. */
+typedef struct {
+    Py_buffer view;
+    PyObject *seq;
+    Py_ssize_t n;
+    int itemsize;
+    int is_signed;
+} Column;
+
+static int column_open(Column *c, PyObject *obj, const char *what) {
+    memset(c, 0, sizeof(*c));
+    if (PyObject_CheckBuffer(obj)) {
+        if (PyObject_GetBuffer(obj, &c->view, PyBUF_FORMAT | PyBUF_C_CONTIGUOUS) < 0)
+            return -1;
+        const char *fmt = c->view.format ? c->view.format : "B";
+        if (*fmt == '<' || *fmt == '=' || *fmt == '@')
+            fmt++;
+        int ok = fmt[0] && !fmt[1] && strchr("bBhHiIlLqQ", fmt[0]) &&
+                 (c->view.itemsize == 1 || c->view.itemsize == 2 ||
+                  c->view.itemsize == 4 || c->view.itemsize == 8);
+        if (!ok) {
+            PyErr_Format(PyExc_TypeError, "%s must hold integers, not format %s", what,
+                         c->view.format ? c->view.format : "B");
+            PyBuffer_Release(&c->view);
+            return -1;
+        }
+        c->itemsize = (int)c->view.itemsize;
+        c->is_signed = islower((unsigned char)fmt[0]);
+        c->n = c->view.len / c->view.itemsize;
+        return 0;
+    }
+    c->seq = PySequence_Fast(obj, what);
+    if (!c->seq)
+        return -1;
+    c->n = PySequence_Fast_GET_SIZE(c->seq);
+    return 0;
+}
+
+static void column_close(Column *c) {
+    if (c->seq)
+        Py_DECREF(c->seq);
+    else if (c->itemsize)
+        PyBuffer_Release(&c->view);
+}
+
+/* element i widened to 64 bits; sign-extended for signed formats */
+static int column_get(Column *c, Py_ssize_t i, uint64_t *out) {
+    if (c->seq) {
+        PyObject *item = PySequence_Fast_GET_ITEM(c->seq, i);
+        int overflow;
+        long long v = PyLong_AsLongLongAndOverflow(item, &overflow);
+        if (v == -1 && PyErr_Occurred())
+            return -1;
+        if (overflow) {
+            unsigned long long u = PyLong_AsUnsignedLongLong(item);
+            if (u == (unsigned long long)-1 && PyErr_Occurred())
+                return -1;
+            *out = u;
+        } else {
+            *out = (uint64_t)v;
+        }
+        return 0;
+    }
+    const char *p = (const char *)c->view.buf + (size_t)i * (size_t)c->itemsize;
+    switch (c->itemsize) {
+    case 1:
+        *out = c->is_signed ? (uint64_t)(int64_t)*(const int8_t *)p : *(const uint8_t *)p;
+        break;
+    case 2:
+        *out = c->is_signed ? (uint64_t)(int64_t)*(const int16_t *)p : *(const uint16_t *)p;
+        break;
+    case 4:
+        *out = c->is_signed ? (uint64_t)(int64_t)*(const int32_t *)p : *(const uint32_t *)p;
+        break;
+    default:
+        *out = *(const uint64_t *)p;
+    }
+    return 0;
+}
+
+static PyObject *Encoder_time_lines(Encoder *e, PyObject *args) {
+    PyObject *fids_obj, *lines_obj, *elapsed_obj;
+    if (!PyArg_ParseTuple(args, "OOO", &fids_obj, &lines_obj, &elapsed_obj))
+        return NULL;
+    Column fids, lines, elapsed;
+    if (column_open(&fids, fids_obj, "fids") < 0)
+        return NULL;
+    if (column_open(&lines, lines_obj, "lines") < 0) {
+        column_close(&fids);
+        return NULL;
+    }
+    if (column_open(&elapsed, elapsed_obj, "elapsed") < 0) {
+        column_close(&fids);
+        column_close(&lines);
+        return NULL;
+    }
+    PyObject *ret = NULL;
+    Py_ssize_t n = fids.n;
+    if (lines.n != n || elapsed.n != n) {
+        PyErr_SetString(PyExc_ValueError, "fids, lines and elapsed differ in length");
+        goto done;
+    }
+    if (reserve(e, (size_t)n * (1 + 3 * MAX_U32)) < 0)
+        goto done;
+    unsigned char *p = e->buf + e->len;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        uint64_t fid, line, dt;
+        if (column_get(&fids, i, &fid) < 0 || column_get(&lines, i, &line) < 0 ||
+            column_get(&elapsed, i, &dt) < 0)
+            goto done;
+        if (fid > 0xFFFFFFFFULL || line > 0xFFFFFFFFULL) {
+            PyErr_Format(PyExc_OverflowError, "record %zd: fid or line exceeds 32 bits", i);
+            goto done;
+        }
+        p = put_time_line(p, (uint32_t)dt, (uint32_t)fid, (uint32_t)line);
+    }
+    /* only commit once every record encoded */
+    e->len = (size_t)(p - e->buf);
+    ret = Py_None;
+    Py_INCREF(ret);
+done:
+    column_close(&fids);
+    column_close(&lines);
+    column_close(&elapsed);
+    return ret;
+}
+
+static PyObject *Encoder_string(Encoder *e, PyObject *args, PyObject *kwds) {
+    static char *kwlist[] = {"data", "utf8", NULL};
+    PyObject *data;
+    int utf8 = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|p", kwlist, &data, &utf8))
+        return NULL;
+    if (put_string(e, data, utf8) < 0)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+static PyObject *Encoder_raw(Encoder *e, PyObject *arg) {
+    Py_buffer view;
+    if (PyObject_GetBuffer(arg, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+    if (reserve(e, (size_t)view.len) < 0) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+    memcpy(e->buf + e->len, view.buf, (size_t)view.len);
+    e->len += (size_t)view.len;
+    PyBuffer_Release(&view);
+    Py_RETURN_NONE;
+}
+
+static PyObject *Encoder_take(Encoder *e, PyObject *Py_UNUSED(args)) {
+    PyObject *out = PyBytes_FromStringAndSize((const char *)e->buf, (Py_ssize_t)e->len);
+    if (out)
+        e->len = 0;
+    return out;
+}
+
+static PyObject *Encoder_clear(Encoder *e, PyObject *Py_UNUSED(args)) {
+    e->len = 0;
+    Py_RETURN_NONE;
+}
+
+static Py_ssize_t Encoder_len(Encoder *e) {
+    return (Py_ssize_t)e->len;
+}
+
+static void Encoder_dealloc(Encoder *e) {
+    free(e->buf);
+    Py_TYPE(e)->tp_free((PyObject *)e);
+}
+
+static PyMethodDef Encoder_methods[] = {
+    {"new_fid", (PyCFunction)Encoder_new_fid, METH_VARARGS,
+     PyDoc_STR("new_fid(fid, eval_fid, eval_line, flags, size, mtime, path) -> None")},
+    {"time_line", (PyCFunction)Encoder_time_line, METH_VARARGS,
+     PyDoc_STR("time_line(fid, line, elapsed, overflow=0) -> None")},
+    {"time_lines", (PyCFunction)Encoder_time_lines, METH_VARARGS,
+     PyDoc_STR("time_lines(fids, lines, elapsed) -> None\n\n"
+               "Encode one TIME_LINE token per index of three parallel integer\n"
+               "arrays (any buffer of integers, or sequences).")},
+    {"string", (PyCFunction)(void (*)(void))Encoder_string, METH_VARARGS | METH_KEYWORDS,
+     PyDoc_STR("string(data, utf8=False) -> None")},
+    {"raw", (PyCFunction)Encoder_raw, METH_O, PyDoc_STR("raw(data) -> None")},
+    {"take", (PyCFunction)Encoder_take, METH_NOARGS,
+     PyDoc_STR("take() -> bytes: return the encoded tokens and empty the buffer")},
+    {"clear", (PyCFunction)Encoder_clear, METH_NOARGS, PyDoc_STR("clear() -> None")},
+    {NULL, NULL, 0, NULL}};
+
+static PySequenceMethods Encoder_as_sequence = {
+    .sq_length = (lenfunc)Encoder_len,
+};
+
+static PyTypeObject EncoderType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    .tp_name = "_ctoken.Encoder",
+    .tp_basicsize = sizeof(Encoder),
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_dealloc = (destructor)Encoder_dealloc,
+    .tp_methods = Encoder_methods,
+    .tp_as_sequence = &Encoder_as_sequence,
+};
+
+/* encode_u32_many(values) -> bytes: the varints of values back to back */
+static PyObject *encode_u32_many(PyObject *mod, PyObject *arg) {
+    Column vals;
+    if (column_open(&vals, arg, "values") < 0)
+        return NULL;
+    PyObject *out = PyBytes_FromStringAndSize(NULL, vals.n * MAX_U32);
+    if (!out) {
+        column_close(&vals);
+        return NULL;
+    }
+    unsigned char *start = (unsigned char *)PyBytes_AS_STRING(out);
+    unsigned char *p = start;
+    for (Py_ssize_t i = 0; i < vals.n; i++) {
+        uint64_t v;
+        if (column_get(&vals, i, &v) < 0)
+            goto fail;
+        if (v > 0xFFFFFFFFULL) {
+            PyErr_Format(PyExc_OverflowError, "value %zd does not fit in 32 bits", i);
+            goto fail;
+        }
+        p = put_u32(p, (uint32_t)v);
+    }
+    column_close(&vals);
+    if (_PyBytes_Resize(&out, p - start) < 0)
+        return NULL;
+    return out;
+fail:
+    column_close(&vals);
+    Py_DECREF(out);
+    return NULL;
+}
+
+/* decode_u32_many(buffer) -> array('I'); the inverse of encode_u32_many */
+static PyObject *decode_u32_many(PyObject *mod, PyObject *arg) {
+    static const unsigned char first_mask[5] = {0x7F, 0x7F, 0x1F, 0x0F, 0x00};
+    Py_buffer view;
+    if (PyObject_GetBuffer(arg, &view, PyBUF_SIMPLE) < 0)
+        return NULL;
+    const unsigned char *p = view.buf;
+    const unsigned char *end = p + view.len;
+    /* every varint takes at least one byte */
+    uint32_t *vals = PyMem_Malloc(view.len ? (size_t)view.len * sizeof(uint32_t) : 1);
+    PyObject *ret = NULL;
+    if (!vals) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    Py_ssize_t n = 0;
+    while (p < end) {
+        unsigned char d = *p++;
+        int extra = d < 0x80 ? 0 : d < 0xC0 ? 1 : d < 0xE0 ? 2 : d < 0xFF ? 3 : 4;
+        if (end - p < extra) {
+            PyErr_Format(PyExc_ValueError, "truncated varint at offset %zd",
+                         (Py_ssize_t)(p - 1 - (const unsigned char *)view.buf));
+            goto done;
+        }
+        uint32_t v = d & first_mask[extra];
+        while (extra--)
+            v = (v << 8) | *p++;
+        vals[n++] = v;
+    }
+    PyObject *array_mod = PyImport_ImportModule("array");
+    if (!array_mod)
+        goto done;
+    ret = PyObject_CallMethod(array_mod, "array", "sy#", "I", (const char *)vals,
+                              n * (Py_ssize_t)sizeof(uint32_t));
+    Py_DECREF(array_mod);
+done:
+    PyMem_Free(vals);
+    PyBuffer_Release(&view);
+    return ret;
+}
+
+static PyMethodDef Methods[] = {
+    {"encode_u32_many", encode_u32_many, METH_O,
+     PyDoc_STR("encode_u32_many(values) -> bytes")},
+    {"decode_u32_many", decode_u32_many, METH_O,
+     PyDoc_STR("decode_u32_many(buffer) -> array('I')")},
+    {NULL, NULL, 0, NULL}};
+
+static struct PyModuleDef moddef = {PyModuleDef_HEAD_INIT, "_ctoken", NULL, -1, Methods,
+                                    NULL, NULL, NULL, NULL};
+
+PyMODINIT_FUNC PyInit__ctoken(void) {
+    PyObject *mod = PyModule_Create(&moddef);
+    if (!mod)
+        return NULL;
+    if (PyType_Ready(&EncoderType) < 0)
+        return NULL;
+    Py_INCREF(&EncoderType);
+    PyModule_AddObject(mod, "Encoder", (PyObject *)&EncoderType);
+    return mod;
+}
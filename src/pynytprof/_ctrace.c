@@ -1,10 +1,12 @@
 #include <Python.h>
+#include <frameobject.h>
 #include <stdint.h>
 #include <stdlib.h>
 #include <string.h>
 #include <sys/stat.h>
 #include <stdatomic.h>
 #include <limits.h>
+#include <math.h>
 #ifndef _WIN32
 #include <fnmatch.h>
 #include <unistd.h>
@@ -13,21 +15,63 @@
 #include <Shlwapi.h>
 #endif
 
-/* ring slot record */
+/* the eval-frame hook receives PyFrameObject only up to 3.10; 3.11 moved
+ * frames into _PyInterpreterFrame and 3.12+ traces through sys.monitoring */
+#if PY_VERSION_HEX < 0x03090000 || PY_VERSION_HEX >= 0x030B0000
+#error "_ctrace supports CPython 3.9 and 3.10"
+#endif
+
+#if PY_VERSION_HEX >= 0x030A0000
+#define TS_USE_TRACING(ts) ((ts)->cframe->use_tracing)
+#else
+#define TS_USE_TRACING(ts) ((ts)->use_tracing)
+#endif
+
+/* monotonic nanoseconds, the clock behind time.perf_counter_ns() */
+static inline uint64_t perf_ns(void) {
+    return (uint64_t)_PyTime_GetPerfCounter();
+}
+
+/* aggregation slot record: a statement line when sub_id is 0, otherwise a
+ * call edge from (path, line) into sub_id */
 typedef struct {
     PyObject *path;
     uint32_t line;
+    uint32_t sub_id;
     uint32_t calls;
     uint64_t inc_ns;
     uint64_t exc_ns;
 } Rec;
 
-#define RING_SIZE (64 * 1024)
+#define LINE_TABLE_INIT 1024
 #define TICKS_PER_SEC 10000000ULL
 
-static Rec *ring = NULL;
-static _Atomic int ring_lock = 0;
-static uint64_t last_ns = 0;
+#ifdef _MSC_VER
+#define THREAD_LOCAL __declspec(thread)
+#else
+#define THREAD_LOCAL _Thread_local
+#endif
+
+/* open-addressing table of line and call-edge records owned by one thread */
+typedef struct LineTable {
+    Rec *slots;
+    size_t cap;  /* power of two */
+    size_t used; /* occupied slots; grown past 3/4 of cap */
+    struct LineTable *next;
+} LineTable;
+
+/* every thread's table, pushed lock-free on first use and merged by dump */
+static LineTable *_Atomic tables = NULL;
+static _Atomic uint64_t generation = 0;
+static _Atomic int active = 0;
+/* samples or calls lost to allocation failure or saturated hit counts */
+static _Atomic uint64_t dropped = 0;
+static THREAD_LOCAL LineTable *tls_table = NULL;
+static THREAD_LOCAL uint64_t tls_generation = 0;
+/* per-thread clock: line deltas never span events from another thread */
+static THREAD_LOCAL uint64_t last_ns = 0;
+/* enable() generation last_ns belongs to; a new run starts a fresh clock */
+static THREAD_LOCAL uint64_t tls_clock_generation = 0;
 static char *script_path = NULL;
 static uint64_t start_ns = 0;
 static _PyFrameEvalFunction prev_eval = NULL;
@@ -35,9 +79,15 @@ static char **filters = NULL;
 static size_t filter_count = 0;
 static PyObject *code_to_id = NULL;
 static PyObject *defs_list = NULL;
-static PyObject *calls_list = NULL;
+/* NYTPROF_SAMPLE_STRIDE: time one line event in every sample_stride, or with
+ * probability 1 / sample_stride when sample_log_q is set; 1 times them all */
+static uint32_t sample_stride = 1;
+static double sample_log_q = 0.0;
+/* line events this thread still skips before the next timed one */
+static THREAD_LOCAL uint32_t tls_skip = 0;
+static THREAD_LOCAL uint64_t tls_rng = 0;
 
-#define MAX_STACK 1024
+#define STACK_INIT 64
 typedef struct {
     PyObject *path;
     uint32_t line;
@@ -45,9 +95,15 @@ typedef struct {
     uint64_t start_ns;
     uint64_t child_ns;
 } StackItem;
-static StackItem stack[MAX_STACK];
-static int stack_top = 0;
+/* per-thread shadow stack so interleaved threads keep their own call times;
+ * it lives in stack_inline until recursion outgrows it, then on the heap */
+static THREAD_LOCAL StackItem stack_inline[STACK_INIT];
+static THREAD_LOCAL StackItem *stack = NULL;
+static THREAD_LOCAL size_t stack_cap = 0;
+static THREAD_LOCAL size_t stack_top = 0;
 static uint32_t next_sub_id = 1;
+/* co_extra slot holding per-code filter verdicts, or -1 if unavailable */
+static Py_ssize_t code_extra_index = -1;
 
 static void free_filters(void) {
     if (!filters)
@@ -98,38 +154,151 @@ static int load_filters(void) {
     return 0;
 }
 
-/* spinlock helpers */
-static inline void lock(void) {
-    while (atomic_exchange_explicit(&ring_lock, 1, memory_order_acquire)) {
+static void load_sampling(void) {
+    const char *env = getenv("NYTPROF_SAMPLE_STRIDE");
+    char *end = NULL;
+    unsigned long n = env && *env ? strtoul(env, &end, 10) : 1;
+    sample_stride = (end && *end) || n < 2 || n > UINT32_MAX ? 1 : (uint32_t)n;
+    const char *rnd = getenv("NYTPROF_SAMPLE_RANDOM");
+    sample_log_q = sample_stride > 1 && rnd && strcmp(rnd, "1") == 0
+                       ? log1p(-1.0 / (double)sample_stride)
+                       : 0.0;
+}
+
+/* line events to skip before the next timed one */
+static uint32_t next_skip(void) {
+    if (sample_log_q == 0.0)
+        return sample_stride - 1;
+    /* geometric gap with mean sample_stride, from a per-thread xorshift64* */
+    uint64_t x = tls_rng;
+    if (!x)
+        x = perf_ns() ^ (uint64_t)(uintptr_t)&tls_rng ^ 0x9E3779B97F4A7C15ULL;
+    x ^= x >> 12;
+    x ^= x << 25;
+    x ^= x >> 27;
+    tls_rng = x;
+    double u = (double)(((x * 0x2545F4914F6CDD1DULL) >> 11) + 1) * 0x1.0p-53;
+    double gap = floor(log(u) / sample_log_q);
+    return gap >= (double)UINT32_MAX ? UINT32_MAX : (uint32_t)gap;
+}
+
+static LineTable *table_new(size_t cap) {
+    LineTable *t = PyMem_RawCalloc(1, sizeof(LineTable));
+    if (!t)
+        return NULL;
+    t->slots = PyMem_RawCalloc(cap, sizeof(Rec));
+    if (!t->slots) {
+        PyMem_RawFree(t);
+        return NULL;
     }
+    t->cap = cap;
+    return t;
 }
 
-static inline void unlock(void) {
-    atomic_store_explicit(&ring_lock, 0, memory_order_release);
+/* drop the path references still held by a table and release it */
+static void table_free(LineTable *t) {
+    for (size_t i = 0; i < t->cap; i++)
+        Py_XDECREF(t->slots[i].path);
+    PyMem_RawFree(t->slots);
+    PyMem_RawFree(t);
 }
 
-/* add line timing to ring */
-static void record_line(PyObject *path, int line, uint64_t dt) {
-    size_t idx = ((size_t)line ^ (size_t)path) & (RING_SIZE - 1);
-    for (size_t i = 0; i < RING_SIZE; i++) {
-        Rec *r = &ring[idx];
+static size_t rec_hash(PyObject *path, uint32_t line, uint32_t sub_id) {
+    return (size_t)path ^ (size_t)line ^ ((size_t)sub_id * 0x9E3779B1u);
+}
+
+/* double the table and rehash; slots keep their path references */
+static int table_grow(LineTable *t) {
+    size_t ncap = t->cap * 2;
+    Rec *nslots = PyMem_RawCalloc(ncap, sizeof(Rec));
+    if (!nslots)
+        return -1;
+    size_t mask = ncap - 1;
+    for (size_t i = 0; i < t->cap; i++) {
+        Rec *r = &t->slots[i];
+        if (!r->path)
+            continue;
+        size_t idx = rec_hash(r->path, r->line, r->sub_id) & mask;
+        while (nslots[idx].path)
+            idx = (idx + 1) & mask;
+        nslots[idx] = *r;
+    }
+    PyMem_RawFree(t->slots);
+    t->slots = nslots;
+    t->cap = ncap;
+    return 0;
+}
+
+/* add counts for (path, line, sub_id); the table takes its own path reference */
+static void table_add(LineTable *t, PyObject *path, uint32_t line, uint32_t sub_id,
+                      uint32_t calls, uint64_t inc_ns, uint64_t exc_ns) {
+    /* a failed grow keeps probing the current table until it is full */
+    if ((t->used + 1) * 4 > t->cap * 3)
+        (void)table_grow(t);
+    size_t mask = t->cap - 1;
+    size_t idx = rec_hash(path, line, sub_id) & mask;
+    for (size_t i = 0; i < t->cap; i++) {
+        Rec *r = &t->slots[idx];
         if (r->path == NULL) {
             r->path = path;
             Py_INCREF(path);
-            r->line = (uint32_t)line;
-            r->calls = 1;
-            r->inc_ns += dt;
-            r->exc_ns += dt;
+            r->line = line;
+            r->sub_id = sub_id;
+            r->calls = calls;
+            r->inc_ns = inc_ns;
+            r->exc_ns = exc_ns;
+            t->used++;
             return;
         }
-        if (r->line == (uint32_t)line && r->path == path) {
-            r->calls += 1;
-            r->inc_ns += dt;
-            r->exc_ns += dt;
+        if (r->line == line && r->path == path && r->sub_id == sub_id) {
+            if (r->calls > UINT32_MAX - calls) {
+                r->calls = UINT32_MAX;
+                atomic_fetch_add_explicit(&dropped, 1, memory_order_relaxed);
+            } else {
+                r->calls += calls;
+            }
+            r->inc_ns += inc_ns;
+            r->exc_ns += exc_ns;
             return;
         }
-        idx = (idx + 1) & (RING_SIZE - 1);
+        idx = (idx + 1) & mask;
     }
+    atomic_fetch_add_explicit(&dropped, 1, memory_order_relaxed);
+}
+
+/* this thread's table for the current enable() generation */
+static LineTable *thread_table(void) {
+    uint64_t gen = atomic_load_explicit(&generation, memory_order_acquire);
+    if (tls_table && tls_generation == gen)
+        return tls_table;
+    LineTable *t = table_new(LINE_TABLE_INIT);
+    if (!t) {
+        atomic_fetch_add_explicit(&dropped, 1, memory_order_relaxed);
+        return NULL;
+    }
+    LineTable *head = atomic_load_explicit(&tables, memory_order_relaxed);
+    do {
+        t->next = head;
+    } while (!atomic_compare_exchange_weak_explicit(&tables, &head, t, memory_order_release,
+                                                    memory_order_relaxed));
+    tls_table = t;
+    tls_generation = gen;
+    return t;
+}
+
+/* add line timing to the calling thread's table; no shared writes */
+static void record_line(PyObject *path, int line, uint64_t dt) {
+    LineTable *t = thread_table();
+    if (t)
+        table_add(t, path, (uint32_t)line, 0, 1, dt, dt);
+}
+
+/* add one finished call to the calling thread's call-edge records */
+static void record_call(PyObject *path, uint32_t line, uint32_t sub_id, uint64_t inc,
+                        uint64_t exc) {
+    LineTable *t = thread_table();
+    if (t)
+        table_add(t, path ? path : Py_None, line, sub_id, 1, inc, exc);
 }
 
 /* map code objects to sub IDs and record definitions */
@@ -162,154 +331,482 @@ static uint32_t get_sub_id(PyCodeObject *code) {
     return sub_id;
 }
 
-/* trace callback */
-static int tracefunc(PyObject *obj, PyFrameObject *f, int what, PyObject *arg) {
-    if (what != PyTrace_LINE)
+/* whether a filename matches NYTPROF_FILTER; costs a realpath() */
+static int path_matches_filters(PyObject *filename) {
+    PyObject *fsobj = PyOS_FSPath(filename);
+    if (!fsobj) {
+        PyErr_Clear();
         return 0;
-    if (filter_count) {
-        PyObject *fsobj = PyOS_FSPath(f->f_code->co_filename);
-        if (!fsobj) {
-            PyErr_Clear();
-            return 0;
-        }
-        const char *raw = PyUnicode_AsUTF8(fsobj);
-        if (!raw) {
-            PyErr_Clear();
-            Py_DECREF(fsobj);
-            return 0;
-        }
+    }
+    const char *raw = PyUnicode_AsUTF8(fsobj);
+    if (!raw) {
+        PyErr_Clear();
+        Py_DECREF(fsobj);
+        return 0;
+    }
 #ifdef _WIN32
-        char tmp[MAX_PATH];
-        const char *full = _fullpath(tmp, raw, MAX_PATH) ? tmp : raw;
+    char tmp[MAX_PATH];
+    const char *full = _fullpath(tmp, raw, MAX_PATH) ? tmp : raw;
 #else
-        char tmp[PATH_MAX];
-        const char *full = realpath(raw, tmp) ? tmp : raw;
+    char tmp[PATH_MAX];
+    const char *full = realpath(raw, tmp) ? tmp : raw;
 #endif
-        int matched = 0;
-        for (size_t i = 0; i < filter_count; i++) {
+    int matched = 0;
+    for (size_t i = 0; i < filter_count; i++) {
 #ifdef _WIN32
-            if (PathMatchSpecA(full, filters[i])) {
-                matched = 1;
-                break;
-            }
+        if (PathMatchSpecA(full, filters[i])) {
+            matched = 1;
+            break;
+        }
 #else
-            if (fnmatch(filters[i], full, 0) == 0) {
-                matched = 1;
-                break;
-            }
-#endif
+        if (fnmatch(filters[i], full, 0) == 0) {
+            matched = 1;
+            break;
         }
-        Py_DECREF(fsobj);
-        if (!matched)
+#endif
+    }
+    Py_DECREF(fsobj);
+    return matched;
+}
+
+/* filter verdict for a code object, computed once per enable() generation and
+ * kept in co_extra as (generation << 1 | traced); 0 means not yet computed */
+static int code_traced(PyCodeObject *code) {
+    if (!filter_count)
+        return 1;
+    uintptr_t gen = (uintptr_t)atomic_load_explicit(&generation, memory_order_relaxed);
+    void *extra = NULL;
+    if (code_extra_index >= 0) {
+        if (_PyCode_GetExtra((PyObject *)code, code_extra_index, &extra) < 0)
+            PyErr_Clear();
+        else if (extra && ((uintptr_t)extra >> 1) == gen)
+            return (int)((uintptr_t)extra & 1);
+    }
+    int traced = path_matches_filters(code->co_filename);
+    if (code_extra_index >= 0 &&
+        _PyCode_SetExtra((PyObject *)code, code_extra_index, (void *)((gen << 1) | (uintptr_t)traced)) < 0)
+        PyErr_Clear();
+    return traced;
+}
+
+/* trace callback; only installed for frames whose code passes the filter */
+static int tracefunc(PyObject *obj, PyFrameObject *f, int what, PyObject *arg) {
+    if (what != PyTrace_LINE || !atomic_load_explicit(&active, memory_order_relaxed))
+        return 0;
+    uint64_t gen = atomic_load_explicit(&generation, memory_order_relaxed);
+    if (tls_clock_generation != gen) {
+        /* first event since enable(): charge nothing from an earlier run */
+        tls_clock_generation = gen;
+        last_ns = 0;
+        tls_skip = 0;
+    }
+    if (sample_stride > 1) {
+        if (tls_skip) {
+            /* the event before a timed one starts its clock */
+            if (--tls_skip == 0)
+                last_ns = perf_ns();
             return 0;
+        }
+        tls_skip = next_skip();
     }
     int line = PyFrame_GetLineNumber(f);
-    uint64_t now = PyTime_GetPerfCounter();
+    uint64_t now = perf_ns();
     uint64_t dt = last_ns ? now - last_ns : 0;
     last_ns = now;
-    lock();
     record_line(f->f_code->co_filename, line, dt);
-    unlock();
     return 0;
 }
 
+#if PY_VERSION_HEX < 0x030A0000
+/* 3.9's eval loop looks at c_tracefunc only while the interpreter's
+ * tracing_possible count is non-zero, and only PyEval_SetTrace moves it, by
+ * (new func != NULL) - (current func != NULL).  Hold one count while enabled
+ * and leave the calling thread's own trace function as it was. */
+static int tracing_held;
+
+static void hold_tracing(int hold) {
+    if (hold == tracing_held)
+        return;
+    PyThreadState *ts = PyThreadState_Get();
+    Py_tracefunc func = ts->c_tracefunc;
+    PyObject *obj = ts->c_traceobj; /* the thread keeps its reference */
+    ts->c_tracefunc = hold ? NULL : tracefunc;
+    ts->c_traceobj = NULL;
+    PyEval_SetTrace(hold ? tracefunc : NULL, NULL);
+    ts->c_tracefunc = func;
+    ts->c_traceobj = obj;
+    ts->use_tracing = func != NULL || ts->c_profilefunc != NULL;
+    tracing_held = hold;
+}
+#else
+/* 3.10 checks cframe->use_tracing, which tracer_eval sets per frame */
+static void hold_tracing(int hold) { (void)hold; }
+#endif
+
+static int stack_push(PyObject *path, uint32_t line, uint32_t sub_id, uint64_t start) {
+    if (!stack) {
+        stack = stack_inline;
+        stack_cap = STACK_INIT;
+    }
+    if (stack_top == stack_cap) {
+        size_t ncap = stack_cap * 2;
+        StackItem *grown;
+        if (stack == stack_inline) {
+            grown = PyMem_RawMalloc(ncap * sizeof(StackItem));
+            if (grown)
+                memcpy(grown, stack_inline, sizeof(stack_inline));
+        } else {
+            grown = PyMem_RawRealloc(stack, ncap * sizeof(StackItem));
+        }
+        if (!grown)
+            return -1;
+        stack = grown;
+        stack_cap = ncap;
+    }
+    StackItem *it = &stack[stack_top++];
+    it->path = path;
+    it->line = line;
+    it->sub_id = sub_id;
+    it->start_ns = start;
+    it->child_ns = 0;
+    return 0;
+}
+
+/* hand a grown stack back once the thread has unwound to the top */
+static void stack_release(void) {
+    if (stack_top == 0 && stack && stack != stack_inline) {
+        PyMem_RawFree(stack);
+        stack = stack_inline;
+        stack_cap = STACK_INIT;
+    }
+}
+
 /* eval frame wrapper */
 static PyObject *tracer_eval(PyThreadState *ts, PyFrameObject *f, int throwflag) {
     Py_tracefunc oldfunc = ts->c_tracefunc;
     PyObject *oldobj = ts->c_traceobj;
-    int olduse = ts->use_tracing;
+    int olduse = TS_USE_TRACING(ts);
+    PyObject *res;
+    if (!code_traced((PyCodeObject *)f->f_code)) {
+        /* filtered out: no line events, no stack entry, no call record */
+        ts->c_tracefunc = NULL;
+        ts->c_traceobj = NULL;
+        TS_USE_TRACING(ts) = 0;
+        res = prev_eval(ts, f, throwflag);
+        ts->c_tracefunc = oldfunc;
+        ts->c_traceobj = oldobj;
+        TS_USE_TRACING(ts) = olduse;
+        return res;
+    }
     ts->c_tracefunc = tracefunc;
     ts->c_traceobj = NULL;
-    ts->use_tracing = 1;
+    TS_USE_TRACING(ts) = 1;
 
     PyObject *call_path = NULL;
     uint32_t call_line = 0;
     if (f->f_back) {
+        /* borrowed: the calling frame keeps its code object alive */
         call_path = f->f_back->f_code->co_filename;
-        Py_INCREF(call_path);
         call_line = (uint32_t)PyFrame_GetLineNumber(f->f_back);
     }
 
     uint32_t sub_id = get_sub_id((PyCodeObject *)f->f_code);
-    uint64_t start = PyTime_GetPerfCounter();
-    if (stack_top < MAX_STACK) {
-        stack[stack_top].path = call_path;
-        stack[stack_top].line = call_line;
-        stack[stack_top].sub_id = sub_id;
-        stack[stack_top].start_ns = start;
-        stack[stack_top].child_ns = 0;
-        stack_top++;
-    } else {
-        Py_XDECREF(call_path);
+    uint64_t start = perf_ns();
+    int pushed = stack_push(call_path, call_line, sub_id, start) == 0;
+    if (!pushed) {
+        atomic_fetch_add_explicit(&dropped, 1, memory_order_relaxed);
     }
 
-    PyObject *res = prev_eval(ts, f, throwflag);
-    uint64_t end = PyTime_GetPerfCounter();
+    res = prev_eval(ts, f, throwflag);
+    uint64_t end = perf_ns();
 
-    if (stack_top > 0) {
+    if (pushed) {
         StackItem item = stack[--stack_top];
         uint64_t dur = end - item.start_ns;
         uint64_t exc = dur - item.child_ns;
-        PyObject *t = PyTuple_New(5);
-        if (item.path)
-            PyTuple_SET_ITEM(t, 0, item.path);
-        else {
-            Py_INCREF(Py_None);
-            PyTuple_SET_ITEM(t, 0, Py_None);
-        }
-        PyTuple_SET_ITEM(t, 1, PyLong_FromUnsignedLong(item.line));
-        PyTuple_SET_ITEM(t, 2, PyLong_FromUnsignedLong(item.sub_id));
-        PyTuple_SET_ITEM(t, 3, PyLong_FromUnsignedLongLong(dur));
-        PyTuple_SET_ITEM(t, 4, PyLong_FromUnsignedLongLong(exc));
-        PyList_Append(calls_list, t);
-        Py_DECREF(t);
+        /* a frame that outlived dump() has nothing left to record into */
+        if (atomic_load_explicit(&active, memory_order_relaxed))
+            record_call(item.path, item.line, item.sub_id, dur, exc);
         if (stack_top > 0)
             stack[stack_top - 1].child_ns += dur;
+        else
+            stack_release();
     }
 
     ts->c_tracefunc = oldfunc;
     ts->c_traceobj = oldobj;
-    ts->use_tracing = olduse;
+    TS_USE_TRACING(ts) = olduse;
     return res;
 }
 
-/* shutdown handler */
+/* scale sampled line records up to estimates of the full counts */
+static void scale_lines(LineTable *t) {
+    if (!t || sample_stride < 2)
+        return;
+    for (size_t i = 0; i < t->cap; i++) {
+        Rec *r = &t->slots[i];
+        if (!r->path || r->sub_id)
+            continue;
+        if (r->calls > UINT32_MAX / sample_stride) {
+            r->calls = UINT32_MAX;
+            atomic_fetch_add_explicit(&dropped, 1, memory_order_relaxed);
+        } else {
+            r->calls *= sample_stride;
+        }
+        r->inc_ns *= sample_stride;
+        r->exc_ns *= sample_stride;
+    }
+}
+
+/* stop tracing, detach every thread table and fold them into one */
+static LineTable *stop_and_merge(void) {
+    atomic_store_explicit(&active, 0, memory_order_release);
+    PyInterpreterState *interp = PyInterpreterState_Get();
+    if (prev_eval)
+        _PyInterpreterState_SetEvalFrameFunc(interp, prev_eval);
+    hold_tracing(0);
+
+    LineTable *t = atomic_exchange_explicit(&tables, NULL, memory_order_acq_rel);
+    if (t && !t->next) { /* a single thread's table is already aggregated */
+        scale_lines(t);
+        return t;
+    }
+    size_t want = LINE_TABLE_INIT, used = 0;
+    for (LineTable *it = t; it; it = it->next)
+        used += it->used;
+    while (want * 3 < used * 4)
+        want *= 2;
+    LineTable *merged = table_new(want);
+    if (!merged) {
+        while (t) {
+            LineTable *next = t->next;
+            table_free(t);
+            t = next;
+        }
+        PyErr_NoMemory();
+        return NULL;
+    }
+    while (t) {
+        LineTable *next = t->next;
+        for (size_t i = 0; i < t->cap; i++) {
+            Rec *r = &t->slots[i];
+            if (r->path && r->calls)
+                table_add(merged, r->path, r->line, r->sub_id, r->calls, r->inc_ns,
+                          r->exc_ns);
+        }
+        table_free(t);
+        t = next;
+    }
+    scale_lines(merged);
+    return merged;
+}
+
+/* release the per-run state set up by enable() */
+static void reset_run(void) {
+    Py_CLEAR(defs_list);
+    Py_CLEAR(code_to_id);
+    free(script_path);
+    script_path = NULL;
+    free_filters();
+}
+
 /* dump collected data */
 static PyObject *ctrace_dump(PyObject *self, PyObject *args) {
+    LineTable *merged = stop_and_merge();
+    if (!merged)
+        return NULL;
+    /* lines are (path, line, calls, inc, exc); call edges are
+     * (path or None, line, sub_id, inc, exc, calls), one per call site */
     PyObject *records = PyList_New(0);
-    if (!records)
+    PyObject *calls = PyList_New(0);
+    if (!records || !calls) {
+        Py_XDECREF(records);
+        Py_XDECREF(calls);
+        table_free(merged);
+        reset_run();
         return NULL;
-    for (size_t i = 0; i < RING_SIZE; i++) {
-        Rec *r = &ring[i];
-        if (!r->path || !r->calls)
+    }
+    for (size_t i = 0; i < merged->cap; i++) {
+        Rec *r = &merged->slots[i];
+        if (!r->path)
             continue;
-        PyObject *t = PyTuple_New(5);
-        PyTuple_SET_ITEM(t, 0, r->path); /* steal */
-        PyTuple_SET_ITEM(t, 1, PyLong_FromUnsignedLong(r->line));
-        PyTuple_SET_ITEM(t, 2, PyLong_FromUnsignedLong(r->calls));
-        PyTuple_SET_ITEM(t, 3, PyLong_FromUnsignedLongLong(r->inc_ns));
-        PyTuple_SET_ITEM(t, 4, PyLong_FromUnsignedLongLong(r->exc_ns));
-        PyList_Append(records, t);
-        Py_DECREF(t);
+        PyObject *rec;
+        if (r->sub_id == 0) {
+            rec = PyTuple_New(5);
+            PyTuple_SET_ITEM(rec, 0, r->path); /* steal */
+            PyTuple_SET_ITEM(rec, 1, PyLong_FromUnsignedLong(r->line));
+            PyTuple_SET_ITEM(rec, 2, PyLong_FromUnsignedLong(r->calls));
+            PyTuple_SET_ITEM(rec, 3, PyLong_FromUnsignedLongLong(r->inc_ns));
+            PyTuple_SET_ITEM(rec, 4, PyLong_FromUnsignedLongLong(r->exc_ns));
+            PyList_Append(records, rec);
+        } else {
+            rec = PyTuple_New(6);
+            PyTuple_SET_ITEM(rec, 0, r->path); /* steal */
+            PyTuple_SET_ITEM(rec, 1, PyLong_FromUnsignedLong(r->line));
+            PyTuple_SET_ITEM(rec, 2, PyLong_FromUnsignedLong(r->sub_id));
+            PyTuple_SET_ITEM(rec, 3, PyLong_FromUnsignedLongLong(r->inc_ns));
+            PyTuple_SET_ITEM(rec, 4, PyLong_FromUnsignedLongLong(r->exc_ns));
+            PyTuple_SET_ITEM(rec, 5, PyLong_FromUnsignedLong(r->calls));
+            PyList_Append(calls, rec);
+        }
+        Py_DECREF(rec);
         r->path = NULL;
     }
-    PyObject *defs = defs_list ? defs_list : PyList_New(0);
-    PyObject *calls = calls_list ? calls_list : PyList_New(0);
-    Py_INCREF(defs);
-    Py_INCREF(calls);
-    PyObject *ret = PyTuple_Pack(3, defs, calls, records);
-    Py_DECREF(defs);
+    table_free(merged);
+    PyObject *defs = defs_list;
+    if (defs)
+        Py_INCREF(defs);
+    else
+        defs = PyList_New(0);
+    PyObject *ret = defs ? PyTuple_Pack(3, defs, calls, records) : NULL;
+    Py_XDECREF(defs);
     Py_DECREF(calls);
     Py_DECREF(records);
+    reset_run();
+    return ret;
+}
 
-    PyMem_RawFree(ring);
-    ring = NULL;
-    Py_CLEAR(defs_list);
-    Py_CLEAR(calls_list);
-    Py_CLEAR(code_to_id);
-    free(script_path);
-    script_path = NULL;
-    free_filters();
+static void put_u32le(unsigned char *p, uint32_t v) {
+    p[0] = (unsigned char)v;
+    p[1] = (unsigned char)(v >> 8);
+    p[2] = (unsigned char)(v >> 16);
+    p[3] = (unsigned char)(v >> 24);
+}
+
+static void put_u64le(unsigned char *p, uint64_t v) {
+    put_u32le(p, (uint32_t)v);
+    put_u32le(p + 4, (uint32_t)(v >> 32));
+}
+
+/* give path a placeholder slot in fids/paths on first sight */
+static int note_path(PyObject *fids, PyObject *paths, PyObject *path) {
+    if (path == Py_None)
+        return 0;
+    int has = PyDict_Contains(fids, path);
+    if (has != 0)
+        return has < 0 ? -1 : 0;
+    if (PyDict_SetItem(fids, path, Py_None) < 0)
+        return -1;
+    return PyList_Append(paths, path);
+}
+
+/* fid for a path noted earlier; 0 stands for "no caller" */
+static uint32_t path_fid(PyObject *fids, PyObject *path) {
+    if (path == Py_None)
+        return 0;
+    PyObject *fid = PyDict_GetItem(fids, path);
+    return fid ? (uint32_t)PyLong_AsUnsignedLong(fid) : 0;
+}
+
+#define NS_PER_TICK (1000000000ULL / TICKS_PER_SEC)
+#define REC_SIZE 28 /* <IIIQQ */
+
+/* dump collected data as ready-to-write chunk payloads:
+ * (paths, S, D, C) where fid N is paths[N - 1], S and C hold <IIIQQ records
+ * in ticks and D holds <IIII records each followed by a NUL-terminated name */
+static PyObject *ctrace_dump_packed(PyObject *self, PyObject *args) {
+    LineTable *merged = stop_and_merge();
+    if (!merged)
+        return NULL;
+    PyObject *defs = defs_list; /* borrowed until reset_run() */
+    Py_ssize_t ndefs = defs ? PyList_GET_SIZE(defs) : 0;
+    PyObject *paths = PyList_New(0);
+    PyObject *fids = PyDict_New();
+    PyObject *s_bytes = NULL, *d_bytes = NULL, *c_bytes = NULL, *ret = NULL;
+    if (!paths || !fids)
+        goto done;
+
+    /* pass 1: count records and collect the distinct files */
+    size_t n_lines = 0, n_calls = 0, d_len = 0;
+    for (size_t i = 0; i < merged->cap; i++) {
+        Rec *r = &merged->slots[i];
+        if (!r->path)
+            continue;
+        if (r->sub_id == 0)
+            n_lines++;
+        else
+            n_calls += r->calls;
+        if (note_path(fids, paths, r->path) < 0)
+            goto done;
+    }
+    for (Py_ssize_t i = 0; i < ndefs; i++) {
+        PyObject *def = PyList_GET_ITEM(defs, i);
+        if (note_path(fids, paths, PyTuple_GET_ITEM(def, 1)) < 0)
+            goto done;
+        Py_ssize_t n;
+        if (!PyUnicode_AsUTF8AndSize(PyTuple_GET_ITEM(def, 4), &n))
+            goto done;
+        d_len += 16 + (size_t)n + 1;
+    }
+    if (PyList_Sort(paths) < 0)
+        goto done;
+    for (Py_ssize_t i = 0; i < PyList_GET_SIZE(paths); i++) {
+        PyObject *fid = PyLong_FromSsize_t(i + 1);
+        if (!fid || PyDict_SetItem(fids, PyList_GET_ITEM(paths, i), fid) < 0) {
+            Py_XDECREF(fid);
+            goto done;
+        }
+        Py_DECREF(fid);
+    }
+
+    /* pass 2: pack straight into the result bytes */
+    s_bytes = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)(n_lines * REC_SIZE));
+    c_bytes = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)(n_calls * REC_SIZE));
+    d_bytes = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)d_len);
+    if (!s_bytes || !c_bytes || !d_bytes)
+        goto done;
+    unsigned char *sp = (unsigned char *)PyBytes_AS_STRING(s_bytes);
+    unsigned char *cp = (unsigned char *)PyBytes_AS_STRING(c_bytes);
+    unsigned char *dp = (unsigned char *)PyBytes_AS_STRING(d_bytes);
+    for (size_t i = 0; i < merged->cap; i++) {
+        Rec *r = &merged->slots[i];
+        if (!r->path)
+            continue;
+        uint32_t fid = path_fid(fids, r->path);
+        if (r->sub_id == 0) {
+            put_u32le(sp, fid);
+            put_u32le(sp + 4, r->line);
+            put_u32le(sp + 8, r->calls);
+            put_u64le(sp + 12, r->inc_ns / NS_PER_TICK);
+            put_u64le(sp + 20, r->exc_ns / NS_PER_TICK);
+            sp += REC_SIZE;
+            continue;
+        }
+        /* a C record stands for one call, so readers count calls by records:
+         * repeat the site once per call and spread its times over the copies,
+         * the first copy taking the remainder */
+        uint64_t inc = r->inc_ns / NS_PER_TICK, exc = r->exc_ns / NS_PER_TICK;
+        for (uint32_t k = 0; k < r->calls; k++) {
+            put_u32le(cp, fid);
+            put_u32le(cp + 4, r->line);
+            put_u32le(cp + 8, r->sub_id);
+            put_u64le(cp + 12, inc / r->calls + (k == 0 ? inc % r->calls : 0));
+            put_u64le(cp + 20, exc / r->calls + (k == 0 ? exc % r->calls : 0));
+            cp += REC_SIZE;
+        }
+    }
+    for (Py_ssize_t i = 0; i < ndefs; i++) {
+        PyObject *def = PyList_GET_ITEM(defs, i);
+        Py_ssize_t n;
+        const char *name = PyUnicode_AsUTF8AndSize(PyTuple_GET_ITEM(def, 4), &n);
+        put_u32le(dp, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(def, 0)));
+        put_u32le(dp + 4, path_fid(fids, PyTuple_GET_ITEM(def, 1)));
+        put_u32le(dp + 8, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(def, 2)));
+        put_u32le(dp + 12, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(def, 3)));
+        memcpy(dp + 16, name, (size_t)n);
+        dp[16 + n] = 0;
+        dp += 16 + (size_t)n + 1;
+    }
+    ret = PyTuple_Pack(4, paths, s_bytes, d_bytes, c_bytes);
+
+done:
+    Py_XDECREF(paths);
+    Py_XDECREF(fids);
+    Py_XDECREF(s_bytes);
+    Py_XDECREF(d_bytes);
+    Py_XDECREF(c_bytes);
+    table_free(merged);
+    reset_run();
     return ret;
 }
 
@@ -319,34 +816,40 @@ static PyObject *ctrace_enable(PyObject *self, PyObject *args) {
     unsigned long long start;
     if (!PyArg_ParseTuple(args, "sK", &path, &start))
         return NULL;
-    if (ring)
+    if (atomic_load_explicit(&active, memory_order_acquire))
         Py_RETURN_NONE;
-    ring = PyMem_RawCalloc(RING_SIZE, sizeof(Rec));
-    if (!ring)
-        return PyErr_NoMemory();
-    if (load_filters() < 0) {
-        PyMem_RawFree(ring);
-        ring = NULL;
+    if (load_filters() < 0)
         return PyErr_NoMemory();
-    }
+    load_sampling();
     start_ns = start;
     script_path = strdup(path);
     if (!script_path)
         return PyErr_NoMemory();
     code_to_id = PyDict_New();
     defs_list = PyList_New(0);
-    calls_list = PyList_New(0);
-    if (!code_to_id || !defs_list || !calls_list)
+    if (!code_to_id || !defs_list)
         return PyErr_NoMemory();
+    /* stale thread-local tables from an earlier run re-register on next use */
+    atomic_fetch_add_explicit(&generation, 1, memory_order_acq_rel);
+    atomic_store_explicit(&dropped, 0, memory_order_relaxed);
+    atomic_store_explicit(&active, 1, memory_order_release);
     PyInterpreterState *interp = PyInterpreterState_Get();
-    prev_eval = PyInterpreterState_GetEvalFrameFunc(interp);
-    PyInterpreterState_SetEvalFrameFunc(interp, tracer_eval);
+    prev_eval = _PyInterpreterState_GetEvalFrameFunc(interp);
+    _PyInterpreterState_SetEvalFrameFunc(interp, tracer_eval);
+    hold_tracing(1);
     Py_RETURN_NONE;
 }
 
+/* number of samples lost since enable() */
+static PyObject *ctrace_dropped(PyObject *self, PyObject *args) {
+    return PyLong_FromUnsignedLongLong(atomic_load_explicit(&dropped, memory_order_relaxed));
+}
+
 static PyMethodDef Methods[] = {
     {"enable", ctrace_enable, METH_VARARGS, "enable c tracer"},
     {"dump", ctrace_dump, METH_NOARGS, "dump collected data"},
+    {"dump_packed", ctrace_dump_packed, METH_NOARGS, "dump collected data as chunk payloads"},
+    {"dropped", ctrace_dropped, METH_NOARGS, "samples lost since enable"},
     {NULL, NULL, 0, NULL}
 };
 
@@ -354,4 +857,10 @@ static struct PyModuleDef moddef = {
     PyModuleDef_HEAD_INIT, "_ctrace", NULL, -1, Methods
 };
 
-PyMODINIT_FUNC PyInit__ctrace(void) { return PyModule_Create(&moddef); }
+PyMODINIT_FUNC PyInit__ctrace(void) {
+    /* verdicts are packed integers, so the slot needs no free function */
+    code_extra_index = _PyEval_RequestCodeExtraIndex(NULL);
+    if (code_extra_index < 0)
+        PyErr_Clear();
+    return PyModule_Create(&moddef);
+}
@@ -0,0 +1,95 @@
+"""NYTProf's compressed layout.
+
+Devel::NYTProf writes the ASCII banner uncompressed, then a
+``#Compressed at level N ...`` comment, the ``NYTP_TAG_START_DEFLATE`` byte
+and a single zlib stream holding everything from the P record on.  Writers
+sync-flush that stream whenever they flush, so a truncated file still
+inflates up to its last flush.
+"""
+
+from __future__ import annotations
+
+import zlib
+
+from .nytprof_tags import NYTP_TAG_START_DEFLATE
+
+__all__ = [
+    "START_DEFLATE",
+    "check_level",
+    "start_marker",
+    "deflater",
+    "inflate",
+    "InflateReader",
+]
+
+START_DEFLATE = bytes([NYTP_TAG_START_DEFLATE])
+_CHUNK = 1 << 16
+
+
+def check_level(level: int | None) -> int:
+    """Return ``level`` as an int, rejecting values zlib does not accept."""
+    level = int(level or 0)
+    if not 0 <= level <= 9:
+        raise ValueError("compress must be between 0 and 9")
+    return level
+
+
+def start_marker(level: int) -> bytes:
+    """Comment line and tag written between the banner and the stream."""
+    comment = f"#Compressed at level {level} with zlib {zlib.ZLIB_VERSION}\n"
+    return comment.encode("ascii") + START_DEFLATE
+
+
+def deflater(level: int):
+    """Compressor with the parameters NYTProf passes to ``deflateInit2``."""
+    return zlib.compressobj(level, zlib.DEFLATED, 15, 9)
+
+
+def inflate(data) -> bytes:
+    """Inflate the stream following the start tag.
+
+    A stream cut short by a crash yields the bytes up to its last flush.
+    """
+    d = zlib.decompressobj()
+    try:
+        return d.decompress(data)
+    except zlib.error as exc:
+        raise ValueError(f"bad compressed stream: {exc}") from exc
+
+
+class InflateReader:
+    """Read the inflated stream from an open file positioned after the tag.
+
+    Only ``read`` is provided; at most ``_CHUNK`` bytes of input and output
+    are held at a time on top of what the caller asked for.
+    """
+
+    def __init__(self, fh) -> None:
+        self._fh = fh
+        self._d = zlib.decompressobj()
+        # inflated bytes not yet returned start at self._buf[self._pos]
+        self._buf = bytearray()
+        self._pos = 0
+
+    def read(self, n: int = -1) -> bytes:
+        buf = self._buf
+        while (n < 0 or len(buf) - self._pos < n) and not self._d.eof:
+            raw = self._d.unconsumed_tail or self._fh.read(_CHUNK)
+            if not raw:
+                break
+            if self._pos:
+                del buf[: self._pos]
+                self._pos = 0
+            try:
+                buf += self._d.decompress(raw, _CHUNK)
+            except zlib.error as exc:
+                raise ValueError(f"bad compressed stream: {exc}") from exc
+        start = self._pos
+        end = len(buf) if n < 0 else min(start + n, len(buf))
+        out = bytes(buf[start:end])
+        if end == len(buf):
+            buf.clear()
+            self._pos = 0
+        else:
+            self._pos = end
+        return out
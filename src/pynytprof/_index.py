@@ -0,0 +1,94 @@
+"""Optional trailing chunk index.
+
+Writers asked for an index add one ``X`` chunk just before ``E``.  Its
+payload is a ``<cQII`` entry per chunk (tag, payload offset, payload
+length, record count) followed by the offset of the ``X`` tag itself and
+the ``NYTPIDX1`` magic, so readers find it from the end of the file without
+scanning.  Offsets are file positions, or positions in the inflated stream
+for compressed profiles.  Perl's reader never sees the chunk format, so
+the index does not affect ``nytprofhtml``.
+"""
+
+from __future__ import annotations
+
+import struct
+
+__all__ = ["INDEX_TAG", "MAGIC", "record_count", "encode_index", "find_index"]
+
+INDEX_TAG = b"X"
+MAGIC = b"NYTPIDX1"
+_ENTRY = struct.Struct("<cQII")
+_TRAILER = struct.Struct("<Q8s")
+_RECORD_SIZE = 28
+
+
+def record_count(tag: bytes, payload) -> int:
+    """Records in a chunk payload, or 0 for chunks without a record layout."""
+    if tag in (b"S", b"C"):
+        return len(payload) // _RECORD_SIZE
+    if tag in (b"F", b"D"):
+        # <IIII header followed by a NUL terminated name
+        data = bytes(payload)
+        n = p = 0
+        while p + 16 < len(data):
+            end = data.find(b"\0", p + 16)
+            if end == -1:
+                break
+            n += 1
+            p = end + 1
+        return n
+    return 0
+
+
+def encode_index(entries, index_offset: int) -> bytes:
+    """Payload of the ``X`` chunk whose tag is written at ``index_offset``."""
+    out = bytearray()
+    for tag, offset, length, count in entries:
+        out += _ENTRY.pack(tag if isinstance(tag, bytes) else tag.encode(), offset, length, count)
+    out += _TRAILER.pack(index_offset, MAGIC)
+    return bytes(out)
+
+
+def _end_record(data) -> int:
+    """Offset of the final ``E`` tag, which some writers give a length word."""
+    if data[-1:] == b"E":
+        return len(data) - 1
+    if data[-5:] == b"E\0\0\0\0":
+        return len(data) - 5
+    return -1
+
+
+def find_index(data) -> list[tuple[str, int, int, int]] | None:
+    """``(tag, offset, length, count)`` per chunk of an uncompressed profile.
+
+    ``data`` is the whole mapped file; the ``X`` chunk itself comes last,
+    with the number of chunks it indexes as its count.  Returns None when
+    there is no index and raises ``ValueError`` when the trailer is present
+    but the entries do not match the chunks in the file.
+    """
+    end = _end_record(data)
+    if end < _TRAILER.size or data[end - 8 : end] != MAGIC:
+        return None
+    index_offset, _magic = _TRAILER.unpack_from(data, end - _TRAILER.size)
+    if index_offset + 5 > end or data[index_offset : index_offset + 1] != INDEX_TAG:
+        raise ValueError("bad chunk index offset")
+    (length,) = struct.unpack_from("<I", data, index_offset + 1)
+    if index_offset + 5 + length != end or (length - _TRAILER.size) % _ENTRY.size:
+        raise ValueError("bad chunk index length")
+    entries = []
+    expect = None
+    for p in range(index_offset + 5, end - _TRAILER.size, _ENTRY.size):
+        tag, offset, size, count = _ENTRY.unpack_from(data, p)
+        # chunks are back to back, each payload right after its tag and length
+        if offset < 5 or (expect is not None and offset != expect) or offset + size > index_offset:
+            raise ValueError("chunk index entry out of range")
+        name = tag.decode("latin-1")
+        (stored,) = struct.unpack_from("<I", data, offset - 4)
+        if data[offset - 5 : offset - 4] != tag or stored != size:
+            raise ValueError(f"chunk index entry for {name} does not match the file")
+        entries.append((name, offset, size, count))
+        expect = offset + size + 5
+    if expect is not None and expect != index_offset + 5:
+        raise ValueError("chunk index does not reach the index chunk")
+    entries.append((INDEX_TAG.decode(), index_offset + 5, length, len(entries)))
+    return entries
@@ -1,20 +1,65 @@
 from __future__ import annotations
 
-from typing import Optional
+from array import array
+from typing import Optional, Sequence, Union
+
+# any C-contiguous buffer: bytes, array('I'), memoryview, numpy records
+Buffer = Union[bytes, bytearray, memoryview, object]
 
 
 def enable(path: str, start_ns: int) -> None: ...
 
 
-def dump() -> tuple[list[tuple[int, str, int, int, str]], list[tuple[Optional[str], int, int, int, int]], list[tuple[str, int, int, int, int]]]: ...
+def dump() -> tuple[list[tuple[int, str, int, int, str]], list[tuple[Optional[str], int, int, int, int, int]], list[tuple[str, int, int, int, int]]]: ...
+
+
+def dump_packed() -> tuple[list[str], bytes, bytes, bytes]: ...
+
+
+def dropped() -> int: ...
 
 
 def write(
     out_path: str,
     files: list[tuple[int, int, int, int, str]],
-    defs: list[tuple[int, int, int, int, str]],
-    calls: list[tuple[int | None, int, int, int, int]],
-    lines: list[tuple[int, int, int, int, int]],
+    defs: Union[list[tuple[int, int, int, int, str]], tuple[Buffer, Sequence[Union[str, bytes]]]],
+    calls: Union[list[tuple[int | None, int, int, int, int]], Buffer],
+    lines: Union[list[tuple[int, int, int, int, int]], Buffer],
     start_ns: int,
     ticks_per_sec: int,
+    compress: int = 0,
+    index: bool = False,
 ) -> None: ...
+
+
+class Encoder:
+    """Token encoder from ``_ctoken``; same interface as ``token_writer.TokenEncoder``."""
+
+    def new_fid(
+        self,
+        fid: int,
+        eval_fid: int,
+        eval_line: int,
+        flags: int,
+        size: int,
+        mtime: int,
+        path: Union[str, bytes],
+    ) -> None: ...
+    def time_line(self, fid: int, line: int, elapsed: int, overflow: int = 0) -> None: ...
+    def time_lines(
+        self,
+        fids: Union[Sequence[int], Buffer],
+        lines: Union[Sequence[int], Buffer],
+        elapsed: Union[Sequence[int], Buffer],
+    ) -> None: ...
+    def string(self, data: Union[str, bytes], utf8: bool = False) -> None: ...
+    def raw(self, data: Buffer) -> None: ...
+    def take(self) -> bytes: ...
+    def clear(self) -> None: ...
+    def __len__(self) -> int: ...
+
+
+def encode_u32_many(values: Union[Sequence[int], Buffer]) -> bytes: ...
+
+
+def decode_u32_many(buffer: Buffer) -> "array[int]": ...
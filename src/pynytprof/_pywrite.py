@@ -9,11 +9,23 @@ from pathlib import Path
 from email.utils import format_datetime
 from importlib import resources
 import re
+import zlib
 
+from ._deflate import check_level, deflater, start_marker
 from .encoding import le32, ledouble, encode_u32
 from .nytprof_tags import NYTP_TAG_PID_END
 from ._debug import DBG, log
-from .token_writer import TokenWriter
+from .token_writer import TokenEncoder, TokenWriter
+
+_Encoder = TokenEncoder
+if not os.environ.get("PYNTP_FORCE_PY"):
+    try:
+        from ._ctoken import Encoder as _Encoder  # type: ignore
+    except ImportError:  # pragma: no cover - optional extension
+        pass
+
+# encoded tokens are handed to the file in slices of about this size
+_TOKEN_FLUSH = 64 * 1024
 
 try:
     _version_text = resources.files(__package__).joinpath("nytp_version.h").read_text()
@@ -29,6 +41,35 @@ def _make_ascii_header(static: str) -> bytes:
     return (static.rstrip("\n") + "\n").encode()
 
 
+class FidRegistry:
+    """Assign NYTProf file ids to paths in first-seen order."""
+
+    def __init__(self, first_fid: int = 1) -> None:
+        self._ids: dict[str, int] = {}
+        self._next = first_fid
+
+    def register(self, path: str) -> int:
+        fid = self._ids.get(path)
+        if fid is None:
+            fid = self._next
+            self._ids[path] = fid
+            self._next += 1
+        return fid
+
+    def get(self, path: str) -> int | None:
+        return self._ids.get(path)
+
+    def items(self) -> list[tuple[str, int]]:
+        """Return ``(path, fid)`` pairs ordered by fid."""
+        return sorted(self._ids.items(), key=lambda item: item[1])
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
 class Writer:
     def __init__(
         self,
@@ -38,6 +79,10 @@ class Writer:
         tracer=None,
         script_path: str | None = None,
         fp=None,
+        attrs: dict[str, object] | None = None,
+        buffer_size: int | None = None,
+        compress: int = 0,
+        index: bool = False,
     ) -> None:
         if path is not None and not isinstance(path, (str, os.PathLike)):
             fp = path
@@ -47,14 +92,25 @@ class Writer:
         self.ticks_per_sec = ticks_per_sec
         self._start_ns = time.time_ns() if start_ns is None else start_ns
         self.tracer = tracer
+        self.attrs = dict(attrs or {})
         self.script_path = str(Path(script_path or sys.argv[0]).resolve())
         self.nv_size = struct.calcsize("d")
         self._tok = TokenWriter()
-        self._file_ids: dict[str, int] = {}
+        self._enc = _Encoder()
+        self._files = FidRegistry()
         self._emitted_fids: set[int] = set()
-        self._next_fid = 1
         self._register_file(self.script_path)
         self._offset = 0
+        # streaming mode: records collect in at most buffer_size bytes and
+        # reach the OS whenever it fills, so a crashed run keeps a prefix
+        self.buffer_size = buffer_size
+        self._pending = bytearray()
+        # with a compression level everything after the banner goes
+        # through one deflate stream, as Devel::NYTProf writes it
+        self.compress = check_level(compress)
+        self._z = None
+        # the token stream has no chunks, so there is nothing to index
+        self.index = False
         if DBG.active:
             self._buffer = bytearray()
         else:
@@ -62,20 +118,38 @@ class Writer:
 
     # file registration -------------------------------------------------
     def _register_file(self, path: str) -> int:
-        fid = self._file_ids.get(path)
-        if fid is None:
-            fid = self._next_fid
-            self._file_ids[path] = fid
-            self._next_fid += 1
-        return fid
+        return self._files.register(path)
 
     # low level writers -------------------------------------------------
     def _write_raw(self, data: bytes) -> None:
         assert self._fh is not None
-        self._fh.write(data)
         self._offset += len(data)
         if DBG.active:
             self._buffer.extend(data)
+        if self._z is not None:
+            data = self._z.compress(data)
+        if self.buffer_size:
+            self._pending += data
+            if len(self._pending) >= self.buffer_size:
+                self.flush()
+        else:
+            self._fh.write(data)
+
+    def _drain_tokens(self) -> None:
+        if len(self._enc):
+            self._write_raw(self._enc.take())
+
+    def flush(self) -> None:
+        """Hand everything written so far to the OS."""
+        if self._fh is None:
+            return
+        self._drain_tokens()
+        if self._z is not None:
+            self._pending += self._z.flush(zlib.Z_SYNC_FLUSH)
+        if self._pending:
+            self._fh.write(self._pending)
+            self._pending.clear()
+        self._fh.flush()
 
     def _write_raw_P(self, pid: int | None = None, ppid: int | None = None, tstamp: float | None = None) -> None:
         if pid is None:
@@ -85,6 +159,7 @@ class Writer:
         if tstamp is None:
             tstamp = time.time()
         payload = self._tok.write_p_record(pid, ppid, tstamp)
+        self._drain_tokens()
         self._write_raw(payload)
 
     def _emit_new_fid(self, fid: int, path: str) -> None:
@@ -94,21 +169,21 @@ class Writer:
             st = os.stat(path)
         except OSError:
             st = os.stat_result((0,) * 10)
-        payload = self._tok.write_new_fid(
-            fid,
-            0,
-            0,
-            0x10,
-            int(st.st_size),
-            int(st.st_mtime),
-            path,
-        )
-        self._write_raw(payload)
+        self._enc.new_fid(fid, 0, 0, 0x10, int(st.st_size), int(st.st_mtime), path)
         self._emitted_fids.add(fid)
+        if len(self._enc) >= _TOKEN_FLUSH:
+            self._drain_tokens()
 
     def write_time_line(self, fid: int, line: int, elapsed: int, overflow: int) -> None:
-        payload = self._tok.write_time_line(fid, line, elapsed, overflow)
-        self._write_raw(payload)
+        self._enc.time_line(fid, line, elapsed, overflow)
+        if len(self._enc) >= _TOKEN_FLUSH:
+            self._drain_tokens()
+
+    def write_time_lines(self, fids, lines, elapsed) -> None:
+        """Write one TIME_LINE token per index of three parallel arrays."""
+        self._enc.time_lines(fids, lines, elapsed)
+        if len(self._enc) >= _TOKEN_FLUSH:
+            self._drain_tokens()
 
     # header ------------------------------------------------------------
     def _write_header(self) -> None:
@@ -126,6 +201,7 @@ class Writer:
             b":PL_perldb=0",
             b":clock_id=1",
             b":ticks_per_sec=10000000",
+            *(f":{key}={val}".encode("ascii") for key, val in self.attrs.items()),
             b"!usecputime=0",
             b"!subs=1",
             b"!blocks=0",
@@ -133,7 +209,7 @@ class Writer:
             b"!expand=0",
             b"!trace=0",
             b"!use_db_sub=0",
-            b"!compress=0",
+            f"!compress={self.compress}".encode("ascii"),
             b"!clock=1",
             b"!stmts=1",
             b"!slowops=2",
@@ -147,9 +223,12 @@ class Writer:
         ]
         banner = b"\n".join(lines).rstrip(b"\n") + b"\n"
         self._write_raw(banner)
+        if self.compress:
+            self._write_raw(start_marker(self.compress))
+            self._z = deflater(self.compress)
         self._write_raw_P()
         # emit NEW_FID for script file immediately
-        fid = self._file_ids[self.script_path]
+        fid = self._files.register(self.script_path)
         self._emit_new_fid(fid, self.script_path)
 
     # public API --------------------------------------------------------
@@ -178,9 +257,13 @@ class Writer:
     def close(self) -> None:
         if not self._fh:
             return
-        # nothing else for now
+        self._drain_tokens()
         payload = bytes([NYTP_TAG_PID_END]) + encode_u32(os.getpid()) + ledouble(time.time())
         self._write_raw(payload)
+        if self._z is not None:
+            self._pending += self._z.flush()
+            self._z = None
+        self.flush()
         self._fh.close()
         self._fh = None
 
@@ -198,10 +281,17 @@ class Writer:
             return
 
 
-def write(out_path: str, *args, start_ns: int = 0, ticks_per_sec: int = 10_000_000, **kwargs) -> None:
-    with Writer(out_path, start_ns=start_ns, ticks_per_sec=ticks_per_sec) as w:
+def write(
+    out_path: str,
+    *args,
+    start_ns: int = 0,
+    ticks_per_sec: int = 10_000_000,
+    compress: int = 0,
+    **kwargs,
+) -> None:
+    with Writer(out_path, start_ns=start_ns, ticks_per_sec=ticks_per_sec, compress=compress) as w:
         w.start_profile()
         w.end_profile()
 
 
-__all__ = ["Writer", "write", "_make_ascii_header"]
+__all__ = ["Writer", "FidRegistry", "write", "_make_ascii_header"]
@@ -0,0 +1,131 @@
+"""Statistical samplers that feed the tracer's per-thread aggregates.
+
+Instead of a callback per line event, a sampler interrupts the program at a
+fixed rate and hands the interrupted frame to ``callback(frame, interval_ns)``.
+The tracer walks that frame's stack and charges one interval to the lines
+and subs on it, so the profile written at exit has the usual S, D and C
+chunks with sample counts in place of call counts.
+"""
+
+from __future__ import annotations
+
+import signal
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Callable
+
+__all__ = ["CpuSampler", "WallSampler"]
+
+SampleCallback = Callable[[FrameType, int], None]
+ThreadSampleCallback = Callable[[int, FrameType, int], None]
+
+
+class CpuSampler:
+    """Sample the main thread ``hz`` times per second of process CPU time.
+
+    ``ITIMER_PROF`` counts user and system time of the whole process and
+    raises ``SIGPROF`` each time ``1 / hz`` seconds have been used.  Python
+    runs signal handlers on the main thread between bytecodes, so only the
+    main thread's stack is sampled and time spent blocked is never seen.
+    """
+
+    def __init__(self, hz: int, callback: SampleCallback) -> None:
+        if hz <= 0:
+            raise ValueError("sampling rate must be positive")
+        self.hz = hz
+        self.interval_ns = 1_000_000_000 // hz
+        self.callback = callback
+        self.samples = 0
+        self._previous = None
+        self._running = False
+
+    def _handler(self, signum: int, frame: FrameType | None) -> None:
+        if frame is not None:
+            self.samples += 1
+            self.callback(frame, self.interval_ns)
+
+    def start(self) -> None:
+        if not hasattr(signal, "setitimer") or not hasattr(signal, "SIGPROF"):
+            raise RuntimeError("CPU sampling needs setitimer(ITIMER_PROF)")
+        if threading.current_thread() is not threading.main_thread():
+            raise RuntimeError("CPU sampling must be started from the main thread")
+        if self._running:
+            return
+        self._previous = signal.signal(signal.SIGPROF, self._handler)
+        interval = 1.0 / self.hz
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        self._running = True
+
+    def stop(self) -> None:
+        if not self._running:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self._previous or signal.SIG_DFL)
+        self._previous = None
+        self._running = False
+
+    def __enter__(self) -> "CpuSampler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class WallSampler:
+    """Sample every thread ``hz`` times per second of wall-clock time.
+
+    A daemon thread wakes up every ``1 / hz`` seconds, snapshots
+    ``sys._current_frames()`` and calls ``callback(thread_id, frame,
+    elapsed_ns)`` for each thread but itself.  ``elapsed_ns`` is the time
+    since the previous snapshot, so a late wakeup still charges the real
+    interval.  Threads blocked in locks, sockets or sleeps are sampled like
+    running ones, which makes this the sampler for off-CPU time.
+    """
+
+    def __init__(self, hz: int, callback: ThreadSampleCallback) -> None:
+        if hz <= 0:
+            raise ValueError("sampling rate must be positive")
+        self.hz = hz
+        self.interval = 1.0 / hz
+        self.callback = callback
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        last = time.perf_counter_ns()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter_ns()
+            elapsed, last = now - last, now
+            frames = sys._current_frames()
+            for ident, frame in frames.items():
+                if ident != me:
+                    self.callback(ident, frame, elapsed)
+            # do not keep the snapshot's frames alive while sleeping
+            frames = frame = None
+            self.samples += 1
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="pynytprof-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self) -> "WallSampler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
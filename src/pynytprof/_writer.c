@@ -9,6 +9,7 @@
 #include <sys/utsname.h>
 #include <unistd.h>
 #include <assert.h>
+#include <zlib.h>
 #include "nytp_version.h"
 
 #ifdef PYNYTPROF_BUILD_TAG
@@ -22,12 +23,75 @@ static void dbg_chunk(char tok, uint32_t len) {
         fprintf(stderr, "[DBG] write chunk %c len=%u\n", tok, len);
 }
 
-static void write_chunk(FILE *fp, char token,
-                        const void *payload, uint32_t len) {
-    dbg_chunk(token, len);
-    fputc(token, fp);
-    fwrite(&len, 4, 1, fp);
-    fwrite(payload, 1, len, fp);
+/* Output after the banner.  With a compression level everything from the
+ * P record on is one zlib stream, as NYTProf writes it after its
+ * NYTP_TAG_START_DEFLATE ('z') byte. */
+#define ZBUF_SIZE (64 * 1024)
+
+typedef struct {
+    FILE *fp;
+    int level;
+    z_stream zs;
+    unsigned char *zbuf;
+    uint64_t pos;        /* file offset, or offset in the inflated stream */
+    int index;           /* end with an X chunk indexing every chunk */
+    unsigned char *idx;  /* <cQII entries collected for the X chunk */
+    size_t idx_len, idx_cap;
+} Out;
+
+static void out_deflate(Out *o, const void *p, size_t n, int flush) {
+    o->zs.next_in = (Bytef *)p;
+    o->zs.avail_in = (uInt)n;
+    do {
+        o->zs.next_out = o->zbuf;
+        o->zs.avail_out = ZBUF_SIZE;
+        if (deflate(&o->zs, flush) == Z_STREAM_ERROR)
+            return;
+        fwrite(o->zbuf, 1, ZBUF_SIZE - o->zs.avail_out, o->fp);
+    } while (o->zs.avail_out == 0);
+}
+
+static void out_write(Out *o, const void *p, size_t n) {
+    o->pos += n;
+    if (o->zbuf)
+        out_deflate(o, p, n, Z_NO_FLUSH);
+    else
+        fwrite(p, 1, n, o->fp);
+}
+
+/* hand everything written so far to the OS; a compressed stream gets a
+ * sync flush so the data on disk inflates up to this point */
+static void out_flush(Out *o) {
+    if (o->zbuf)
+        out_deflate(o, NULL, 0, Z_SYNC_FLUSH);
+    fflush(o->fp);
+}
+
+static int out_start_deflate(Out *o) {
+    o->zbuf = malloc(ZBUF_SIZE);
+    if (!o->zbuf)
+        return -1;
+    memset(&o->zs, 0, sizeof(o->zs));
+    if (deflateInit2(&o->zs, o->level, Z_DEFLATED, 15, 9, Z_DEFAULT_STRATEGY) != Z_OK) {
+        free(o->zbuf);
+        o->zbuf = NULL;
+        return -1;
+    }
+    return 0;
+}
+
+static void out_close(Out *o) {
+    if (o->zbuf) {
+        out_deflate(o, NULL, 0, Z_FINISH);
+        deflateEnd(&o->zs);
+        free(o->zbuf);
+        o->zbuf = NULL;
+    }
+    fclose(o->fp);
+    o->fp = NULL;
+    free(o->idx);
+    o->idx = NULL;
+    o->idx_len = o->idx_cap = 0;
 }
 
 static void put_u32le(unsigned char *p, uint32_t v) {
@@ -42,6 +106,74 @@ static void put_u64le(unsigned char *p, uint64_t v) {
     put_u32le(p + 4, (uint32_t)(v >> 32));
 }
 
+#define IDX_ENTRY 17 /* <cQII: tag, payload offset, length, records */
+#define IDX_MAGIC "NYTPIDX1"
+
+/* records in an S/C (<IIIQQ) or F/D (<IIII + NUL terminated name) payload */
+static uint32_t chunk_records(char token, const unsigned char *p, uint32_t len) {
+    if (token == 'S' || token == 'C')
+        return len / 28;
+    if (token != 'F' && token != 'D')
+        return 0;
+    uint32_t n = 0, off = 0;
+    while (off + 16 < len) {
+        const unsigned char *nul = memchr(p + off + 16, 0, len - off - 16);
+        if (!nul)
+            break;
+        n++;
+        off = (uint32_t)(nul - p) + 1;
+    }
+    return n;
+}
+
+/* remember where a chunk's payload went; the index is best effort, so an
+ * allocation failure just drops it */
+static void index_add(Out *o, char token, const void *payload, uint32_t len) {
+    if (o->idx_len + IDX_ENTRY > o->idx_cap) {
+        size_t cap = o->idx_cap ? o->idx_cap * 2 : 64 * IDX_ENTRY;
+        unsigned char *grown = realloc(o->idx, cap);
+        if (!grown) {
+            o->index = 0;
+            return;
+        }
+        o->idx = grown;
+        o->idx_cap = cap;
+    }
+    unsigned char *e = o->idx + o->idx_len;
+    e[0] = (unsigned char)token;
+    put_u64le(e + 1, o->pos);
+    put_u32le(e + 9, len);
+    put_u32le(e + 13, chunk_records(token, payload, len));
+    o->idx_len += IDX_ENTRY;
+}
+
+static void write_chunk(Out *o, char token,
+                        const void *payload, uint32_t len) {
+    dbg_chunk(token, len);
+    out_write(o, &token, 1);
+    out_write(o, &len, 4);
+    if (o->index && token != 'E')
+        index_add(o, token, payload, len);
+    out_write(o, payload, len);
+}
+
+/* X chunk: the entries, then the offset of its own tag and the magic, so a
+ * reader finds it from the end of the file */
+static void write_index(Out *o) {
+    if (!o->index)
+        return;
+    o->index = 0;
+    unsigned char trailer[16];
+    put_u64le(trailer, o->pos);
+    memcpy(trailer + 8, IDX_MAGIC, 8);
+    uint32_t len = (uint32_t)(o->idx_len + sizeof(trailer));
+    char token = 'X';
+    dbg_chunk(token, len);
+    out_write(o, &token, 1);
+    out_write(o, &len, 4);
+    out_write(o, o->idx, o->idx_len);
+    out_write(o, trailer, sizeof(trailer));
+}
 
 static const char *rfc_2822_time(void) {
     static char buf[64];
@@ -67,7 +199,33 @@ static const char *platform_name(void) {
 
 static long basetime;
 
-static unsigned emit_banner(FILE *fp) {
+/* extra ":key=value" lines from a dict; non-dict or NULL writes nothing */
+static size_t emit_attrs(FILE *fp, PyObject *attrs) {
+    if (!attrs || !PyDict_Check(attrs))
+        return 0;
+    size_t total = 0;
+    PyObject *key, *val;
+    Py_ssize_t pos = 0;
+    while (PyDict_Next(attrs, &pos, &key, &val)) {
+        PyObject *line = PyUnicode_FromFormat(":%S=%S\n", key, val);
+        if (!line) {
+            PyErr_Clear();
+            continue;
+        }
+        Py_ssize_t n;
+        const char *s = PyUnicode_AsUTF8AndSize(line, &n);
+        if (s) {
+            fwrite(s, 1, (size_t)n, fp);
+            total += (size_t)n;
+        } else {
+            PyErr_Clear();
+        }
+        Py_DECREF(line);
+    }
+    return total;
+}
+
+static unsigned emit_banner(FILE *fp, PyObject *attrs, int level) {
     char buf[1024];
     int len = snprintf(buf, sizeof(buf),
                        "NYTProf %d %d\n"
@@ -79,14 +237,22 @@ static unsigned emit_banner(FILE *fp) {
                        ":clock_mod=cpu\n"
                        ":ticks_per_sec=10000000\n"
                        ":osname=%s\n"
-                       ":hz=%ld\n"
+                       ":hz=%ld\n",
+                       NYTPROF_MAJOR, NYTPROF_MINOR, rfc_2822_time(), basetime,
+                       sizeof(double), PY_VERSION, platform_name(),
+                       sysconf(_SC_CLK_TCK));
+    (void)len;
+    size_t len_written = strlen(buf);
+    fwrite(buf, 1, len_written, fp);
+    len_written += emit_attrs(fp, attrs);
+    len = snprintf(buf, sizeof(buf),
                        "!subs=1\n"
                        "!blocks=0\n"
                        "!leave=1\n"
                        "!expand=0\n"
                        "!trace=0\n"
                        "!use_db_sub=0\n"
-                       "!compress=0\n"
+                       "!compress=%d\n"
                        "!clock=1\n"
                        "!stmts=1\n"
                        "!slowops=2\n"
@@ -97,11 +263,10 @@ static unsigned emit_banner(FILE *fp) {
                        "!nameanonsubs=1\n"
                        "!calls=1\n"
                        "!evals=0\n",
-                       NYTPROF_MAJOR, NYTPROF_MINOR, rfc_2822_time(), basetime,
-                       sizeof(double), PY_VERSION, platform_name(),
-                       sysconf(_SC_CLK_TCK));
-    size_t len_written = strlen(buf);
-    fwrite(buf, 1, len_written, fp);
+                       level);
+    (void)len;
+    fwrite(buf, 1, strlen(buf), fp);
+    len_written += strlen(buf);
     return (unsigned)len_written;
 }
 
@@ -114,245 +279,380 @@ static void put_double_le(unsigned char *p, double v) {
     memcpy(p, u.b, 8);
 }
 
-static void store_le32(FILE *fp, uint32_t v) {
+static void store_le32(Out *o, uint32_t v) {
     unsigned char b[4];
     put_u32le(b, v);
-    fwrite(b, 1, 4, fp);
+    out_write(o, b, 4);
 }
 
-static void store_le_double(FILE *fp, double v) {
+static void store_le_double(Out *o, double v) {
     unsigned char b[8];
     put_double_le(b, v);
-    fwrite(b, 1, 8, fp);
+    out_write(o, b, 8);
 }
 
-static void emit_header(FILE *fp) {
-    emit_banner(fp);
+static int emit_header(Out *o, PyObject *attrs) {
+    o->pos = emit_banner(o->fp, attrs, o->level);
+    if (o->level) {
+        o->pos = 0; /* offsets count from the start of the inflated stream */
+        fprintf(o->fp, "#Compressed at level %d with zlib %s\n", o->level, zlibVersion());
+        fputc('z', o->fp);
+        if (out_start_deflate(o) < 0) {
+            PyErr_SetString(PyExc_RuntimeError, "deflateInit2 failed");
+            return -1;
+        }
+    }
     struct timespec ts;
     clock_gettime(CLOCK_REALTIME, &ts);
     double t = (double)ts.tv_sec + (double)ts.tv_nsec / 1e9;
-    fputc('P', fp);
-    store_le32(fp, 16);
-    store_le32(fp, (uint32_t)getpid());
-    store_le32(fp, (uint32_t)getppid());
-    store_le_double(fp, t);
+    /* raw P record: tag, pid, ppid, time; no length prefix */
+    out_write(o, "P", 1);
+    store_le32(o, (uint32_t)getpid());
+    store_le32(o, (uint32_t)getppid());
+    store_le_double(o, t);
     if (getenv("PYNYTPROF_DEBUG")) {
-        fprintf(stderr, "DEBUG: wrote raw P record (21 B)\n");
+        fprintf(stderr, "DEBUG: wrote raw P record (17 B)\n");
     }
+    return 0;
+}
 
+#define REC_SIZE 28 /* <IIIQQ S and C records */
+#define DEF_SIZE 16 /* <IIII D record, before its name */
+
+/* a C-contiguous buffer of fixed-size records, or 0 if obj is not a buffer */
+static int get_records(PyObject *obj, const char *what, size_t rec_size, Py_buffer *view) {
+    if (!PyObject_CheckBuffer(obj))
+        return 0;
+    if (PyObject_GetBuffer(obj, view, PyBUF_C_CONTIGUOUS) < 0)
+        return -1;
+    if ((size_t)view->len % rec_size) {
+        PyErr_Format(PyExc_ValueError, "%s buffer length %zd is not a multiple of %zu",
+                     what, view->len, rec_size);
+        PyBuffer_Release(view);
+        return -1;
+    }
+    return 1;
 }
 
+/* pack (fid, line, n, inc_ns, exc_ns) tuples as <IIIQQ records in ticks */
+static char *pack_records(PyObject *seq, size_t *out_len) {
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+    *out_len = (size_t)n * REC_SIZE;
+    char *data = malloc(*out_len ? *out_len : 1);
+    if (!data) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    unsigned char *p = (unsigned char *)data;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *it = PySequence_Fast_GET_ITEM(seq, i);
+        put_u32le(p, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 0)));
+        put_u32le(p + 4, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 1)));
+        put_u32le(p + 8, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 2)));
+        put_u64le(p + 12, PyLong_AsUnsignedLongLong(PyTuple_GET_ITEM(it, 3)) / 100);
+        put_u64le(p + 20, PyLong_AsUnsignedLongLong(PyTuple_GET_ITEM(it, 4)) / 100);
+        p += REC_SIZE;
+    }
+    if (PyErr_Occurred()) {
+        free(data);
+        return NULL;
+    }
+    return data;
+}
+
+/* utf-8 name for a D record; names may be str or bytes */
+static const char *def_name(PyObject *obj, Py_ssize_t *len) {
+    if (PyBytes_Check(obj)) {
+        *len = PyBytes_GET_SIZE(obj);
+        return PyBytes_AS_STRING(obj);
+    }
+    return PyUnicode_AsUTF8AndSize(obj, len);
+}
+
+/* pack D records either from (sid, fid, sl, el, name) tuples or from a
+ * (<IIII buffer, names) pair */
+static char *pack_defs(PyObject *defs_obj, size_t *out_len) {
+    Py_buffer view = {0};
+    PyObject *names = NULL;
+    PyObject *recs = NULL;
+    char *data = NULL;
+    Py_ssize_t n;
+    int buffered = 0;
+
+    if (PyTuple_Check(defs_obj) && PyTuple_GET_SIZE(defs_obj) == 2 &&
+        PyObject_CheckBuffer(PyTuple_GET_ITEM(defs_obj, 0))) {
+        if (get_records(PyTuple_GET_ITEM(defs_obj, 0), "defs", DEF_SIZE, &view) < 0)
+            return NULL;
+        buffered = 1;
+        names = PySequence_Fast(PyTuple_GET_ITEM(defs_obj, 1), "defs names");
+        if (!names)
+            goto done;
+        n = view.len / DEF_SIZE;
+        if (PySequence_Fast_GET_SIZE(names) != n) {
+            PyErr_Format(PyExc_ValueError, "defs buffer holds %zd records but %zd names",
+                         n, PySequence_Fast_GET_SIZE(names));
+            goto done;
+        }
+    } else {
+        recs = PySequence_Fast(defs_obj, "defs");
+        if (!recs)
+            return NULL;
+        n = PySequence_Fast_GET_SIZE(recs);
+    }
+
+    size_t len = 0;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        Py_ssize_t l;
+        PyObject *name = buffered ? PySequence_Fast_GET_ITEM(names, i)
+                                  : PyTuple_GET_ITEM(PySequence_Fast_GET_ITEM(recs, i), 4);
+        if (!def_name(name, &l))
+            goto done;
+        len += DEF_SIZE + (size_t)l + 1;
+    }
+    data = malloc(len ? len : 1);
+    if (!data) {
+        PyErr_NoMemory();
+        goto done;
+    }
+    unsigned char *p = (unsigned char *)data;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        Py_ssize_t l;
+        const char *name;
+        if (buffered) {
+            memcpy(p, (const char *)view.buf + i * DEF_SIZE, DEF_SIZE);
+            name = def_name(PySequence_Fast_GET_ITEM(names, i), &l);
+        } else {
+            PyObject *it = PySequence_Fast_GET_ITEM(recs, i);
+            for (int k = 0; k < 4; k++)
+                put_u32le(p + 4 * k, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, k)));
+            name = def_name(PyTuple_GET_ITEM(it, 4), &l);
+        }
+        memcpy(p + DEF_SIZE, name, (size_t)l);
+        p[DEF_SIZE + l] = 0;
+        p += DEF_SIZE + (size_t)l + 1;
+    }
+    if (PyErr_Occurred()) {
+        free(data);
+        data = NULL;
+        goto done;
+    }
+    *out_len = len;
+
+done:
+    if (buffered)
+        PyBuffer_Release(&view);
+    Py_XDECREF(names);
+    Py_XDECREF(recs);
+    return data;
+}
+
+/* pack (fid, flags, size, mtime, path) tuples as F records */
+static char *pack_files(PyObject *seq, size_t *out_len) {
+    Py_ssize_t n = PySequence_Fast_GET_SIZE(seq);
+    size_t len = 0;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        Py_ssize_t l;
+        if (!PyUnicode_AsUTF8AndSize(PyTuple_GET_ITEM(PySequence_Fast_GET_ITEM(seq, i), 4), &l))
+            return NULL;
+        len += 16 + (size_t)l + 1;
+    }
+    char *data = malloc(len ? len : 1);
+    if (!data) {
+        PyErr_NoMemory();
+        return NULL;
+    }
+    unsigned char *p = (unsigned char *)data;
+    for (Py_ssize_t i = 0; i < n; i++) {
+        PyObject *it = PySequence_Fast_GET_ITEM(seq, i);
+        Py_ssize_t l;
+        const char *path = PyUnicode_AsUTF8AndSize(PyTuple_GET_ITEM(it, 4), &l);
+        for (int k = 0; k < 4; k++)
+            put_u32le(p + 4 * k, (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, k)));
+        memcpy(p + 16, path, (size_t)l);
+        p[16 + l] = 0;
+        p += 16 + (size_t)l + 1;
+    }
+    if (PyErr_Occurred()) {
+        free(data);
+        return NULL;
+    }
+    *out_len = len;
+    return data;
+}
+
+/* write(path, files, defs, calls, lines, start_ns, ticks_per_sec, compress=0, index=False)
+ *
+ * calls and lines are sequences of (fid, line, n, inc_ns, exc_ns) tuples, or
+ * C-contiguous buffers of <IIIQQ records already in ticks, which are written
+ * without being copied.  defs are (sid, fid, sl, el, name) tuples or a
+ * (<IIII buffer, names) pair. */
 static PyObject *pynytprof_write(PyObject *self, PyObject *args) {
     PyObject *path_obj, *files_obj, *defs_obj, *calls_obj, *lines_obj, *start_obj,
         *ticks_obj;
-    if (!PyArg_ParseTuple(args, "OOOOOOO", &path_obj, &files_obj, &defs_obj,
-                          &calls_obj, &lines_obj, &start_obj, &ticks_obj))
+    int level = 0;
+    int index = 0;
+    if (!PyArg_ParseTuple(args, "OOOOOOO|ip", &path_obj, &files_obj, &defs_obj,
+                          &calls_obj, &lines_obj, &start_obj, &ticks_obj, &level, &index))
         return NULL;
+    if (level < 0 || level > 9) {
+        PyErr_SetString(PyExc_ValueError, "compress must be between 0 and 9");
+        return NULL;
+    }
 
     const char *path = PyUnicode_AsUTF8(path_obj);
     if (!path)
         return NULL;
 
     uint64_t start_ns = PyLong_AsUnsignedLongLong(start_obj);
-    uint64_t ticks_per_sec = PyLong_AsUnsignedLongLong(ticks_obj);
+    (void)PyLong_AsUnsignedLongLong(ticks_obj);
     if (PyErr_Occurred())
         return NULL;
 
-    PyObject *files = PySequence_Fast(files_obj, "files");
-    PyObject *defs = PySequence_Fast(defs_obj, "defs");
-    PyObject *calls = PySequence_Fast(calls_obj, "calls");
-    PyObject *lines = PySequence_Fast(lines_obj, "lines");
-    if (!files || !defs || !calls || !lines)
-        return NULL;
-
-    Py_ssize_t nfiles = PySequence_Fast_GET_SIZE(files);
-    Py_ssize_t ndefs = PySequence_Fast_GET_SIZE(defs);
-    Py_ssize_t ncalls = PySequence_Fast_GET_SIZE(calls);
-    Py_ssize_t nlines = PySequence_Fast_GET_SIZE(lines);
-
-    FILE *fp = fopen(path, "wb");
-    if (!fp)
-        return PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+    PyObject *ret = NULL;
+    PyObject *files = NULL, *calls = NULL, *lines = NULL;
+    Py_buffer c_view = {0}, s_view = {0};
+    int c_buf = 0, s_buf = 0;
+    char *fdata = NULL, *ddata = NULL, *cdata = NULL, *sdata = NULL;
+    size_t f_len = 0, d_len = 0, c_len = 0, s_len = 0;
+    const void *c_ptr, *s_ptr;
+
+    files = PySequence_Fast(files_obj, "files");
+    if (!files || !(fdata = pack_files(files, &f_len)))
+        goto done;
+    if (!(ddata = pack_defs(defs_obj, &d_len)))
+        goto done;
+
+    if ((c_buf = get_records(calls_obj, "calls", REC_SIZE, &c_view)) < 0)
+        goto done;
+    if (c_buf) {
+        c_ptr = c_view.buf;
+        c_len = (size_t)c_view.len;
+    } else {
+        calls = PySequence_Fast(calls_obj, "calls");
+        if (!calls || !(cdata = pack_records(calls, &c_len)))
+            goto done;
+        c_ptr = cdata;
+    }
+    if ((s_buf = get_records(lines_obj, "lines", REC_SIZE, &s_view)) < 0)
+        goto done;
+    if (s_buf) {
+        s_ptr = s_view.buf;
+        s_len = (size_t)s_view.len;
+    } else {
+        lines = PySequence_Fast(lines_obj, "lines");
+        if (!lines || !(sdata = pack_records(lines, &s_len)))
+            goto done;
+        s_ptr = sdata;
+    }
 
+    Out out = {.fp = fopen(path, "wb"), .level = level, .index = index};
+    if (!out.fp) {
+        PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
+        goto done;
+    }
     basetime = (long)(start_ns / 1000000000ULL);
-    emit_header(fp);
-
-
-    unsigned char *p;
-
-    /* D chunk */
-    size_t d_len = 0;
-    for (Py_ssize_t i = 0; i < ndefs; i++) {
-        PyObject *it = PySequence_Fast_GET_ITEM(defs, i);
-        const char *name = PyUnicode_AsUTF8(PyTuple_GET_ITEM(it, 4));
-        d_len += 16 + strlen(name) + 1;
-    }
-    char *ddata = malloc(d_len);
-    if (!ddata) {
-        goto mem_err;
-    }
-    p = (unsigned char *)ddata;
-    for (Py_ssize_t i = 0; i < ndefs; i++) {
-        PyObject *it = PySequence_Fast_GET_ITEM(defs, i);
-        uint32_t sid = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 0));
-        uint32_t fid = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 1));
-        uint32_t sl = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 2));
-        uint32_t el = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 3));
-        const char *name = PyUnicode_AsUTF8(PyTuple_GET_ITEM(it, 4));
-        size_t l = strlen(name);
-        put_u32le(p, sid);
-        p += 4;
-        put_u32le(p, fid);
-        p += 4;
-        put_u32le(p, sl);
-        p += 4;
-        put_u32le(p, el);
-        p += 4;
-        memcpy(p, name, l);
-        p[l] = 0;
-        p += l + 1;
-    }
-
-    /* C chunk */
-    size_t c_len = (size_t)ncalls * 28;
-    char *cdata = malloc(c_len);
-    if (!cdata) {
-        free(ddata);
-        goto mem_err;
-    }
-    p = (unsigned char *)cdata;
-    for (Py_ssize_t i = 0; i < ncalls; i++) {
-        PyObject *it = PySequence_Fast_GET_ITEM(calls, i);
-        uint32_t fid = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 0));
-        uint32_t line = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 1));
-        uint32_t sid = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 2));
-        uint64_t inc = PyLong_AsUnsignedLongLong(PyTuple_GET_ITEM(it, 3));
-        uint64_t exc = PyLong_AsUnsignedLongLong(PyTuple_GET_ITEM(it, 4));
-        inc /= 100;
-        exc /= 100;
-        put_u32le(p, fid);
-        p += 4;
-        put_u32le(p, line);
-        p += 4;
-        put_u32le(p, sid);
-        p += 4;
-        put_u64le(p, inc);
-        p += 8;
-        put_u64le(p, exc);
-        p += 8;
-    }
-
-    /* S chunk */
-    size_t s_len = (size_t)nlines * 28;
-    char *sdata = malloc(s_len);
-    if (!sdata) {
-        free(ddata);
-        free(cdata);
-        goto mem_err;
-    }
-    p = (unsigned char *)sdata;
-    for (Py_ssize_t i = 0; i < nlines; i++) {
-        PyObject *it = PySequence_Fast_GET_ITEM(lines, i);
-        uint32_t fid = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 0));
-        uint32_t line = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 1));
-        uint32_t calls_v = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 2));
-        uint64_t inc = PyLong_AsUnsignedLongLong(PyTuple_GET_ITEM(it, 3));
-        uint64_t exc = PyLong_AsUnsignedLongLong(PyTuple_GET_ITEM(it, 4));
-        inc /= 100;
-        exc /= 100;
-        put_u32le(p, fid);
-        p += 4;
-        put_u32le(p, line);
-        p += 4;
-        put_u32le(p, calls_v);
-        p += 4;
-        put_u64le(p, inc);
-        p += 8;
-        put_u64le(p, exc);
-        p += 8;
-    }
-
-    /* F chunk */
-    size_t f_len = 0;
-    for (Py_ssize_t i = 0; i < nfiles; i++) {
-        PyObject *it = PySequence_Fast_GET_ITEM(files, i);
-        const char *path = PyUnicode_AsUTF8(PyTuple_GET_ITEM(it, 4));
-        f_len += 16 + strlen(path) + 1;
-    }
-    char *fdata = malloc(f_len);
-    if (!fdata) {
-        free(ddata);
-        free(cdata);
-        free(sdata);
-        goto mem_err;
-    }
-    p = (unsigned char *)fdata;
-    for (Py_ssize_t i = 0; i < nfiles; i++) {
-        PyObject *it = PySequence_Fast_GET_ITEM(files, i);
-        uint32_t fid = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 0));
-        uint32_t flags = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 1));
-        uint32_t size = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 2));
-        uint32_t mtime = (uint32_t)PyLong_AsUnsignedLong(PyTuple_GET_ITEM(it, 3));
-        const char *path = PyUnicode_AsUTF8(PyTuple_GET_ITEM(it, 4));
-        size_t l = strlen(path);
-        put_u32le(p, fid);
-        p += 4;
-        put_u32le(p, flags);
-        p += 4;
-        put_u32le(p, size);
-        p += 4;
-        put_u32le(p, mtime);
-        p += 4;
-        memcpy(p, path, l);
-        p[l] = 0;
-        p += l + 1;
-    }
-    write_chunk(fp, 'S', sdata, (uint32_t)s_len);
-    write_chunk(fp, 'F', fdata, (uint32_t)f_len);
-    write_chunk(fp, 'D', ddata, (uint32_t)d_len);
-    write_chunk(fp, 'C', cdata, (uint32_t)c_len);
-    write_chunk(fp, 'E', NULL, 0);
-
+    if (emit_header(&out, NULL) < 0) {
+        fclose(out.fp);
+        goto done;
+    }
+    Py_BEGIN_ALLOW_THREADS
+    write_chunk(&out, 'S', s_ptr, (uint32_t)s_len);
+    write_chunk(&out, 'F', fdata, (uint32_t)f_len);
+    write_chunk(&out, 'D', ddata, (uint32_t)d_len);
+    write_chunk(&out, 'C', c_ptr, (uint32_t)c_len);
+    write_index(&out);
+    write_chunk(&out, 'E', NULL, 0);
+    out_close(&out);
+    Py_END_ALLOW_THREADS
+    ret = Py_None;
+    Py_INCREF(ret);
+
+done:
+    if (c_buf > 0)
+        PyBuffer_Release(&c_view);
+    if (s_buf > 0)
+        PyBuffer_Release(&s_view);
+    free(fdata);
     free(ddata);
     free(cdata);
-    free(fdata);
     free(sdata);
-    fclose(fp);
-    Py_RETURN_NONE;
-
-mem_err:
-    fclose(fp);
-    return PyErr_NoMemory();
+    Py_XDECREF(files);
+    Py_XDECREF(calls);
+    Py_XDECREF(lines);
+    return ret;
 }
 
 typedef struct {
     PyObject_HEAD
-    FILE *fp;
+    Out out;    /* out.fp is NULL once closed */
+    int stream; /* flush each completed chunk to the OS */
+    /* guards out: write_chunk works on it without the GIL */
+    PyThread_type_lock lock;
 } Writer;
 
+/* take self->lock, letting other threads run while it is busy */
+static void writer_lock(Writer *self) {
+    if (!PyThread_acquire_lock(self->lock, NOWAIT_LOCK)) {
+        Py_BEGIN_ALLOW_THREADS
+        PyThread_acquire_lock(self->lock, WAIT_LOCK);
+        Py_END_ALLOW_THREADS
+    }
+}
+
 static PyObject *
 Writer_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 {
-    static char *kwlist[] = {"path", "start_ns", "ticks_per_sec", "tracer", NULL};
+    static char *kwlist[] = {"path", "start_ns", "ticks_per_sec", "tracer", "attrs",
+                             "buffer_size", "compress", "index", NULL};
     const char *path;
     unsigned long long start_ns = 0;
     unsigned long long ticks = 10000000ULL;
     PyObject *tracer = NULL;
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|KKO", kwlist, &path,
-                                     &start_ns, &ticks, &tracer))
+    PyObject *attrs = NULL;
+    Py_ssize_t buffer_size = 0;
+    int level = 0;
+    int index = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "s|KKOOnip", kwlist, &path, &start_ns,
+                                     &ticks, &tracer, &attrs, &buffer_size, &level, &index))
+        return NULL;
+    if (level < 0 || level > 9) {
+        PyErr_SetString(PyExc_ValueError, "compress must be between 0 and 9");
         return NULL;
+    }
+    if (attrs == Py_None)
+        attrs = NULL;
+    if (attrs && !PyDict_Check(attrs)) {
+        PyErr_SetString(PyExc_TypeError, "attrs must be a dict");
+        return NULL;
+    }
 
     Writer *self = (Writer *)type->tp_alloc(type, 0);
     if (!self)
         return NULL;
-    self->fp = fopen(path, "wb");
-    if (!self->fp) {
+    self->lock = PyThread_allocate_lock();
+    if (!self->lock) {
+        Py_DECREF(self);
+        return PyErr_NoMemory();
+    }
+    self->out.fp = fopen(path, "wb");
+    if (!self->out.fp) {
         Py_DECREF(self);
         return PyErr_SetFromErrnoWithFilename(PyExc_OSError, path);
     }
+    self->out.level = level;
+    self->out.index = index;
+    /* streaming mode: a bounded stdio buffer, flushed after every chunk */
+    if (buffer_size > 0) {
+        setvbuf(self->out.fp, NULL, _IOFBF, (size_t)buffer_size);
+        self->stream = 1;
+    }
     (void)ticks; /* unused */
     basetime = (long)(start_ns / 1000000000ULL);
-    emit_header(self->fp);
+    if (emit_header(&self->out, attrs) < 0) {
+        out_close(&self->out);
+        Py_DECREF(self);
+        return NULL;
+    }
     return (PyObject *)self;
 }
 
@@ -368,27 +668,65 @@ Writer_write_chunk(Writer *self, PyObject *args)
         PyBuffer_Release(&paybuf);
         return NULL;
     }
-    /* emit */
-    write_chunk(self->fp,
-                ((const unsigned char *)tokbuf.buf)[0],
-                paybuf.buf,
-                (uint32_t)paybuf.len);
+    /* any contiguous buffer (bytes, array, memoryview, numpy records) is
+     * written as is; the exported buffer stays pinned while unlocked, and
+     * self->lock keeps other threads off the stream meanwhile */
+    char token = ((const char *)tokbuf.buf)[0];
+    int closed;
+    Py_BEGIN_ALLOW_THREADS
+    PyThread_acquire_lock(self->lock, WAIT_LOCK);
+    closed = !self->out.fp;
+    if (!closed) {
+        write_chunk(&self->out, token, paybuf.buf, (uint32_t)paybuf.len);
+        if (self->stream)
+            out_flush(&self->out);
+    }
+    PyThread_release_lock(self->lock);
+    Py_END_ALLOW_THREADS
     PyBuffer_Release(&tokbuf);
     PyBuffer_Release(&paybuf);
+    if (closed) {
+        PyErr_SetString(PyExc_ValueError, "writer is closed");
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+Writer_flush(Writer *self, PyObject *Py_UNUSED(args))
+{
+    writer_lock(self);
+    if (self->out.fp)
+        out_flush(&self->out);
+    PyThread_release_lock(self->lock);
     Py_RETURN_NONE;
 }
 
 static PyObject *
 Writer_close(Writer *self, PyObject *Py_UNUSED(args))
 {
-    if (self->fp) {
-        write_chunk(self->fp, 'E', NULL, 0);
-        fclose(self->fp);
-        self->fp = NULL;
+    writer_lock(self);
+    if (self->out.fp) {
+        write_index(&self->out);
+        write_chunk(&self->out, 'E', NULL, 0);
+        out_close(&self->out);
     }
+    PyThread_release_lock(self->lock);
     Py_RETURN_NONE;
 }
 
+/* a writer dropped without close() releases its file and buffers; the
+ * file is left without an E chunk, so readers see it as truncated */
+static void
+Writer_dealloc(Writer *self)
+{
+    if (self->out.fp)
+        out_close(&self->out);
+    if (self->lock)
+        PyThread_free_lock(self->lock);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
 static PyObject *
 Writer_enter(Writer *self, PyObject *Py_UNUSED(args))
 {
@@ -405,7 +743,8 @@ Writer_exit(Writer *self, PyObject *args)
 
 static PyMethodDef Writer_methods[] = {
     {"write_chunk", (PyCFunction)Writer_write_chunk, METH_VARARGS,
-     PyDoc_STR("write_chunk(token: bytes, payload: bytes) -> None")},
+     PyDoc_STR("write_chunk(token: bytes, payload: Buffer) -> None")},
+    {"flush", (PyCFunction)Writer_flush, METH_NOARGS, PyDoc_STR("flush() -> None")},
     {"close", (PyCFunction)Writer_close, METH_NOARGS, PyDoc_STR("close() -> None")},
     {"__enter__", (PyCFunction)Writer_enter, METH_NOARGS, NULL},
     {"__exit__", (PyCFunction)Writer_exit, METH_VARARGS, NULL},
@@ -418,6 +757,7 @@ static PyTypeObject WriterType = {
     .tp_basicsize = sizeof(Writer),
     .tp_flags = Py_TPFLAGS_DEFAULT,
     .tp_new = Writer_new,
+    .tp_dealloc = (destructor)Writer_dealloc,
     .tp_methods = Writer_methods,
 };
 
@@ -12,6 +12,12 @@ def _cmd_profile(args: argparse.Namespace) -> int:
     cmd = [sys.executable, "-m", "pynytprof.tracer"]
     if args.out:
         cmd += ["-o", args.out]
+    if args.compress is not None:
+        cmd += ["--compress", str(args.compress)]
+    if args.sample is not None:
+        cmd += ["--sample", str(args.sample)]
+    if args.clock is not None:
+        cmd += ["--clock", args.clock]
     cmd += [args.script, *args.args]
     proc = subprocess.run(cmd, env=os.environ.copy())
     return proc.returncode
@@ -44,6 +50,13 @@ def main(argv: list[str] | None = None) -> None:
     pr.add_argument("script")
     pr.add_argument("args", nargs=argparse.REMAINDER)
     pr.add_argument("-o", "--out")
+    pr.add_argument("--compress", type=int, metavar="LEVEL", help="zlib level 1-9")
+    pr.add_argument("--sample", type=int, metavar="HZ", help="sample at HZ instead of tracing")
+    pr.add_argument(
+        "--clock",
+        choices=("cpu", "wall"),
+        help="sample CPU time of the main thread or wall time of every thread",
+    )
     pr.add_argument("-q", "--quiet", action="store_true")
     pr.set_defaults(func=_cmd_profile)
 
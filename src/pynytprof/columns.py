@@ -0,0 +1,165 @@
+"""Columnar access to S and C records through NumPy.
+
+S and C payloads are packed ``<IIIQQ`` records, so ``numpy.frombuffer``
+can view them as structured arrays without decoding anything.  NumPy is
+optional and only imported when these helpers are used.
+"""
+
+from __future__ import annotations
+
+from .reader import iter_chunks
+
+__all__ = [
+    "LINE_FIELDS",
+    "CALL_FIELDS",
+    "record_dtype",
+    "frombuffer",
+    "read_arrays",
+    "sort_by",
+    "group_by",
+    "top_k",
+]
+
+LINE_FIELDS = ("fid", "line", "calls", "incl", "excl")
+CALL_FIELDS = ("fid", "line", "sid", "incl", "excl")
+_FORMATS = ("<u4", "<u4", "<u4", "<u8", "<u8")
+_RECORD_SIZE = 28
+_SUMMABLE = ("calls", "incl", "excl")
+
+
+def _np():
+    try:
+        import numpy as np
+    except ImportError as exc:
+        raise ImportError("pynytprof.columns requires numpy") from exc
+    return np
+
+
+def record_dtype(names=LINE_FIELDS):
+    """Structured dtype matching one 28 byte S or C record."""
+    return _np().dtype({"names": list(names), "formats": list(_FORMATS)})
+
+
+def frombuffer(payload, names=LINE_FIELDS):
+    """View an S or C payload as a structured array without copying."""
+    if len(payload) % _RECORD_SIZE:
+        raise ValueError("payload is not a whole number of records")
+    return _np().frombuffer(payload, dtype=record_dtype(names))
+
+
+def read_arrays(path: str) -> dict:
+    """Return ``{"lines": ..., "calls": ...}`` structured arrays for a profile.
+
+    A profile with a single S or C chunk gets a view straight over the
+    memory-mapped payload; several chunks are concatenated into one array.
+    """
+    np = _np()
+    parts: dict[str, list] = {"S": [], "C": []}
+    for tag, _offset, payload in iter_chunks(path):
+        if tag in parts:
+            names = LINE_FIELDS if tag == "S" else CALL_FIELDS
+            parts[tag].append(frombuffer(payload, names))
+    out = {}
+    for key, tag, names in (("lines", "S", LINE_FIELDS), ("calls", "C", CALL_FIELDS)):
+        arrays = parts[tag]
+        if len(arrays) == 1:
+            out[key] = arrays[0]
+        elif arrays:
+            out[key] = np.concatenate(arrays)
+        else:
+            out[key] = np.empty(0, dtype=record_dtype(names))
+    return out
+
+
+def sort_by(records, field: str, descending: bool = True):
+    """Return ``records`` ordered by ``field``; ties keep their file order."""
+    np = _np()
+    col = records[field]
+    if not descending:
+        return records[np.argsort(col, kind="stable")]
+    # sort the reversed column and flip back so equal values stay in order
+    order = np.argsort(col[::-1], kind="stable")[::-1]
+    return records[len(col) - 1 - order]
+
+
+def group_by(records, keys=("fid", "line"), values=None):
+    """Sum ``values`` over records sharing the same ``keys``.
+
+    ``values`` defaults to the ``calls``/``incl``/``excl`` fields not used as
+    keys.  Sums are 64-bit and the result is sorted by key.
+    """
+    np = _np()
+    keys = tuple(keys)
+    if values is None:
+        values = tuple(f for f in _SUMMABLE if f in records.dtype.names and f not in keys)
+    dtype = [(k, records.dtype[k]) for k in keys] + [(v, "<u8") for v in values]
+    if not len(records):
+        return np.empty(0, dtype=dtype)
+    lows = [int(records[k].min()) for k in keys]
+    spans = [int(records[k].max()) - lo + 1 for k, lo in zip(keys, lows)]
+    size = 1
+    for span in spans:
+        size *= span
+    if size <= max(2 * len(records), 1 << 20):
+        # file ids, line numbers and sub ids are small and dense: index a
+        # table of every key combination instead of sorting
+        idx = np.zeros(len(records), dtype=np.int64)
+        for k, lo, span in zip(keys, lows, spans):
+            idx = idx * span + (records[k].astype(np.int64) - lo)
+        present = np.flatnonzero(np.bincount(idx, minlength=size))
+        out = np.empty(len(present), dtype=dtype)
+        rest = present
+        for k, lo, span in reversed(list(zip(keys, lows, spans))):
+            rest, digit = np.divmod(rest, span)
+            out[k] = digit + lo
+        for v in values:
+            out[v] = _dense_sum(np, idx, records[v], size)[present]
+        return out
+    if len(keys) <= 2 and all(records.dtype[k].itemsize <= 4 for k in keys):
+        # pack up to two 32-bit keys into one integer: a single stable sort,
+        # which is linear for records the writers already emit in order
+        packed = records[keys[0]].astype(np.uint64)
+        if len(keys) == 2:
+            packed = (packed << np.uint64(32)) | records[keys[1]]
+        order = np.argsort(packed, kind="stable")
+        packed = packed[order]
+        starts = np.flatnonzero(np.concatenate(([True], packed[1:] != packed[:-1])))
+    else:
+        order = np.lexsort([records[k] for k in reversed(keys)])
+        change = np.zeros(len(records), dtype=bool)
+        change[0] = True
+        for k in keys:
+            col = records[k][order]
+            change[1:] |= col[1:] != col[:-1]
+        starts = np.flatnonzero(change)
+    out = np.empty(len(starts), dtype=dtype)
+    for k in keys:
+        out[k] = records[k][order[starts]]
+    for v in values:
+        out[v] = np.add.reduceat(records[v][order], starts, dtype=np.uint64)
+    return out
+
+
+def _dense_sum(np, idx, col, size: int):
+    """Exact 64-bit per-index sums of ``col`` using float ``bincount``."""
+    if int(col.max()) * len(col) < 1 << 53:
+        return np.bincount(idx, weights=col, minlength=size).astype(np.uint64)
+    # too large for a double: sum 22-bit limbs, each exact below 2**31 rows
+    total = np.zeros(size, dtype=np.uint64)
+    for shift in (0, 22, 44):
+        limb = (col.astype(np.uint64) >> np.uint64(shift)) & np.uint64(0x3FFFFF)
+        part = np.bincount(idx, weights=limb, minlength=size).astype(np.uint64)
+        total += part << np.uint64(shift)
+    return total
+
+
+def top_k(records, field: str, k: int):
+    """The ``k`` records with the largest ``field``, largest first."""
+    np = _np()
+    n = len(records)
+    if k >= n:
+        return sort_by(records, field)
+    if k <= 0:
+        return records[:0]
+    idx = np.argpartition(records[field], n - k)[n - k :]
+    return sort_by(records[idx], field)
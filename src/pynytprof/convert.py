@@ -10,83 +10,65 @@ __all__ = ["to_html", "to_speedscope"]
 
 
 def _parse(path: str) -> tuple[dict, dict, dict, list, list]:
-    data = Path(path).read_bytes()
+    from .reader import _chunks, _mapped, _read_mapped
+
     PREFIX = b"NYTPROF\0"
-    if data.startswith(PREFIX):
+    with _mapped(path) as (data, view):
+        if data[: len(PREFIX)] != PREFIX:
+            d = _read_mapped(data, view)
+            defs = {
+                sid: {"fid": fid, "name": name, "sl": sl, "el": el}
+                for sid, fid, sl, el, name in d["defs"]
+            }
+            return d["attrs"], d["files"], defs, d["calls"], d["records"]
         if len(data) < 20:
             raise ValueError("truncated header")
         version = struct.unpack_from("<I", data, 8)[0]
         if version != 5:
             raise ValueError("bad version")
         header_len = struct.unpack_from("<Q", data, 12)[0]
-        off = 20 + header_len
-    else:
-        from .reader import read
-        d = read(path)
-        defs = {sid: {"fid": fid, "name": name, "sl": sl, "el": el} for sid, fid, sl, el, name in d["defs"]}
-        return d["attrs"], d["files"], defs, d["calls"], d["records"]
-    attrs: dict[str, int] = {}
-    files: dict[int, dict] = {}
-    defs: dict[int, dict] = {}
-    calls: list[tuple[int, int, int, int, int]] = []
-    lines: list[tuple[int, int, int, int, int]] = []
-    first = True
-    while off < len(data):
-        tok = data[off : off + 1].decode()
-        off += 1
-        if first and tok == "P":
-            payload = data[off : off + 16]
-            off += 16
-            first = False
-            length = 16
-        else:
-            length = struct.unpack_from("<I", data, off)[0]
-            off += 4
-            payload = data[off : off + length]
-            off += length
-        if tok == "A":
-            attrs = {
-                k.decode(): int(v)
-                for k, v in (p.split(b"=", 1) for p in payload[:-1].split(b"\0"))
-            }
-        elif tok == "F":
-            p = 0
-            while p + 16 <= length:
-                fid, flags, size, mt = struct.unpack_from("<IIII", payload, p)
-                p += 16
-                end = payload.find(b"\0", p)
-                files[fid] = {
-                    "path": payload[p:end].decode(),
-                    "flags": flags,
-                    "size": size,
-                    "mtime": mt,
+        attrs: dict[str, int] = {}
+        files: dict[int, dict] = {}
+        defs: dict[int, dict] = {}
+        calls: list[tuple[int, int, int, int, int]] = []
+        lines: list[tuple[int, int, int, int, int]] = []
+        for tok, _off, payload in _chunks(data, view, 20 + header_len):
+            length = len(payload)
+            if tok == "A":
+                attrs = {
+                    k.decode(): int(v)
+                    for k, v in (p.split(b"=", 1) for p in bytes(payload[:-1]).split(b"\0"))
                 }
-                p = end + 1
-        elif tok == "D":
-            p = 0
-            while p + 16 <= length:
-                sid, fid, sl, el = struct.unpack_from("<IIII", payload, p)
-                p += 16
-                end = payload.find(b"\0", p)
-                name = payload[p:end].decode()
-                defs[sid] = {"fid": fid, "name": name, "sl": sl, "el": el}
-                p = end + 1
-        elif tok == "C":
-            p = 0
-            rec_size = 28
-            while p + rec_size <= length:
-                fid, line, sid, inc, exc = struct.unpack_from("<IIIQQ", payload, p)
-                calls.append((fid, line, sid, inc, exc))
-                p += rec_size
-        elif tok == "S":
-            p = 0
-            rec_size = 28
-            while p + rec_size <= length:
-                fid, line, callc, inc, exc = struct.unpack_from("<IIIQQ", payload, p)
-                lines.append((fid, line, callc, inc, exc))
-                p += rec_size
-        elif tok == "E":
-            break
+            elif tok == "F":
+                payload = bytes(payload)
+                p = 0
+                while p + 16 <= length:
+                    fid, flags, size, mt = struct.unpack_from("<IIII", payload, p)
+                    p += 16
+                    end = payload.find(b"\0", p)
+                    files[fid] = {
+                        "path": payload[p:end].decode(),
+                        "flags": flags,
+                        "size": size,
+                        "mtime": mt,
+                    }
+                    p = end + 1
+            elif tok == "D":
+                payload = bytes(payload)
+                p = 0
+                while p + 16 <= length:
+                    sid, fid, sl, el = struct.unpack_from("<IIII", payload, p)
+                    p += 16
+                    end = payload.find(b"\0", p)
+                    name = payload[p:end].decode()
+                    defs[sid] = {"fid": fid, "name": name, "sl": sl, "el": el}
+                    p = end + 1
+            elif tok == "C":
+                calls.extend(struct.iter_unpack("<IIIQQ", payload[: length - length % 28]))
+            elif tok == "S":
+                lines.extend(struct.iter_unpack("<IIIQQ", payload[: length - length % 28]))
+            elif tok == "E":
+                break
     return attrs, files, defs, calls, lines
 
 
@@ -1,6 +1,14 @@
 import struct
+from array import array
+
 from .nytprof_tags import NYTP_TAG_STRING, NYTP_TAG_STRING_UTF8
 
+try:
+    from ._ctoken import decode_u32_many as _c_decode_many  # type: ignore
+    from ._ctoken import encode_u32_many as _c_encode_many  # type: ignore
+except ImportError:  # pragma: no cover - optional extension
+    _c_encode_many = _c_decode_many = None
+
 
 def encode_u32(n: int) -> bytes:
     """NYTProf varint encoding for unsigned 32-bit values."""
@@ -44,3 +52,122 @@ def ledouble(x: float) -> bytes:
 def output_str(b: bytes, utf8: bool = False) -> bytes:
     tag = NYTP_TAG_STRING_UTF8 if utf8 else NYTP_TAG_STRING
     return bytes([tag]) + encode_u32(len(b)) + b
+
+
+# Batch varints ------------------------------------------------------------
+#
+# encode_u32_many/decode_u32_many use the _ctoken extension when it is built,
+# NumPy when it is installed, and a plain loop otherwise.
+
+_FIRST_PREFIX = (0x00, 0x80, 0xC0, 0xE0, 0xFF)
+_FIRST_MASK = (0x7F, 0x7F, 0x1F, 0x0F, 0x00)
+
+
+def _encode_u32_many_py(values) -> bytes:
+    out = bytearray()
+    for v in values:
+        if not 0 <= v <= 0xFFFFFFFF:
+            raise OverflowError(f"{v} does not fit in 32 bits")
+        out += encode_u32(v)
+    return bytes(out)
+
+
+def _decode_u32_many_py(buf) -> array:
+    data = memoryview(buf).cast("B")
+    out = array("I")
+    off, n = 0, len(data)
+    while off < n:
+        d = data[off]
+        extra = 0 if d < 0x80 else 1 if d < 0xC0 else 2 if d < 0xE0 else 3 if d < 0xFF else 4
+        if off + 1 + extra > n:
+            raise ValueError(f"truncated varint at offset {off}")
+        v = d & _FIRST_MASK[extra]
+        for b in data[off + 1 : off + 1 + extra]:
+            v = (v << 8) | b
+        out.append(v)
+        off += 1 + extra
+    return out
+
+
+def _encode_u32_many_np(values) -> bytes:
+    import numpy as np
+
+    v = np.asarray(values)
+    if v.size and (v.min() < 0 or v.max() > 0xFFFFFFFF):
+        raise OverflowError("value does not fit in 32 bits")
+    v = v.astype(np.uint64, copy=False).ravel()
+    width = (
+        1
+        + (v >= 0x80).astype(np.int64)
+        + (v >= 0x4000)
+        + (v >= 0x200000)
+        + (v >= 0x10000000)
+    )
+    start = np.cumsum(width) - width
+    out = np.empty(int(width.sum()), dtype=np.uint8)
+    shift = (8 * (width - 1)).astype(np.uint64)
+    prefix = np.array(_FIRST_PREFIX, dtype=np.uint64)[width - 1]
+    out[start] = (prefix | ((v >> shift) & 0xFF)).astype(np.uint8)
+    # byte k of a varint holds bits 8*(width-1-k) and up, big-endian
+    for k in range(1, 5):
+        m = width > k
+        shift = (8 * (width[m] - 1 - k)).astype(np.uint64)
+        out[start[m] + k] = ((v[m] >> shift) & 0xFF).astype(np.uint8)
+    return out.tobytes()
+
+
+def _decode_u32_many_np(buf) -> array:
+    import numpy as np
+
+    b = np.frombuffer(buf, dtype=np.uint8)
+    n = b.size
+    if not n:
+        return array("I")
+    width = (
+        1 + (b >= 0x80).astype(np.int64) + (b >= 0xC0) + (b >= 0xE0) + (b == 0xFF)
+    )
+    # each varint starts where the previous one ends; follow that chain from
+    # offset 0 by pointer doubling, finding every start in log2(count) passes
+    jump = np.append(np.minimum(np.arange(n) + width, n), n)
+    is_start = np.zeros(n + 1, dtype=bool)
+    is_start[0] = True
+    while True:
+        is_start[jump[np.flatnonzero(is_start)]] = True
+        if jump[0] >= n:
+            break
+        jump = jump[jump]
+    starts = np.flatnonzero(is_start[:n])
+    w = width[starts]
+    if starts[-1] + w[-1] != n:
+        raise ValueError(f"truncated varint at offset {int(starts[-1])}")
+    vals = (b[starts] & np.array(_FIRST_MASK, dtype=np.uint8)[w - 1]).astype(np.uint64)
+    for k in range(1, 5):
+        m = w > k
+        vals[m] = (vals[m] << np.uint64(8)) | b[starts[m] + k]
+    return array("I", vals.astype(np.uint32).tobytes())
+
+
+def _numpy_available() -> bool:
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def encode_u32_many(values) -> bytes:
+    """Varint-encode every value of an integer array or sequence, back to back."""
+    if _c_encode_many is not None:
+        return _c_encode_many(values)
+    if _numpy_available():
+        return _encode_u32_many_np(values)
+    return _encode_u32_many_py(values)
+
+
+def decode_u32_many(buf) -> array:
+    """Decode a buffer holding only varints into an ``array('I')``."""
+    if _c_decode_many is not None:
+        return _c_decode_many(buf)
+    if _numpy_available():
+        return _decode_u32_many_np(buf)
+    return _decode_u32_many_py(buf)
@@ -1,7 +1,14 @@
-from pathlib import Path
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import Callable, Iterator
+import mmap
 import struct
 
-__all__ = ["read", "header_scan"]
+from ._deflate import START_DEFLATE, InflateReader
+from ._index import find_index
+
+__all__ = ["read", "header_scan", "iter_chunks", "chunk_index"]
 
 _MAGIC = b"NYTPROF\0"
 _MAJOR = 5
@@ -78,15 +85,32 @@ def header_scan(data: bytes) -> tuple[int, int, int]:
     return header_len, p_pos, first_token_off
 
 
-def read(path: str) -> dict:
-    data = Path(path).read_bytes()
+@contextmanager
+def _mapped(path: str) -> Iterator[tuple[mmap.mmap | bytes, memoryview]]:
+    """Map ``path`` read-only, yielding the mapping and a view over it."""
+    with open(path, "rb") as fh:
+        try:
+            data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files cannot be mapped
+            data = b""
+        view = memoryview(data)
+        try:
+            yield data, view
+        finally:
+            view.release()
+            if isinstance(data, mmap.mmap):
+                try:
+                    data.close()
+                except BufferError:
+                    # payload views still held by the caller keep it mapped
+                    pass
+
+
+def _read_header(data) -> tuple[tuple[int, int], dict, int]:
+    """Parse the banner, returning ``(version, attrs, first_chunk_offset)``."""
     attrs = {}
-    if data.startswith(_ASCII_PREFIX):
-        offset = 0
-        line_end = data.find(b"\n")
-        if line_end == -1:
-            raise ValueError("truncated header")
-        offset = line_end + 1
+    if data[: len(_ASCII_PREFIX)] == _ASCII_PREFIX:
+        offset = len(_ASCII_PREFIX)
         major = _MAJOR
         minor = _MINOR
         while True:
@@ -94,25 +118,25 @@ def read(path: str) -> dict:
                 raise ValueError("truncated header")
             if data[offset : offset + 1] in _CHUNK_START:
                 break
-            pos = offset
+            if data[offset : offset + 1] == START_DEFLATE:
+                # everything after the tag is one deflate stream
+                break
             line_end = data.find(b"\n", offset)
             if line_end == -1:
                 raise ValueError("truncated header")
             line = data[offset:line_end]
-            offset = line_end + 1
             if line == b"":
+                offset = line_end + 1
                 break
-            if line.startswith((b"#", b":", b"!")):
-                if line.startswith(b":") and b"=" in line:
-                    k, v = line[1:].split(b"=", 1)
-                    try:
-                        attrs[k.decode()] = int(v)
-                    except ValueError:
-                        attrs[k.decode()] = v.decode()
-                continue
-            else:
-                offset = pos
+            if not line.startswith((b"#", b":", b"!")):
                 break
+            offset = line_end + 1
+            if line.startswith(b":") and b"=" in line:
+                k, v = line[1:].split(b"=", 1)
+                try:
+                    attrs[k.decode()] = int(v)
+                except ValueError:
+                    attrs[k.decode()] = v.decode()
     else:
         if data[:8] != _MAGIC:
             raise ValueError("bad header")
@@ -139,133 +163,274 @@ def read(path: str) -> dict:
                 attrs[key.decode()] = val.decode()
             if offset < len(data) and data[offset : offset + 1] in _CHUNK_START:
                 break
-    result = {
-        "header": (major, minor),
-        "attrs": attrs,
-        "files": {},
-        "defs": [],
-        "calls": [],
-        "records": [],
-    }
+    return (major, minor), attrs, offset
+
+
+def _walk(
+    read: Callable[[int], memoryview], offset: int, p_size: int = 16
+) -> Iterator[tuple[str, int, memoryview]]:
+    """Split a tag/length/payload stream into chunks.
+
+    ``read(n)`` returns up to ``n`` bytes and ``offset`` is the position of
+    the first tag; the walk ends after ``E`` or cleanly at end of input.
+    The leading P record has no length word; ``p_size`` is its payload size.
+    """
     first = True
-    while offset < len(data):
-        tok = data[offset : offset + 1]
-        if not tok:
-            raise ValueError("unexpected EOF")
-        tok = tok.decode()
+    while True:
+        tag = read(1)
+        if not tag:
+            return
+        tok = chr(tag[0])
         offset += 1
         if first and tok == "P":
-            if offset + 16 > len(data):
-                raise ValueError("truncated payload")
-            payload = data[offset : offset + 16]
-            offset += 16
-            length = 16
             first = False
+            payload = read(p_size)
+            if len(payload) != p_size:
+                raise ValueError("truncated payload")
+        elif tok == "E":
+            yield tok, offset, memoryview(b"")
+            return
         else:
-            if tok == "E":
-                length = 0
-                payload = b""
+            length_b = read(4)
+            if len(length_b) != 4:
+                raise ValueError("truncated length")
+            (length,) = struct.unpack("<I", length_b)
+            offset += 4
+            payload = read(length)
+            if len(payload) != length:
+                raise ValueError("truncated payload")
+        yield tok, offset, payload
+        offset += len(payload)
+
+
+def _p_size(attrs: dict) -> int:
+    """Payload size of the P record: pid, ppid and an NV timestamp."""
+    nv_size = attrs.get("nv_size", 8)
+    if nv_size not in (8, 16):
+        raise ValueError("missing or unsupported nv_size")
+    return 8 + nv_size
+
+
+def _chunks(
+    data, view: memoryview, offset: int, p_size: int = 16
+) -> Iterator[tuple[str, int, memoryview]]:
+    """Walk the chunks of a mapped profile starting at ``offset``."""
+    if data[offset : offset + 1] == START_DEFLATE:
+        data.seek(offset + 1)
+        stream = InflateReader(data)
+        # offsets in a compressed profile count from the start of the stream
+        return _walk(lambda n: memoryview(stream.read(n)), 0, p_size)
+    pos = offset
+
+    def read(n: int) -> memoryview:
+        nonlocal pos
+        out = view[pos : pos + n]
+        pos += len(out)
+        return out
+
+    entries = find_index(data)
+    if entries is None:
+        return _walk(read, offset, p_size)
+    return _indexed(_walk(read, offset, p_size), view, entries)
+
+
+def _indexed(walk, view: memoryview, entries) -> Iterator[tuple[str, int, memoryview]]:
+    """Yield the P record from ``walk``, then every chunk the index lists."""
+    tok, off, payload = next(walk)
+    yield tok, off, payload
+    if entries[0][1] != off + len(payload) + 5:
+        raise ValueError("chunk index does not start after the P record")
+    for tag, offset, length, _count in entries:
+        yield tag, offset, view[offset : offset + length]
+    yield "E", offset + length + 1, view[:0]
+
+
+def chunk_index(path: str) -> list[tuple[str, int, int, int]] | None:
+    """Return the ``(tag, offset, length, count)`` index of a profile.
+
+    Only the end of the file is read.  None means the profile was written
+    without an index (or is compressed, where offsets point into the
+    inflated stream and the trailer cannot be found without inflating).
+    """
+    with _mapped(path) as (data, _view):
+        if not data:
+            return None
+        return find_index(data)
+
+
+def iter_chunks(path: str) -> Iterator[tuple[str, int, memoryview]]:
+    """Yield ``(tag, offset, payload)`` for every chunk of a profile.
+
+    The file is memory-mapped and each payload is a ``memoryview`` into the
+    mapping, so nothing is copied and only the pages that are touched are
+    read.  ``offset`` is where the payload starts in the file; for a
+    compressed profile the stream is inflated incrementally and offsets
+    count from the start of the inflated data instead.  The P record is
+    yielded as its 16 byte payload (``8 + nv_size`` bytes) and ``E`` as an
+    empty one.
+    """
+    with _mapped(path) as (data, view):
+        _version, attrs, offset = _read_header(data)
+        yield from _chunks(data, view, offset, _p_size(attrs))
+
+
+# indexed chunks at least this large are handed to worker processes
+_PARALLEL_MIN = 1 << 20
+
+
+def read(path: str, workers: int | None = None) -> dict:
+    """Decode a profile into a dict of header, attrs, files, defs and records.
+
+    With ``workers`` above 1 and a chunk index in the file, large chunks are
+    decoded in a pool of that many processes; results are merged in file
+    order, so the dict is the same as a sequential read.
+    """
+    with _mapped(path) as (data, view):
+        return _read_mapped(data, view, path if workers and workers > 1 else None, workers)
+
+
+def _new_result(header=None, attrs=None) -> dict:
+    return {
+        "header": header,
+        "attrs": {} if attrs is None else attrs,
+        "files": {},
+        "defs": [],
+        "calls": [],
+        "records": [],
+    }
+
+
+def _read_mapped(
+    data, view: memoryview, path: str | None = None, workers: int | None = None
+) -> dict:
+    header, attrs, offset = _read_header(data)
+    result = _new_result(header, attrs)
+    chunks = _chunks(data, view, offset, _p_size(attrs))
+    if path is not None and data[offset : offset + 1] != START_DEFLATE and find_index(data):
+        return _read_parallel(result, chunks, path, workers)
+    for tok, _off, payload in chunks:
+        _read_chunk(result, tok, payload)
+        if tok == "E":
+            break
+    return result
+
+
+def _decode_range(path: str, tok: str, offset: int, length: int) -> dict:
+    """Worker side of a parallel read: decode one chunk into a partial result."""
+    part = _new_result()
+    with _mapped(path) as (_data, view):
+        payload = view[offset : offset + length]
+        try:
+            _read_chunk(part, tok, payload)
+        finally:
+            payload.release()
+    return part
+
+
+def _merge(result: dict, part: dict) -> None:
+    result["attrs"].update(part["attrs"])
+    result["files"].update(part["files"])
+    result["defs"].extend(part["defs"])
+    result["calls"].extend(part["calls"])
+    result["records"].extend(part["records"])
+    if "data" in part:
+        result.setdefault("data", []).extend(part["data"])
+
+
+def _read_parallel(result: dict, chunks, path: str, workers: int) -> dict:
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        parts = []
+        for tok, off, payload in chunks:
+            if tok in "SCDF" and len(payload) >= _PARALLEL_MIN:
+                parts.append(pool.submit(_decode_range, path, tok, off, len(payload)))
             else:
-                if offset + 4 > len(data):
-                    raise ValueError("truncated length")
-                length = struct.unpack_from("<I", data, offset)[0]
-                offset += 4
-                if offset + length > len(data):
-                    raise ValueError("truncated payload")
-                payload = data[offset : offset + length]
-                offset += length
-
-        if tok == "A":
-            if not payload or payload[-1] != 0:
-                raise ValueError("attrs not nul terminated")
-            for item in payload[:-1].split(b"\0"):
-                if b"=" not in item:
-                    raise ValueError("bad attr")
-                k, v = item.split(b"=", 1)
-                result["attrs"][k.decode()] = int(v)
-        elif tok == "P":
-            if len(payload) != 16:
-                raise ValueError("bad P length")
-            pid, ppid, ts = struct.unpack_from("<IId", payload, 0)
-            result["attrs"].update({"pid": pid, "ppid": ppid, "timestamp": ts})
-        elif tok == "F":
-            if length % 8 != 0:
-                raise ValueError("bad F record")
-            p = 0
+                part = _new_result()
+                _read_chunk(part, tok, payload)
+                parts.append(part)
+        for part in parts:
+            _merge(result, part if isinstance(part, dict) else part.result())
+    return result
+
+
+def _read_chunk(result: dict, tok: str, payload: memoryview) -> None:
+    length = len(payload)
+    if tok == "A":
+        if not payload or payload[-1] != 0:
+            raise ValueError("attrs not nul terminated")
+        for item in bytes(payload[:-1]).split(b"\0"):
+            if b"=" not in item:
+                raise ValueError("bad attr")
+            k, v = item.split(b"=", 1)
+            result["attrs"][k.decode()] = int(v)
+    elif tok == "P":
+        if length != 16:
+            raise ValueError("bad P length")
+        pid, ppid, ts = struct.unpack_from("<IId", payload, 0)
+        result["attrs"].update({"pid": pid, "ppid": ppid, "timestamp": ts})
+    elif tok == "F":
+        if length % 8 != 0:
+            raise ValueError("bad F record")
+        for fid, stridx in struct.iter_unpack("<II", payload):
+            result["files"][fid] = {"string_index": stridx}
+    elif tok == "S":
+        if length % 28 != 0:
+            raise ValueError("bad S length")
+        result["records"].extend(struct.iter_unpack("<IIIQQ", payload))
+    elif tok == "D":
+        payload = bytes(payload)
+        p = 0
+        first_def = len(result["defs"])
+        if length and payload[0] <= 7:
             while p < length:
-                fid, stridx = struct.unpack_from("<II", payload, p)
-                result["files"][fid] = {"string_index": stridx}
-                p += 8
-            if p != length:
-                raise ValueError("bad F length")
-        elif tok == "S":
-            p = 0
-            rec_size = 28
-            while p + rec_size <= length:
-                fid, line, calls, inc, exc = struct.unpack_from("<IIIQQ", payload, p)
-                result["records"].append((fid, line, calls, inc, exc))
-                p += rec_size
+                tok_b = payload[p]
+                p += 1
+                if tok_b == 0:
+                    break
+                if tok_b != 1 or p + 16 > length:
+                    raise ValueError("bad D record")
+                fid, line, dur = struct.unpack_from("<IIQ", payload, p)
+                p += 16
+                result.setdefault("data", []).append((fid, line, dur))
             if p != length:
-                raise ValueError("bad S length")
-        elif tok == "D":
-            p = 0
-            if length and payload[0] <= 7:
+                raise ValueError("bad D length")
+        else:
+            try:
                 while p < length:
-                    tok_b = payload[p]
-                    p += 1
-                    if tok_b == 0:
-                        break
-                    if tok_b != 1 or p + 16 > length:
-                        raise ValueError("bad D record")
-                    fid, line, dur = struct.unpack_from("<IIQ", payload, p)
+                    if p + 16 > length:
+                        raise ValueError
+                    sid, fid, sl, el = struct.unpack_from("<IIII", payload, p)
                     p += 16
-                    result.setdefault("data", []).append((fid, line, dur))
+                    end = payload.find(b"\0", p)
+                    if end == -1 or end >= length:
+                        raise ValueError
+                    name = payload[p:end].decode()
+                    p = end + 1
+                    result["defs"].append((sid, fid, sl, el, name))
+                if p != length:
+                    raise ValueError
+            except Exception:
+                del result["defs"][first_def:]
+                p = 0
+                while p < length:
+                    if p + 8 > length:
+                        raise ValueError("bad D record")
+                    sid, flags = struct.unpack_from("<II", payload, p)
+                    p += 8
+                    end = payload.find(b"\0", p)
+                    if end == -1 or end >= length:
+                        raise ValueError("bad D name")
+                    name = payload[p:end].decode()
+                    p = end + 1
+                    result["defs"].append((sid, flags, 0, 0, name))
                 if p != length:
                     raise ValueError("bad D length")
-            else:
-                try:
-                    while p < length:
-                        if p + 16 > length:
-                            raise ValueError
-                        sid, fid, sl, el = struct.unpack_from("<IIII", payload, p)
-                        p += 16
-                        end = payload.find(b"\0", p)
-                        if end == -1 or end >= length:
-                            raise ValueError
-                        name = payload[p:end].decode()
-                        p = end + 1
-                        result["defs"].append((sid, fid, sl, el, name))
-                    if p != length:
-                        raise ValueError
-                except Exception:
-                    result["defs"].clear()
-                    p = 0
-                    while p < length:
-                        if p + 8 > length:
-                            raise ValueError("bad D record")
-                        sid, flags = struct.unpack_from("<II", payload, p)
-                        p += 8
-                        end = payload.find(b"\0", p)
-                        if end == -1 or end >= length:
-                            raise ValueError("bad D name")
-                        name = payload[p:end].decode()
-                        p = end + 1
-                        result["defs"].append((sid, flags, 0, 0, name))
-                    if p != length:
-                        raise ValueError("bad D length")
-        elif tok == "C":
-            p = 0
-            rec_size = 28
-            while p + rec_size <= length:
-                fid, line, sid, inc, exc = struct.unpack_from("<IIIQQ", payload, p)
-                result["calls"].append((fid, line, sid, inc, exc))
-                p += rec_size
-            if p != length:
-                raise ValueError("bad C length")
-        elif tok == "E":
-            if length != 0:
-                raise ValueError("bad E length")
-            break
-        else:
-            raise ValueError(f"unknown token {tok}")
-    return result
+    elif tok == "C":
+        if length % 28 != 0:
+            raise ValueError("bad C length")
+        result["calls"].extend(struct.iter_unpack("<IIIQQ", payload))
+    elif tok in ("E", "X"):  # X is the optional chunk index
+        pass
+    else:
+        raise ValueError(f"unknown token {tok}")
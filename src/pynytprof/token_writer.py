@@ -80,3 +80,65 @@ class TokenWriter:
         out += encode_u32(fid)
         out += encode_u32(line_no)
         return bytes(out)
+
+
+class TokenEncoder:
+    """Accumulate encoded tokens in one growable buffer.
+
+    Pure Python counterpart of ``_ctoken.Encoder``; both produce the same
+    bytes.  :meth:`take` returns everything encoded so far and starts over.
+    """
+
+    def __init__(self) -> None:
+        self._buf = bytearray()
+        self._tok = TokenWriter()
+
+    def new_fid(
+        self,
+        fid: int,
+        eval_fid: int,
+        eval_line: int,
+        flags: int,
+        size: int,
+        mtime: int,
+        path: str | bytes,
+    ) -> None:
+        self._buf += self._tok.write_new_fid(fid, eval_fid, eval_line, flags, size, mtime, path)
+
+    def time_line(self, fid: int, line: int, elapsed: int, overflow: int = 0) -> None:
+        self._buf.append(NYTP_TAG_TIME_LINE)
+        self._buf += encode_i32(elapsed & 0xFFFFFFFF)
+        self._buf += encode_u32(fid)
+        self._buf += encode_u32(line)
+
+    def time_lines(self, fids, lines, elapsed) -> None:
+        """Encode one TIME_LINE token per index of three parallel arrays."""
+        if not len(fids) == len(lines) == len(elapsed):
+            raise ValueError("fids, lines and elapsed differ in length")
+        out = bytearray()
+        for fid, line, dt in zip(fids, lines, elapsed):
+            out.append(NYTP_TAG_TIME_LINE)
+            out += encode_i32(dt & 0xFFFFFFFF)
+            out += encode_u32(fid)
+            out += encode_u32(line)
+        self._buf += out
+
+    def string(self, data: bytes | str, utf8: bool = False) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+            utf8 = True
+        self._buf += output_str_py(data, utf8=utf8)
+
+    def raw(self, data: bytes) -> None:
+        self._buf += data
+
+    def take(self) -> bytes:
+        out = bytes(self._buf)
+        self._buf.clear()
+        return out
+
+    def clear(self) -> None:
+        self._buf.clear()
+
+    def __len__(self) -> int:
+        return len(self._buf)
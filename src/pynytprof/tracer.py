@@ -10,12 +10,18 @@ import sys
 import time
 import argparse
 import collections
+import math
+import random
+import threading
+import weakref
+from array import array
 from pathlib import Path
 from fnmatch import fnmatch
-from types import FrameType
+from types import CodeType, FrameType
 from typing import Any, Dict, List
 import struct
 
+from ._pywrite import FidRegistry
 from ._writer import WRITER as Writer
 
 try:
@@ -41,22 +47,30 @@ if not _force_py:
         except ModuleNotFoundError:  # pragma: no cover - optional
             continue
 
-__all__ = ["profile", "cli", "profile_script", "main", "profile_command"]
+__all__ = ["profile", "cli", "profile_script", "main", "profile_command", "Profiler"]
 TICKS_PER_SEC = 10_000_000  # 100 ns per tick
 
 _results: Dict[int, List[int]] = {}
+# (fid, line) -> [calls, inc_ticks, exc_ticks, stmt_ns]
 _line_hits: Dict[tuple[int, int], list[int]]
 _calls: collections.Counter[tuple[str, str]]
 _call_time_ns: collections.Counter[str]
 _edge_time_ns: collections.Counter[tuple[str, str]]
-_last_ts: int = 0
-_stack: list[tuple[int | None, int]]
-_call_stack: list[tuple[str, int]]
 _start_ns: int = 0
 _script_path: Path
 _filters = [p for p in os.environ.get("NYTPROF_FILTER", "").split(",") if p]
 _emitted_f: bool = False
-_stmt_records: list[tuple[int, int, int]]
+# id(code) -> (resolved path, in scope, fid, weakref to code)
+_code_info: dict[int, tuple[str, bool, int, weakref.ref]] = {}
+_files = FidRegistry()
+_PKG_DIR = str(Path(__file__).resolve().parent) + os.sep
+_tls = threading.local()
+_thread_states: list[_ThreadState] = []
+_thread_states_lock = threading.Lock()
+# NYTPROF_SAMPLE_STRIDE: line events per timed one, 1 times every event;
+# with NYTPROF_SAMPLE_RANDOM=1 each event is timed with probability 1/stride
+_sample_stride = 1
+_sample_log_q = 0.0
 
 
 def _match(path: str) -> bool:
@@ -65,6 +79,33 @@ def _match(path: str) -> bool:
     return any(fnmatch(path, pat) for pat in _filters)
 
 
+def _resolve_code(code: CodeType) -> tuple[str, bool, int, weakref.ref]:
+    """Resolve ``code`` once and cache the verdict until it is collected.
+
+    The cache is keyed by ``id(code)`` rather than the code object itself:
+    hashing a code object walks its constants, and equal code objects from
+    different files would share an entry.  The stored weakref drops the
+    entry when the code object dies, before its id can be reused.
+    """
+    key = id(code)
+    path = str(Path(code.co_filename).resolve())
+    if path == str(_script_path):
+        in_scope = _match(path)
+    else:
+        # other files are only profiled when NYTPROF_FILTER selects them
+        in_scope = (
+            bool(_filters)
+            and not code.co_filename.startswith("<")
+            and not path.startswith(_PKG_DIR)
+            and _match(path)
+        )
+    fid = _files.register(path) if in_scope else 0
+    ref = weakref.ref(code, lambda _ref: _code_info.pop(key, None))
+    info = (path, in_scope, fid, ref)
+    _code_info[key] = info
+    return info
+
+
 def _emit_f(writer: Writer) -> None:
     global _emitted_f
     if _emitted_f:
@@ -98,8 +139,65 @@ def _emit_p(writer: Writer) -> None:
     writer.write_chunk(b"P", payload)
 
 
-def _write_nytprof(out_path: Path) -> None:
+def _stmt_records(
+    fid_map: dict[int, int], line_hits: dict[tuple[int, int], list[int]] | None = None
+) -> list[tuple[int, int, int]]:
+    """Return one ``(fid, line, stmt_ns)`` record per executed line.
+
+    Statement time is summed per line as events arrive, so memory is bounded
+    by the number of distinct lines rather than the number of line events.
+    """
+    if line_hits is None:
+        line_hits = _line_hits
+    return [
+        (fid_map[fid], line, rec[3])
+        for (fid, line), rec in sorted(line_hits.items())
+        if rec[0]
+    ]
+
+
+def _load_sampling() -> None:
+    """Read ``NYTPROF_SAMPLE_STRIDE`` and ``NYTPROF_SAMPLE_RANDOM``."""
+    global _sample_stride, _sample_log_q
+    try:
+        stride = int(os.environ.get("NYTPROF_SAMPLE_STRIDE") or 1)
+    except ValueError:
+        stride = 1
+    _sample_stride = max(1, stride)
+    if _sample_stride > 1 and os.environ.get("NYTPROF_SAMPLE_RANDOM") == "1":
+        _sample_log_q = math.log1p(-1.0 / _sample_stride)
+    else:
+        _sample_log_q = 0.0
+
+
+def _next_skip() -> int:
+    """Line events to skip before the next timed one."""
+    if _sample_log_q:
+        # geometric gap, so every event is timed with probability 1/stride
+        return int(math.log(1.0 - random.random()) / _sample_log_q)
+    return _sample_stride - 1
+
+
+def _compress_level() -> int:
+    """zlib level from ``PYNYTPROF_COMPRESS``; 0 writes an uncompressed file."""
+    from ._deflate import check_level
+
+    return check_level(os.environ.get("PYNYTPROF_COMPRESS") or 0)
+
+
+def _index_requested() -> bool:
+    """``PYNYTPROF_INDEX=1`` asks chunk writers for a trailing chunk index."""
+    return os.environ.get("PYNYTPROF_INDEX") == "1"
+
+
+def _open_writer(out_path: Path, buffer_size: int | None = None):
     outer_chunks = os.getenv("PYNYTPROF_OUTER_CHUNKS", "0") == "1"
+    extra = {"buffer_size": buffer_size} if buffer_size else {}
+    level = _compress_level()
+    if level:
+        extra["compress"] = level
+    if _index_requested():
+        extra["index"] = True
     try:
         w = Writer(
             str(out_path),
@@ -107,72 +205,223 @@ def _write_nytprof(out_path: Path) -> None:
             ticks_per_sec=TICKS_PER_SEC,
             script_path=str(_script_path),
             outer_chunks=outer_chunks,
+            **extra,
         )
     except TypeError:
         w = Writer(
             str(out_path),
             start_ns=_start_ns,
             ticks_per_sec=TICKS_PER_SEC,
+            **extra,
         )
     if os.environ.get("PYNYTPROF_DEBUG"):
         print(
             f"USING WRITER: {w.__class__.__module__}.{w.__class__.__name__}",
             file=sys.stderr,
         )
+    if os.environ.get("PYNYTPROF_WRITER_THREAD") == "1":
+        from ._bgwrite import BackgroundWriter
+
+        w = BackgroundWriter(w, buffer_size=buffer_size or _STREAM_BUFFER)
+    return w
+
+
+def _register_files(w, fid_map: dict[int, int]) -> None:
+    """Announce files registered since the last call and extend ``fid_map``."""
+    from pynytprof.protocol import write_u32
+
+    new = [(path, fid) for path, fid in _files.items() if fid not in fid_map]
+    if not new:
+        return
+    if hasattr(w, "_register_file"):
+        for path, fid in new:
+            fid_map[fid] = w._register_file(path)
+            w._emit_new_fid(fid_map[fid], path)
+        return
+    f_buf = bytearray()
+    for path, fid in new:
+        fid_map[fid] = fid
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        f_buf += write_u32(fid)
+        f_buf += write_u32(0x10)
+        f_buf += write_u32(st.st_size)
+        f_buf += write_u32(int(st.st_mtime))
+        f_buf += path.encode() + b"\0"
+    if f_buf:
+        w.write_chunk(b"F", bytes(f_buf))
+
+
+# TIME_LINE tokens handed to the writer per write_time_lines call
+_TIME_LINE_BATCH = 1 << 16
+# largest elapsed time a TIME_LINE token holds
+_I32_MAX = (1 << 31) - 1
+
+
+def _write_time_lines(w, fid_map: dict[int, int], line_hits) -> bool:
+    """Write ``line_hits`` as TIME_LINE tokens through ``w.write_time_lines``.
+
+    Each executed line gets one token carrying its summed statement time; a
+    time past the token's i32 range is split over several tokens.  Returns
+    whether any token was written.
+    """
+    fids, lines, elapsed = array("I"), array("I"), array("q")
+    written = False
+    for (fid, line), (calls, _inc, _exc, stmt_ns) in sorted(line_hits.items()):
+        if not calls:
+            continue
+        fid = fid_map[fid]
+        ticks = stmt_ns * TICKS_PER_SEC // 1_000_000_000
+        while True:
+            fids.append(fid)
+            lines.append(line)
+            elapsed.append(min(ticks, _I32_MAX))
+            ticks -= elapsed[-1]
+            if len(fids) == _TIME_LINE_BATCH:
+                w.write_time_lines(fids, lines, elapsed)
+                written = True
+                fids, lines, elapsed = array("I"), array("I"), array("q")
+            if not ticks:
+                break
+    if fids:
+        w.write_time_lines(fids, lines, elapsed)
+        written = True
+    return written
+
+
+def _write_line_records(w, fid_map: dict[int, int], line_hits) -> bool:
+    """Write S records and statement times for ``line_hits``.
+
+    Token writers get TIME_LINE tokens; chunk writers get an S chunk plus the
+    statement times, either through the writer's ``_stmt_records`` hook or as
+    a D chunk.  Returns whether statement times went out.
+    """
+    from pynytprof.protocol import write_u32
+
+    if _sample_stride > 1:
+        # each timed line event stands for _sample_stride events
+        line_hits = {key: [v * _sample_stride for v in rec] for key, rec in line_hits.items()}
+    if hasattr(w, "write_time_lines"):
+        # the token stream has no S or D chunk; write_chunk would drop them
+        return _write_time_lines(w, fid_map, line_hits)
+    emitted_d = False
+    d_payload = b""
+    stmt_records = _stmt_records(fid_map, line_hits)
+    if hasattr(w, "_stmt_records"):
+        w._stmt_records.extend(stmt_records)
+        emitted_d = bool(stmt_records)
+    elif stmt_records:
+        buf = bytearray()
+        for fid, line, dur in stmt_records:
+            buf.append(1)
+            buf += write_u32(fid)
+            buf += write_u32(line)
+            buf += struct.pack("<Q", dur)
+        buf.append(0)
+        d_payload = bytes(buf)
+        emitted_d = True
+
+    payload = bytearray()
+    for (fid, line), (calls, inc, exc, _) in sorted(line_hits.items()):
+        payload += write_u32(fid_map[fid])
+        payload += write_u32(line)
+        payload += write_u32(calls)
+        payload += struct.pack("<QQ", inc, exc)
+    if payload:
+        w.write_chunk(b"S", bytes(payload))
+    if d_payload:
+        w.write_chunk(b"D", d_payload)
+    return emitted_d
+
+
+# Streaming ----------------------------------------------------------------
+#
+# With PYNYTPROF_STREAM=N the writer is opened before the script runs and a
+# thread writes its line aggregates as soon as it holds N distinct lines, then
+# starts a fresh table.  Memory stays bounded and a crashed run leaves every
+# flushed record on disk: TIME_LINE tokens with the token writer, S chunks with
+# chunk writers.  Readers sum repeated records for the same line.
+
+_STREAM_LINES = 4096
+_STREAM_BUFFER = 1 << 20
+
+
+class _Stream:
+    """Writer shared by every thread of a streaming run."""
+
+    __slots__ = ("writer", "limit", "fid_map", "lock", "emitted_d")
+
+    def __init__(self, writer, limit: int) -> None:
+        self.writer = writer
+        self.limit = limit
+        self.fid_map: dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.emitted_d = False
+
+
+_stream: _Stream | None = None
+
+
+def _stream_limit() -> int:
+    """Distinct lines a thread buffers before streaming them; 0 disables."""
+    raw = os.environ.get("PYNYTPROF_STREAM", "")
+    if raw in ("", "0"):
+        return 0
+    try:
+        return max(1, int(raw))
+    except ValueError:
+        return _STREAM_LINES
+
+
+def _start_stream(out_path: Path) -> None:
+    global _stream
+    limit = _stream_limit()
+    if not limit:
+        _stream = None
+        return
+    w = _open_writer(out_path, buffer_size=_STREAM_BUFFER)
     w.__enter__()
+    _stream = _Stream(w, limit)
+
+
+def _stream_flush(st: "_ThreadState") -> None:
+    """Write a thread's line aggregates and give it an empty table."""
+    stream = _stream
+    if stream is None:
+        return
+    with stream.lock:
+        w = stream.writer
+        _register_files(w, stream.fid_map)
+        if _write_line_records(w, stream.fid_map, st.line_hits):
+            stream.emitted_d = True
+        flush = getattr(w, "flush", None)
+        if flush is not None:
+            flush()
+    st.line_hits = {}
+
+
+def _write_nytprof(out_path: Path, stream: _Stream | None = None) -> None:
+    global _stream
+    if stream is None:
+        w = _open_writer(out_path)
+        w.__enter__()
+        fid_map: dict[int, int] = {}
+        emitted_d = False
+    else:
+        # header and earlier chunks are already on disk
+        w = stream.writer
+        fid_map = stream.fid_map
+        emitted_d = stream.emitted_d
     try:
         import struct
         from pynytprof.protocol import write_u32
 
-        emitted_d = False
-        d_payload = b""
-
-        has_register = hasattr(w, "_register_file")
-        if has_register:
-            fid = w._register_file(str(_script_path))
-        else:
-            fid = 0
-            try:
-                st = os.stat(_script_path)
-                f_buf = bytearray()
-                f_buf += write_u32(fid)
-                f_buf += write_u32(0x10)
-                f_buf += write_u32(st.st_size)
-                f_buf += write_u32(int(st.st_mtime))
-                f_buf += str(_script_path).encode() + b"\0"
-                f_payload = bytes(f_buf)
-                w.write_chunk(b"F", f_payload)
-            except OSError:
-                pass
-
-        if hasattr(w, "_stmt_records"):
-            w._stmt_records.extend(_stmt_records)
-            emitted_d = bool(_stmt_records)
-        elif _stmt_records:
-            from pynytprof.protocol import write_u32
-
-            buf = bytearray()
-            for _, line, dur in _stmt_records:
-                buf.append(1)
-                buf += write_u32(fid)
-                buf += write_u32(line)
-                buf += struct.pack("<Q", dur)
-            buf.append(0)
-            d_payload = bytes(buf)
+        _register_files(w, fid_map)
+        if _write_line_records(w, fid_map, _line_hits):
             emitted_d = True
 
-        payload = bytearray()
-        for (_, line), (calls, inc, exc) in sorted(_line_hits.items()):
-            payload += write_u32(fid)
-            payload += write_u32(line)
-            payload += write_u32(calls)
-            payload += struct.pack("<QQ", inc, exc)
-        payload = bytes(payload)
-        if payload:
-            w.write_chunk(b"S", payload)
-        if d_payload:
-            w.write_chunk(b"D", d_payload)
-
         emitted_c = False
         if _calls:
             id_map = {}
@@ -198,198 +447,779 @@ def _write_nytprof(out_path: Path) -> None:
         if not emitted_c:
             w.write_chunk(b"C", b"")
     finally:
+        if stream is not None:
+            # before closing: a failed background writer raises from close()
+            _stream = None
         if getattr(w, "finalize", None):
             w.finalize()
         elif getattr(w, "close", None):
             w.close()
 
 
-def _write_nytprof_vec(out_path: Path, files, defs, calls, lines) -> None:
+def _f_payload(paths) -> bytes:
+    """Pack ``<IIII`` + path F records for ``paths``; fid N is ``paths[N - 1]``."""
+    buf = bytearray()
+    for fid, path in enumerate(paths, 1):
+        try:
+            st = os.stat(path)
+            size, mtime = st.st_size, int(st.st_mtime)
+        except OSError:  # pseudo files such as "<frozen ...>"
+            size, mtime = 0, 0
+        buf += struct.pack("<IIII", fid, 0x10, size, mtime)
+        buf += path.encode() + b"\0"
+    return bytes(buf)
+
+
+def _write_nytprof_vec(
+    out_path: Path, paths, s_payload, d_payload, c_payload, dropped: int = 0
+) -> None:
+    """Write chunk payloads packed by ``_ctrace.dump_packed``.
+
+    Chunk writers take the payloads without unpacking them; a token writer
+    gets the S records as TIME_LINE tokens.
+    """
     outer_chunks = os.getenv("PYNYTPROF_OUTER_CHUNKS", "0") == "1"
-    with Writer(
-        str(out_path),
-        start_ns=_start_ns,
-        ticks_per_sec=TICKS_PER_SEC,
-        outer_chunks=outer_chunks,
-    ) as w:
+    # truncated line data must never go unnoticed, so always report the count
+    attrs = {"pynytprof_dropped": dropped}
+    level = _compress_level()
+    extra = {"compress": level} if level else {}
+    if _index_requested():
+        extra["index"] = True
+    try:
+        w = Writer(
+            str(out_path),
+            start_ns=_start_ns,
+            ticks_per_sec=TICKS_PER_SEC,
+            script_path=str(_script_path),
+            outer_chunks=outer_chunks,
+            attrs=attrs,
+            **extra,
+        )
+    except TypeError:
+        w = Writer(
+            str(out_path),
+            start_ns=_start_ns,
+            ticks_per_sec=TICKS_PER_SEC,
+            attrs=attrs,
+            **extra,
+        )
+    if dropped:
+        warnings.warn(
+            f"pynytprof: {dropped} line samples were dropped; profile is incomplete",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+    with w:
         if os.environ.get("PYNYTPROF_DEBUG"):
             print(
                 f"USING WRITER: {w.__class__.__module__}.{w.__class__.__name__}",
                 file=sys.stderr,
             )
-        if lines:
-            s_payload = b"".join(
-                struct.pack("<IIIQQ", fid, line, cnt, inc // 100, exc // 100)
-                for fid, line, cnt, inc, exc in lines
-            )
+        if hasattr(w, "write_time_lines"):
+            # token writer: S records become TIME_LINE tokens, fid N is paths[N - 1]
+            fid_map = {}
+            for fid, path in enumerate(paths, 1):
+                fid_map[fid] = w._register_file(path)
+                w._emit_new_fid(fid_map[fid], path)
+            line_hits = {
+                (fid, line): [calls, inc, exc, inc * 100]
+                for fid, line, calls, inc, exc in struct.iter_unpack("<IIIQQ", s_payload)
+            }
+            _write_time_lines(w, fid_map, line_hits)
+            return
+        if paths:
+            w.write_chunk(b"F", _f_payload(paths))
+        if s_payload:
             w.write_chunk(b"S", s_payload)
-
-        if defs:
-            d_payload = b"".join(
-                struct.pack("<IIII", sid, fid, sl, el) + name.encode() + b"\0"
-                for sid, fid, sl, el, name in defs
-            )
+        if d_payload:
             w.write_chunk(b"D", d_payload)
-
-        if calls:
-            c_payload = b"".join(
-                struct.pack("<IIIQQ", fid, line, sid, inc // 100, exc // 100)
-                for fid, line, sid, inc, exc in calls
-            )
+        if c_payload:
             w.write_chunk(b"C", c_payload)
 
 
-def _trace(frame: FrameType, event: str, arg: Any) -> Any:
-    global _last_ts
-    path = str(Path(frame.f_code.co_filename).resolve())
-    if path != str(_script_path):
-        return _trace
-    if not _match(path):
-        return _trace
-    now = time.perf_counter_ns()
-    if event == "call":
-        callee = frame.f_code.co_name
-        caller = frame.f_back.f_code.co_name if frame.f_back else "<toplevel>"
-        _calls[(caller, callee)] += 1
-        _stack.append((None, now))
-        _call_stack.append((callee, now))
-    elif event == "return":
-        if _stack:
-            lineno, start = _stack.pop()
+class _ThreadState:
+    """Shadow stacks, clock and aggregates owned by a single thread.
+
+    Every thread records into its own instance so interleaved events from
+    other threads never touch its stacks or timestamps.  The per-thread
+    aggregates are summed by :func:`_merge_thread_states` at dump time.
+    """
+
+    __slots__ = (
+        "stack",
+        "call_stack",
+        "last_ts",
+        "line_hits",
+        "calls",
+        "call_time_ns",
+        "edge_time_ns",
+        "flush_at",
+        "skip",
+    )
+
+    def __init__(self) -> None:
+        self.stack: list[tuple[tuple[int, int] | None, int]] = []
+        self.call_stack: list[tuple[str, int]] = []
+        self.last_ts = time.perf_counter_ns()
+        self.line_hits: dict[tuple[int, int], list[int]] = {}
+        self.calls: collections.Counter[tuple[str, str]] = collections.Counter()
+        self.call_time_ns: collections.Counter[str] = collections.Counter()
+        self.edge_time_ns: collections.Counter[tuple[str, str]] = collections.Counter()
+        self.flush_at = _stream.limit if _stream is not None else sys.maxsize
+        self.skip = 0
+
+    def on_call(self, callee: str, caller: str) -> None:
+        now = time.perf_counter_ns()
+        self.calls[(caller, callee)] += 1
+        self.stack.append((None, now))
+        self.call_stack.append((callee, now))
+
+    def on_return(self) -> None:
+        now = time.perf_counter_ns()
+        stack = self.stack
+        line_hits = self.line_hits
+        if stack:
+            key, start = stack.pop()
             delta = now - start
-            if lineno is not None:
-                key = (0, lineno)
-                rec = _line_hits.get(key)
+            if key is not None:
+                rec = line_hits.get(key)
                 if rec is None:
-                    rec = [0, 0, 0]
-                    _line_hits[key] = rec
+                    rec = [0, 0, 0, 0]
+                    line_hits[key] = rec
                 rec[2] += delta // 100
-            if _stack:
-                c_line, c_start = _stack[-1]
-                if c_line is not None:
-                    ckey = (0, c_line)
-                    crec = _line_hits.get(ckey)
+            if stack:
+                ckey, c_start = stack[-1]
+                if ckey is not None:
+                    crec = line_hits.get(ckey)
                     if crec is None:
-                        crec = [0, 0, 0]
-                        _line_hits[ckey] = crec
+                        crec = [0, 0, 0, 0]
+                        line_hits[ckey] = crec
                     crec[1] += (now - c_start) // 100
-                    _stack[-1] = (c_line, now)
-        _last_ts = now
-        if _call_stack:
-            func, start = _call_stack.pop()
+                    stack[-1] = (ckey, now)
+        self.last_ts = now
+        call_stack = self.call_stack
+        if call_stack:
+            func, start = call_stack.pop()
             dur = now - start
-            _call_time_ns[func] += dur
-            if _call_stack:
-                caller = _call_stack[-1][0]
-                _edge_time_ns[(caller, func)] += dur
-    elif event == "line":
-        delta = now - _last_ts
-        lineno = frame.f_lineno
-        key = (0, lineno)
-        rec = _line_hits.get(key)
+            self.call_time_ns[func] += dur
+            if call_stack:
+                caller = call_stack[-1][0]
+                self.edge_time_ns[(caller, func)] += dur
+
+    def on_line(self, fid: int, lineno: int) -> None:
+        now = time.perf_counter_ns()
+        delta = now - self.last_ts
+        key = (fid, lineno)
+        line_hits = self.line_hits
+        rec = line_hits.get(key)
         if rec is None:
-            rec = [0, 0, 0]
-            _line_hits[key] = rec
+            rec = [0, 0, 0, 0]
+            line_hits[key] = rec
         rec[0] += 1
         rec[1] += delta // 100
-        _stmt_records.append((0, lineno, delta))
-        _last_ts = now
-        if _stack:
-            pline, pstart = _stack[-1]
-            if pline is not None:
-                pkey = (0, pline)
-                prec = _line_hits.get(pkey)
+        rec[3] += delta
+        self.last_ts = now
+        stack = self.stack
+        if stack:
+            pkey, pstart = stack[-1]
+            if pkey is not None:
+                prec = line_hits.get(pkey)
                 if prec is None:
-                    prec = [0, 0, 0]
-                    _line_hits[pkey] = prec
+                    prec = [0, 0, 0, 0]
+                    line_hits[pkey] = prec
                 prec[2] += (now - pstart) // 100
-            _stack[-1] = (frame.f_lineno, now)
+            stack[-1] = (key, now)
+        else:
+            stack.append((key, now))
+        if len(line_hits) >= self.flush_at:
+            _stream_flush(self)
+            # charge the flush to the profiler, not to the next line
+            now = time.perf_counter_ns()
+            self.last_ts = now
+            stack[-1] = (key, now)
+
+    def on_strided_line(self, fid: int, lineno: int) -> None:
+        """``on_line`` for ``NYTPROF_SAMPLE_STRIDE`` runs.
+
+        Skipped events only count down; the one before a timed event starts
+        its clock.  A timed line gets the time since then as both inclusive
+        and exclusive time, and the counts are scaled up when written.
+        """
+        skip = self.skip
+        if skip:
+            self.skip = skip - 1
+            if skip == 1:
+                self.last_ts = time.perf_counter_ns()
+            return
+        now = time.perf_counter_ns()
+        delta = now - self.last_ts
+        key = (fid, lineno)
+        line_hits = self.line_hits
+        rec = line_hits.get(key)
+        if rec is None:
+            rec = [0, 0, 0, 0]
+            line_hits[key] = rec
+        rec[0] += 1
+        rec[1] += delta // 100
+        rec[2] += delta // 100
+        rec[3] += delta
+        self.last_ts = now
+        self.skip = _next_skip()
+        if len(line_hits) >= self.flush_at:
+            _stream_flush(self)
+            self.last_ts = time.perf_counter_ns()
+
+    def on_sample(self, frame: FrameType, elapsed_ns: int) -> None:
+        """Charge one sampling interval to the profiled frames on a stack.
+
+        The innermost profiled line gets a sample and exclusive time, every
+        distinct line on the stack gets inclusive time.  Each sub and each
+        caller/callee edge is charged at most once per sample, so recursion
+        does not inflate them.
+        """
+        scoped = []
+        f = frame
+        while f is not None:
+            code = f.f_code
+            info = _code_info.get(id(code))
+            if info is None:
+                info = _resolve_code(code)
+            if info[1]:
+                scoped.append((info[2], f.f_lineno, code.co_name))
+            f = f.f_back
+        if not scoped:
+            return
+        ticks = elapsed_ns // 100
+        line_hits = self.line_hits
+        seen = set()
+        for fid, lineno, _name in scoped:
+            key = (fid, lineno)
+            if key in seen:
+                continue
+            seen.add(key)
+            rec = line_hits.get(key)
+            if rec is None:
+                rec = [0, 0, 0, 0]
+                line_hits[key] = rec
+            rec[1] += ticks
+        rec = line_hits[scoped[0][:2]]
+        rec[0] += 1
+        rec[2] += ticks
+        rec[3] += elapsed_ns
+        names = set()
+        edges = set()
+        for i, (_fid, _lineno, name) in enumerate(scoped):
+            caller = scoped[i + 1][2] if i + 1 < len(scoped) else "<toplevel>"
+            if name not in names:
+                names.add(name)
+                self.call_time_ns[name] += elapsed_ns
+            if (caller, name) not in edges:
+                edges.add((caller, name))
+                self.calls[(caller, name)] += 1
+                self.edge_time_ns[(caller, name)] += elapsed_ns
+
+
+def _thread_state() -> _ThreadState:
+    try:
+        return _tls.state
+    except AttributeError:
+        st = _ThreadState()
+        _tls.state = st
+        with _thread_states_lock:
+            _thread_states.append(st)
+        return st
+
+
+def _reset_thread_states() -> None:
+    global _tls, _thread_states
+    _tls = threading.local()
+    _thread_states = []
+
+
+def _merge_thread_states() -> None:
+    """Sum every thread's aggregates into the module-level tables."""
+    global _line_hits, _calls, _call_time_ns, _edge_time_ns
+    _line_hits = {}
+    _calls = collections.Counter()
+    _call_time_ns = collections.Counter()
+    _edge_time_ns = collections.Counter()
+    with _thread_states_lock:
+        states = list(_thread_states)
+    for st in states:
+        for key, rec in list(st.line_hits.items()):
+            total = _line_hits.get(key)
+            if total is None:
+                _line_hits[key] = list(rec)
+            else:
+                for i, val in enumerate(rec):
+                    total[i] += val
+        # dict() copies in one step, so a thread still recording cannot
+        # resize a table while it is summed
+        _calls.update(dict(st.calls))
+        _call_time_ns.update(dict(st.call_time_ns))
+        _edge_time_ns.update(dict(st.edge_time_ns))
+
+
+def _trace(frame: FrameType, event: str, arg: Any) -> Any:
+    code = frame.f_code
+    info = _code_info.get(id(code))
+    if info is None:
+        info = _resolve_code(code)
+    if not info[1]:
+        # no local trace function: lines and returns of this frame are never
+        # reported, its wall time lands on the calling line's next event
+        return None
+    try:
+        st = _tls.state
+    except AttributeError:
+        st = _thread_state()
+    if event == "line":
+        if _sample_stride > 1:
+            st.on_strided_line(info[2], frame.f_lineno)
         else:
-            _stack.append((frame.f_lineno, now))
+            st.on_line(info[2], frame.f_lineno)
+    elif event == "call":
+        caller = frame.f_back.f_code.co_name if frame.f_back else "<toplevel>"
+        st.on_call(code.co_name, caller)
+    elif event == "return":
+        st.on_return()
     return _trace
 
 
-def profile_script(path: str, out_path: Path | str | None = None) -> None:
-    global _script_path, _start_ns, _results, _filters, _line_hits, _emitted_f
-    global _stmt_records
+# PEP 669 backend ------------------------------------------------------
+#
+# On 3.12+ ``sys.monitoring`` delivers the same events as ``sys.settrace``
+# without a per-frame trace function.  Code objects outside the profiled
+# scope return ``DISABLE`` so the interpreter stops reporting them, which
+# removes the per-line callback cost for library code altogether.
+
+_monitoring = getattr(sys, "monitoring", None)
+_use_monitoring = _monitoring is not None and not os.environ.get("PYNTP_FORCE_SETTRACE")
+_backend: str = "settrace"
+
+
+def _mon_start(code: CodeType, offset: int) -> Any:
+    info = _code_info.get(id(code))
+    if info is None:
+        info = _resolve_code(code)
+    if not info[1]:
+        return _monitoring.DISABLE
+    try:
+        st = _tls.state
+    except AttributeError:
+        st = _thread_state()
+    caller = st.call_stack[-1][0] if st.call_stack else "<toplevel>"
+    st.on_call(code.co_name, caller)
+
+
+def _mon_return(code: CodeType, offset: int, retval: object) -> Any:
+    info = _code_info.get(id(code))
+    if info is None:
+        info = _resolve_code(code)
+    if not info[1]:
+        return _monitoring.DISABLE
+    _thread_state().on_return()
+
+
+def _mon_throw(code: CodeType, offset: int, exc: BaseException) -> None:
+    # generator.throw() and close() resume a frame through PY_THROW rather
+    # than PY_RESUME; push it so the PY_YIELD or PY_UNWIND that follows pops
+    # this frame.  PY_THROW cannot be disabled, so drop _mon_start's verdict.
+    _mon_start(code, offset)
+
+
+def _mon_unwind(code: CodeType, offset: int, exc: BaseException) -> None:
+    # PY_UNWIND cannot be disabled; keep the shadow stacks balanced when a
+    # profiled frame exits through an exception.
+    info = _code_info.get(id(code))
+    if info is None:
+        info = _resolve_code(code)
+    if info[1]:
+        _thread_state().on_return()
+
+
+def _mon_line(code: CodeType, line: int) -> Any:
+    info = _code_info.get(id(code))
+    if info is None:
+        info = _resolve_code(code)
+    if not info[1]:
+        return _monitoring.DISABLE
+    try:
+        st = _tls.state
+    except AttributeError:
+        st = _thread_state()
+    if _sample_stride > 1:
+        st.on_strided_line(info[2], line)
+    else:
+        st.on_line(info[2], line)
+
+
+def _start_monitoring() -> bool:
+    mon = _monitoring
+    tool = mon.PROFILER_ID
+    try:
+        mon.use_tool_id(tool, "pynytprof")
+    except ValueError:  # tool id taken by another profiler
+        return False
+    ev = mon.events
+    mon.register_callback(tool, ev.PY_START, _mon_start)
+    mon.register_callback(tool, ev.PY_RESUME, _mon_start)
+    mon.register_callback(tool, ev.PY_THROW, _mon_throw)
+    mon.register_callback(tool, ev.PY_RETURN, _mon_return)
+    mon.register_callback(tool, ev.PY_YIELD, _mon_return)
+    mon.register_callback(tool, ev.PY_UNWIND, _mon_unwind)
+    mon.register_callback(tool, ev.LINE, _mon_line)
+    mon.set_events(
+        tool,
+        ev.PY_START
+        | ev.PY_RESUME
+        | ev.PY_THROW
+        | ev.PY_RETURN
+        | ev.PY_YIELD
+        | ev.PY_UNWIND
+        | ev.LINE,
+    )
+    # forget DISABLE verdicts left over from an earlier run in this process
+    mon.restart_events()
+    return True
+
+
+def _stop_monitoring() -> None:
+    mon = _monitoring
+    tool = mon.PROFILER_ID
+    mon.set_events(tool, 0)
+    ev = mon.events
+    for event in (
+        ev.PY_START,
+        ev.PY_RESUME,
+        ev.PY_THROW,
+        ev.PY_RETURN,
+        ev.PY_YIELD,
+        ev.PY_UNWIND,
+        ev.LINE,
+    ):
+        mon.register_callback(tool, event, None)
+    mon.free_tool_id(tool)
+
+
+def _install_tracer() -> None:
+    global _backend
+    if _use_monitoring and _start_monitoring():
+        _backend = "monitoring"
+    else:
+        # sys.monitoring is process wide; settrace needs every thread hooked
+        _backend = "settrace"
+        if hasattr(threading, "settrace_all_threads"):
+            threading.settrace_all_threads(_trace)
+        else:
+            threading.settrace(_trace)
+            sys.settrace(_trace)
+
+
+def _uninstall_tracer() -> None:
+    if _backend == "monitoring":
+        _stop_monitoring()
+    elif hasattr(threading, "settrace_all_threads"):
+        threading.settrace_all_threads(None)
+    else:
+        threading.settrace(None)
+        sys.settrace(None)
+
+
+def _wall_sample_callback():
+    """Route wall-clock samples to one ``_ThreadState`` per sampled thread."""
+    states: dict[int, _ThreadState] = {}
+
+    def on_sample(ident: int, frame: FrameType, elapsed_ns: int) -> None:
+        st = states.get(ident)
+        if st is None:
+            st = _ThreadState()
+            states[ident] = st
+            with _thread_states_lock:
+                _thread_states.append(st)
+        st.on_sample(frame, elapsed_ns)
+
+    return on_sample
+
+
+def _run_sampled(
+    run, out_path: Path | str | None, sample_hz: int, clock: str = "cpu"
+) -> None:
+    """Run ``run()`` under a sampler and write what it collected.
+
+    ``clock="cpu"`` samples the main thread on SIGPROF, ``clock="wall"``
+    samples every thread from a background thread.
+    """
+    from ._sampler import CpuSampler, WallSampler
+
+    global _sample_stride
+    # samples already carry real intervals, there is nothing to scale
+    _sample_stride = 1
+    _reset_thread_states()
+    if out_path is None:
+        out_path = f"nytprof.out.{os.getpid()}"
+    if clock == "cpu":
+        sampler = CpuSampler(sample_hz, _thread_state().on_sample)
+    elif clock == "wall":
+        sampler = WallSampler(sample_hz, _wall_sample_callback())
+    else:
+        raise ValueError(f"unknown sampling clock {clock!r}")
+    sampler.start()
+    try:
+        run()
+    finally:
+        sampler.stop()
+        _merge_thread_states()
+        _write_nytprof(Path(out_path))
+
+
+def profile_script(
+    path: str,
+    out_path: Path | str | None = None,
+    sample_hz: int | None = None,
+    sample_clock: str = "cpu",
+) -> None:
+    """Profile the script at ``path`` and write an NYTProf file to ``out_path``.
+
+    With ``sample_hz`` the script runs untraced and is sampled that many
+    times per second instead: per second of CPU time on the main thread
+    for ``sample_clock="cpu"``, per second of wall time on every thread
+    for ``sample_clock="wall"``.
+    """
+    global _script_path, _start_ns, _results, _filters, _emitted_f, _files
     _filters = [p for p in os.environ.get("NYTPROF_FILTER", "").split(",") if p]
     _script_path = Path(path).resolve()
+    _code_info.clear()
+    _files = FidRegistry()
+    _files.register(str(_script_path))
     _emitted_f = False
     _start_ns = time.time_ns()
+    _load_sampling()
+    if sample_hz:
+        _run_sampled(
+            lambda: runpy.run_path(str(_script_path), run_name="__main__"),
+            out_path,
+            sample_hz,
+            sample_clock,
+        )
+        return
     if _ctrace is not None:
+        if out_path is None:
+            out_path = f"nytprof.out.{os.getpid()}"
         _ctrace.enable(str(_script_path), _start_ns)
         try:
             runpy.run_path(str(_script_path), run_name="__main__")
         finally:
-            defs, calls, lines = _ctrace.dump()
-            paths = set()
-            for d in defs:
-                paths.add(d[1])
-            for c in calls:
-                if c[0] is not None:
-                    paths.add(c[0])
-            for s in lines:
-                paths.add(s[0])
-            files = []
-            fid_map = {}
-            for i, p in enumerate(sorted(paths)):
-                fid_map[p] = i
-                st = Path(p).stat()
-                files.append((i, 0x10, st.st_size, int(st.st_mtime), p))
-            d_records = [(rec[0], fid_map[rec[1]], rec[2], rec[3], rec[4]) for rec in defs]
-            c_records = [(fid_map.get(rec[0], 0), rec[1], rec[2], rec[3], rec[4]) for rec in calls]
-            s_records = [(fid_map[rec[0]], rec[1], rec[2], rec[3], rec[4]) for rec in lines]
-            _write_nytprof_vec(Path(out_path), files, d_records, c_records, s_records)
+            paths, s_payload, d_payload, c_payload = _ctrace.dump_packed()
+            _write_nytprof_vec(
+                Path(out_path), paths, s_payload, d_payload, c_payload, _ctrace.dropped()
+            )
         return
     _results = {}
-    global _line_hits, _calls, _call_time_ns
-    global _edge_time_ns, _last_ts, _stack, _call_stack
-    _line_hits = {}
-    _calls = collections.Counter()
-    _call_time_ns = collections.Counter()
-    _edge_time_ns = collections.Counter()
-    _last_ts = time.perf_counter_ns()
-    _stack = []
-    _call_stack = []
-    _stmt_records = []
+    _reset_thread_states()
     if out_path is None:
         out_path = f"nytprof.out.{os.getpid()}"
     out_p = Path(out_path)
-    sys.settrace(_trace)
+    _start_stream(out_p)
+    _install_tracer()
     try:
         runpy.run_path(str(_script_path), run_name="__main__")
     finally:
-        sys.settrace(None)
-        _write_nytprof(out_p)
+        _uninstall_tracer()
+        _merge_thread_states()
+        _write_nytprof(out_p, _stream)
 
 
-def profile_command(code: str, out_path: Path | str | None = None) -> None:
-    global _script_path, _start_ns, _results, _filters, _line_hits
-    global _calls, _call_time_ns, _edge_time_ns, _last_ts, _stack
-    global _call_stack, _emitted_f, _stmt_records
+def profile_command(
+    code: str,
+    out_path: Path | str | None = None,
+    sample_hz: int | None = None,
+    sample_clock: str = "cpu",
+) -> None:
+    global _script_path, _start_ns, _results, _filters, _emitted_f, _files
     _filters = [p for p in os.environ.get("NYTPROF_FILTER", "").split(",") if p]
     _script_path = Path(sys.argv[0]).resolve()
+    _code_info.clear()
+    _files = FidRegistry()
+    _files.register(str(_script_path))
     _emitted_f = False
     _start_ns = time.time_ns()
+    _load_sampling()
+    if sample_hz:
+        compiled = compile(code, str(_script_path), "exec")
+        _run_sampled(
+            lambda: exec(compiled, {"__name__": "__main__"}), out_path, sample_hz, sample_clock
+        )
+        return
     _results = {}
-    _line_hits = {}
-    _calls = collections.Counter()
-    _call_time_ns = collections.Counter()
-    _edge_time_ns = collections.Counter()
-    _last_ts = time.perf_counter_ns()
-    _stack = []
-    _call_stack = []
-    _stmt_records = []
+    _reset_thread_states()
     if out_path is None:
         out_path = f"nytprof.out.{os.getpid()}"
     out_p = Path(out_path)
-    sys.settrace(_trace)
+    _start_stream(out_p)
+    _install_tracer()
     try:
         compiled = compile(code, str(_script_path), "exec")
         exec(compiled, {"__name__": "__main__"})
     finally:
-        sys.settrace(None)
-        _write_nytprof(out_p)
+        _uninstall_tracer()
+        _merge_thread_states()
+        _write_nytprof(out_p, _stream)
+
+
+class Profiler:
+    """Profile windows of a running program and write them to one file.
+
+    ``start()`` and ``stop()`` switch the Python tracer on and off, and
+    ``region(name)`` profiles a ``with`` block as a sub called ``name``.
+    Statistics accumulate across windows until ``dump(path)`` writes them;
+    dumping does not reset them.  ``filters`` are ``NYTPROF_FILTER`` style
+    glob patterns for the files to profile, defaulting to that variable and
+    then to the ``sys.argv[0]`` script.  One profiler traces at a time.
+    """
+
+    _running: "Profiler | None" = None
+    _lock = threading.Lock()
+
+    def __init__(self, filters: list[str] | None = None) -> None:
+        if filters is None:
+            filters = [p for p in os.environ.get("NYTPROF_FILTER", "").split(",") if p]
+        self.filters = list(filters)
+        self.script_path = Path(sys.argv[0] or "-").resolve()
+        self.start_ns = time.time_ns()
+        self._files = FidRegistry()
+        script = str(self.script_path)
+        if self.script_path.is_file() and (
+            not self.filters or any(fnmatch(script, pat) for pat in self.filters)
+        ):
+            self._files.register(script)
+        self._tls = threading.local()
+        self._states: list[_ThreadState] = []
+        self._explicit = False
+        self._regions = 0
+
+    @property
+    def running(self) -> bool:
+        return Profiler._running is self
+
+    def _activate(self) -> None:
+        """Point the tracer's module state at this profiler's tables."""
+        global _script_path, _start_ns, _filters, _files, _tls, _thread_states, _stream
+        if Profiler._running not in (None, self):
+            raise RuntimeError("another Profiler is running")
+        _script_path = self.script_path
+        _start_ns = self.start_ns
+        _filters = self.filters
+        _files = self._files
+        _tls = self._tls
+        _thread_states = self._states
+        _stream = None
+        _load_sampling()
+
+    def _enable(self, frame: FrameType | None) -> None:
+        if self.running:
+            return
+        self._activate()
+        # verdicts from other runs may name fids of another registry
+        _code_info.clear()
+        now = time.perf_counter_ns()
+        with _thread_states_lock:
+            for st in self._states:
+                # frames left open by the last window never return into it
+                st.stack.clear()
+                st.call_stack.clear()
+                st.last_ts = now
+        Profiler._running = self
+        _install_tracer()
+        self._trace_frames(frame)
+
+    def _disable(self) -> None:
+        if self.running:
+            _uninstall_tracer()
+            Profiler._running = None
+
+    @staticmethod
+    def _trace_frames(frame: FrameType | None) -> None:
+        """Have settrace report lines of profiled frames that are already running."""
+        if _backend != "settrace":
+            return
+        if sys.gettrace() is not _trace:
+            sys.settrace(_trace)
+        while frame is not None:
+            info = _code_info.get(id(frame.f_code)) or _resolve_code(frame.f_code)
+            if info[1]:
+                frame.f_trace = _trace
+            frame = frame.f_back
+
+    def start(self) -> None:
+        """Start a profiling window; a no-op while one is open."""
+        with Profiler._lock:
+            self._explicit = True
+            self._enable(sys._getframe(1))
+
+    def stop(self) -> None:
+        """End the window opened by ``start()`` once no region is open."""
+        with Profiler._lock:
+            self._explicit = False
+            if not self._regions:
+                self._disable()
+
+    def region(self, name: str) -> "_Region":
+        """Context manager that profiles its block as a sub called ``name``."""
+        return _Region(self, name)
+
+    def dump(self, path: Path | str) -> None:
+        """Write everything recorded so far to ``path``."""
+        with Profiler._lock:
+            self._activate()
+            _merge_thread_states()
+            _write_nytprof(Path(path))
+
+    def __enter__(self) -> "Profiler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+class _Region:
+    __slots__ = ("profiler", "name", "state", "traced_here")
+
+    def __init__(self, profiler: Profiler, name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.state: _ThreadState | None = None
+        self.traced_here = False
+
+    def __enter__(self) -> _Region:
+        frame = sys._getframe(1)
+        prof = self.profiler
+        with Profiler._lock:
+            prof._regions += 1
+            try:
+                prof._enable(frame)
+            except BaseException:
+                prof._regions -= 1
+                raise
+        if _backend == "settrace" and sys.gettrace() is not _trace:
+            # tracing was switched on from another thread
+            self.traced_here = True
+            prof._trace_frames(frame)
+        self.state = _thread_state()
+        self.state.on_call(self.name, frame.f_code.co_name)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        prof = self.profiler
+        if self.state is not None:
+            self.state.on_return()
+        if self.traced_here and not prof._explicit:
+            sys.settrace(None)
+        with Profiler._lock:
+            prof._regions -= 1
+            if not prof._regions and not prof._explicit:
+                prof._disable()
 
 
 def profile(path: str) -> None:
@@ -412,18 +1242,31 @@ def main(argv: list[str] | None = None) -> None:
         default=f"nytprof.out.{os.getpid()}",
     )
     parser.add_argument("-e", dest="expr", default=None)
+    parser.add_argument("--compress", type=int, metavar="LEVEL", default=None)
+    parser.add_argument("--sample", type=int, metavar="HZ", default=None)
+    parser.add_argument("--clock", choices=("cpu", "wall"), default=None)
     parser.add_argument("script", nargs="?")
     parser.add_argument("args", nargs=argparse.REMAINDER)
     ns = parser.parse_args(argv)
+    if ns.compress is not None:
+        if not 0 <= ns.compress <= 9:
+            parser.error("--compress must be between 0 and 9")
+        # like NYTPROF=compress=N, inherited by profiled child processes
+        os.environ["PYNYTPROF_COMPRESS"] = str(ns.compress)
+    if ns.sample is not None and ns.sample <= 0:
+        parser.error("--sample must be a positive rate in Hz")
+    if ns.clock is not None and ns.sample is None:
+        parser.error("--clock requires --sample")
+    clock = ns.clock or "cpu"
     if ns.expr is not None:
         if ns.script:
             parser.error("cannot use -e with script")
-        profile_command(ns.expr, ns.output)
+        profile_command(ns.expr, ns.output, sample_hz=ns.sample, sample_clock=clock)
     else:
         if not ns.script:
             parser.error("missing script")
         sys.argv = [ns.script] + ns.args
-        profile_script(ns.script, ns.output)
+        profile_script(ns.script, ns.output, sample_hz=ns.sample, sample_clock=clock)
 
 
 if __name__ == "__main__":
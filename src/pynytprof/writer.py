@@ -9,6 +9,8 @@ from pathlib import Path
 from hashlib import sha1
 import zlib
 
+from ._deflate import check_level, deflater, start_marker
+
 __all__ = ["Writer"]
 
 TAG_T = b"T"
@@ -119,8 +121,15 @@ class _SubStats:
 class Writer:
     """Minimal NYTProf file writer used for tests."""
 
-    def __init__(self, path: str):
+    def __init__(self, path: str, buffer_size: int | None = None, compress: int | None = None):
         self._path = Path(path)
+        # compress=None keeps the old per-chunk zlib payloads; a level writes
+        # plain chunks inside one deflate stream, which Perl's reader inflates
+        self._level = None if compress is None else check_level(compress)
+        self._z = None
+        # streaming mode: pending statements are bounded by buffer_size bytes
+        self._buffer_size = buffer_size
+        self._pending_stmts = 0
         self._fh: os.PathLike | None = None
         self._header_written = False
         self._compressed_used = False
@@ -162,7 +171,7 @@ class Writer:
         return fid
 
     def _compress(self, tag: bytes, data: bytes) -> bytes:
-        if not data:
+        if not data or self._level is not None:
             return data
         if tag in {b"F", b"D", b"C", b"S", b"A"}:
             self._compressed_used = True
@@ -262,6 +271,9 @@ class Writer:
 
                 print(f"DEBUG: emitting chunk tag=E len={len(payload)}", file=sys.stderr)
             self._write_chunk(b"E", payload)
+            if self._z is not None:
+                self._fh.write(self._z.flush())
+                self._z = None
             self._fh.close()
             if os.getenv("PYNYTPROF_DEBUG"):
                 import sys
@@ -298,14 +310,24 @@ class Writer:
             f":osname={platform.system().lower()}",
             f":hz={hz}",
         ]
+        if self._level is not None:
+            lines.append(f"!compress={self._level}")
         banner = "\n".join(lines).rstrip("\n") + "\n"
         assert "\0" not in banner
         data = banner.encode()
         if os.getenv("PYNYTPROF_DEBUG"):
             print(f"DEBUG: about to write raw data of length={len(data)}", file=sys.stderr)
         self._fh.write(data)
+        if self._level:
+            self._fh.write(start_marker(self._level))
+            self._z = deflater(self._level)
         self._header_written = True
 
+    def _out(self, data: bytes) -> None:
+        if self._z is not None:
+            data = self._z.compress(data)
+        self._fh.write(data)
+
     def _write_chunk(self, tag: bytes, payload: bytes) -> None:
         if self._fh is None:
             raise ValueError("writer not opened")
@@ -313,16 +335,16 @@ class Writer:
         data = tag
         if os.getenv("PYNYTPROF_DEBUG"):
             print(f"DEBUG: about to write raw data of length={len(data)}", file=sys.stderr)
-        self._fh.write(data)
+        self._out(data)
         data = struct.pack("<I", len(payload))
         if os.getenv("PYNYTPROF_DEBUG"):
             print(f"DEBUG: about to write raw data of length={len(data)}", file=sys.stderr)
-        self._fh.write(data)
+        self._out(data)
         if payload:
             data = payload
             if os.getenv("PYNYTPROF_DEBUG"):
                 print(f"DEBUG: about to write raw data of length={len(data)}", file=sys.stderr)
-            self._fh.write(data)
+            self._out(data)
 
     def _ensure_table(self) -> None:
         if not self._table_written:
@@ -361,17 +383,34 @@ class Writer:
             return
         packed = [(fid, line, vals[0], vals[1]) for line, vals in sorted(recs.items())]
         self._flush_statement_block(packed)
+        self._pending_stmts -= len(recs)
         self._stmts[fid] = {}
 
+    def flush(self) -> None:
+        """Write pending statement blocks and hand the file to the OS."""
+        if self._fh is None:
+            return
+        for fid in list(self._stmts):
+            self._flush_statement_file(fid)
+        if self._z is not None:
+            self._fh.write(self._z.flush(zlib.Z_SYNC_FLUSH))
+        self._fh.flush()
+
     def record_statement(self, fid: int, line: int, elapsed_ns: int | None) -> None:
         data = self._stmts.setdefault(fid, {})
         hit_time = data.get(line)
         if hit_time is None:
             hit_time = [0, 0]
             data[line] = hit_time
+            self._pending_stmts += 1
         if hit_time[0] < 0xFFFF_FFFF:
             hit_time[0] = min(0xFFFF_FFFF, hit_time[0] + 1)
         if elapsed_ns is not None:
             hit_time[1] += elapsed_ns
         if len(data) >= 8000:
             self._flush_statement_file(fid)
+        if (
+            self._buffer_size
+            and self._pending_stmts * self._stmt_struct.size >= self._buffer_size
+        ):
+            self.flush()
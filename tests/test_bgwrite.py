@@ -0,0 +1,108 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+from pynytprof._bgwrite import BackgroundWriter
+
+from tests.test_streaming import SCRIPT, _RecordingWriter, _line_counts
+
+
+class _SlowWriter(_RecordingWriter):
+    """Recording writer whose chunks wait for ``gate`` before landing."""
+
+    def __init__(self, path=None, **kwargs):
+        super().__init__(path, **kwargs)
+        self.gate = threading.Event()
+        self.writer_threads = set()
+
+    def write_chunk(self, tag, payload):
+        self.gate.wait()
+        self.writer_threads.add(threading.current_thread().name)
+        super().write_chunk(tag, payload)
+
+
+def test_chunks_written_in_order_on_writer_thread():
+    inner = _SlowWriter()
+    inner.gate.set()
+    with BackgroundWriter(inner, buffer_size=8) as w:
+        for i in range(20):
+            w.write_chunk(b"S", bytes([i]) * 4)
+        w.flush()
+        w.drain()
+        assert inner.flushes == 1
+    assert inner.closed
+    assert [p[0] for _, p in inner.chunks] == list(range(20))
+    assert inner.writer_threads == {"pynytprof-writer"}
+    assert w.stats.buffers >= 10
+    assert w.stats.bytes == 80
+
+
+def test_full_queue_applies_backpressure():
+    inner = _SlowWriter()
+    w = BackgroundWriter(inner, buffer_size=1, depth=1)
+    # the writer thread holds one buffer and the queue another; the next
+    # handoff has to wait for the gate
+    threading.Timer(0.05, inner.gate.set).start()
+    for i in range(4):
+        w.write_chunk(b"S", b"x")
+    w.close()
+    assert len(inner.chunks) == 4
+    assert w.stats.stalls >= 1
+    assert w.stats.stall_ns > 0
+    assert w.stats.max_depth == 1
+
+
+def test_writer_errors_reach_the_producer():
+    class Broken(_RecordingWriter):
+        def write_chunk(self, tag, payload):
+            raise OSError("disk full")
+
+    w = BackgroundWriter(Broken(None), buffer_size=1)
+    w.write_chunk(b"S", b"x")
+    with pytest.raises(RuntimeError) as info:
+        w.drain()
+    assert isinstance(info.value.__cause__, OSError)
+    # the trace path keeps running; its records are dropped
+    w.write_chunk(b"S", b"y")
+    w.flush()
+    with pytest.raises(RuntimeError):
+        w.close()
+
+
+def test_writer_errors_raise_after_the_program(tmp_path, monkeypatch):
+    class Broken(_RecordingWriter):
+        def write_chunk(self, tag, payload):
+            raise OSError("disk full")
+
+    script = tmp_path / "many.py"
+    done = tmp_path / "done"
+    script.write_text(SCRIPT + f"open({str(done)!r}, 'w').close()\n")
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "Writer", Broken)
+    monkeypatch.setenv("PYNYTPROF_STREAM", "16")
+    monkeypatch.setenv("PYNYTPROF_WRITER_THREAD", "1")
+    with pytest.raises(RuntimeError) as info:
+        tracer.profile_script(str(script), tmp_path / "out.nyt")
+    assert isinstance(info.value.__cause__, OSError)
+    assert done.exists()
+    assert tracer._stream is None
+
+
+def test_tracer_streams_through_writer_thread(tmp_path, monkeypatch):
+    script = tmp_path / "many.py"
+    script.write_text(SCRIPT)
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "Writer", _RecordingWriter)
+    monkeypatch.setenv("PYNYTPROF_STREAM", "16")
+    monkeypatch.setenv("PYNYTPROF_WRITER_THREAD", "1")
+    _RecordingWriter.instances.clear()
+    tracer.profile_script(str(script), tmp_path / "out.nyt")
+    (w,) = _RecordingWriter.instances
+    assert w.closed and w.flushes > 1
+    counts = _line_counts(w.chunks)
+    assert counts[(1, 2)] == 25
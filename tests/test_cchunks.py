@@ -4,7 +4,10 @@ import sys
 from pathlib import Path
 import pytest
 
-@pytest.mark.parametrize("use_c", [False])
+from tests.utils import read_time_lines
+
+
+@pytest.mark.parametrize("use_c", [False, True])
 def test_c_chunks(tmp_path, use_c):
     script = Path(__file__).with_name("cg_example.py")
     try:
@@ -18,12 +21,7 @@ def test_c_chunks(tmp_path, use_c):
             pytest.skip("_cwrite missing")
     env = dict(os.environ)
     env["PYTHONPATH"] = str(Path(__file__).resolve().parents[1] / "src")
-    if not use_c:
-        fake = tmp_path / "fake"
-        pkg = fake / "pynytprof"
-        pkg.mkdir(parents=True)
-        (pkg / "_cwrite.py").write_text("raise ImportError\n")
-        env["PYTHONPATH"] = str(fake) + os.pathsep + env["PYTHONPATH"]
+    env["PYNYTPROF_WRITER"] = "c" if use_c else "py"
     out = tmp_path / f"nytprof.out.{os.getpid()}"
     subprocess.check_call([
         sys.executable,
@@ -34,5 +32,13 @@ def test_c_chunks(tmp_path, use_c):
         str(script),
     ], cwd=tmp_path, env=env)
     data = out.read_bytes()
-    assert b"C\x00" in data
-    assert b"D\x00" in data
+    if use_c:
+        assert b"C\x00" in data
+        assert b"D\x00" in data
+        return
+    # the token writer has no chunks; the line data arrives as TIME_LINE tokens
+    paths, lines = read_time_lines(data)
+    fids = [fid for fid, path in paths.items() if path == str(script)]
+    assert fids
+    assert lines[(fids[0], 2)][0] == 1  # bar() inside foo
+    assert lines[(fids[0], 5)][0] == 1  # return 42
@@ -0,0 +1,111 @@
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import reader, verify
+from pynytprof._index import encode_index
+from pynytprof.reader import chunk_index, iter_chunks
+
+HEADER = b"NYTProf 5 0\n:nv_size=8\n"
+S_RECS = [(1, line, 1, 10 * line, line) for line in range(1, 300)]
+C_RECS = [(1, 3, 1, 7, 5), (1, 9, 2, 4, 4)]
+D_PAYLOAD = (
+    struct.pack("<IIII", 10, 1, 3, 9)
+    + b"main::f\0"
+    + struct.pack("<IIII", 11, 1, 12, 15)
+    + b"main::g\0"
+)
+
+
+def _profile(index: bool, count_bias: int = 0) -> bytes:
+    data = bytearray(HEADER + b"P" + struct.pack("<IId", 7, 1, 0.0))
+    entries = []
+    half = len(S_RECS) // 2
+    for tag, payload, count in (
+        (b"S", b"".join(struct.pack("<IIIQQ", *r) for r in S_RECS[:half]), half),
+        (b"S", b"".join(struct.pack("<IIIQQ", *r) for r in S_RECS[half:]), len(S_RECS) - half),
+        (b"D", D_PAYLOAD, 2),
+        (b"C", b"".join(struct.pack("<IIIQQ", *r) for r in C_RECS), len(C_RECS)),
+    ):
+        data += tag + struct.pack("<I", len(payload))
+        entries.append((tag, len(data), len(payload), count + count_bias))
+        data += payload
+    if index:
+        payload = encode_index(entries, len(data))
+        data += b"X" + struct.pack("<I", len(payload)) + payload
+    return bytes(data + b"E")
+
+
+def test_index_lists_every_chunk(tmp_path):
+    plain, indexed = tmp_path / "plain.out", tmp_path / "indexed.out"
+    plain.write_bytes(_profile(False))
+    indexed.write_bytes(_profile(True))
+    assert chunk_index(str(plain)) is None
+    entries = chunk_index(str(indexed))
+    assert [(tag, count) for tag, _o, _l, count in entries] == [
+        ("S", 149),
+        ("S", 150),
+        ("D", 2),
+        ("C", 2),
+        ("X", 4),
+    ]
+    walked = [(tag, off, bytes(p)) for tag, off, p in iter_chunks(str(plain))]
+    jumped = [(tag, off, bytes(p)) for tag, off, p in iter_chunks(str(indexed))]
+    assert [t for t, _o, _p in jumped] == ["P", "S", "S", "D", "C", "X", "E"]
+    assert jumped[:5] == walked[:5]
+    a, b = reader.read(str(plain)), reader.read(str(indexed))
+    assert b == a and len(b["records"]) == len(S_RECS) and len(b["defs"]) == 2
+    assert verify.verify(str(indexed), quiet=True)
+
+
+def test_parallel_read_matches_sequential(tmp_path, monkeypatch):
+    out = tmp_path / "indexed.out"
+    out.write_bytes(_profile(True))
+    monkeypatch.setattr(reader, "_PARALLEL_MIN", 1)
+    assert reader.read(str(out), workers=2) == reader.read(str(out))
+
+
+def test_bad_index_is_rejected(tmp_path):
+    out = tmp_path / "indexed.out"
+    out.write_bytes(_profile(True, count_bias=1))
+    assert not verify.verify(str(out), quiet=True)
+    data = bytearray(_profile(True))
+    (x,) = struct.unpack_from("<Q", data, len(data) - 17)
+    struct.pack_into("<Q", data, x + 5 + 1, 3)  # first entry points into the P record
+    out.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        reader.read(str(out))
+    assert not verify.verify(str(out), quiet=True)
+
+
+def test_c_writer_index(tmp_path):
+    from pynytprof import _cwrite
+
+    if getattr(_cwrite, "__build__", "") == "pystub":
+        pytest.skip("_cwrite extension not built")
+    files = [(1, 0x10, 0, 0, __file__)]
+    defs = [(1, 1, 3, 9, "main::f"), (2, 1, 12, 15, "main::g")]
+    out = tmp_path / "c.out"
+    _cwrite.write(str(out), files, defs, C_RECS, S_RECS, 0, 10_000_000, 0, True)
+    entries = chunk_index(str(out))
+    assert [(tag, count) for tag, _o, _l, count in entries] == [
+        ("S", len(S_RECS)),
+        ("F", 1),
+        ("D", 2),
+        ("C", 2),
+        ("X", 4),
+    ]
+    assert verify.verify(str(out), quiet=True)
+    with _cwrite.Writer(str(tmp_path / "w.out"), index=True, buffer_size=4096) as w:
+        w.write_chunk(b"S", struct.pack("<IIIQQ", 1, 2, 3, 4, 5) * 10)
+        w.write_chunk(b"C", b"")
+    assert [e[3] for e in chunk_index(str(tmp_path / "w.out"))] == [10, 0, 2]
+    packed = tmp_path / "z.out"
+    _cwrite.write(str(packed), files, defs, C_RECS, S_RECS, 0, 10_000_000, 6, True)
+    assert chunk_index(str(packed)) is None  # the trailer is inside the stream
+    assert [t for t, _o, _p in iter_chunks(str(packed))] == ["P", "S", "F", "D", "C", "X", "E"]
+    assert verify.verify(str(packed), quiet=True)
@@ -0,0 +1,38 @@
+import gc
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+
+def test_code_resolved_once(tmp_path, monkeypatch):
+    script = tmp_path / "loop.py"
+    script.write_text("def f(x):\n    return x + 1\n\nfor i in range(200):\n    f(i)\n")
+    calls = []
+    orig = tracer._resolve_code
+
+    def counting(code):
+        calls.append(code)
+        return orig(code)
+
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "_resolve_code", counting)
+    tracer.profile_script(str(script), tmp_path / "out.nyt")
+    names = [c.co_name for c in calls if c.co_filename == str(script)]
+    assert sorted(names) == ["<module>", "f"]
+    assert tracer._line_hits[(1, 2)][0] == 200
+
+
+def test_cache_entry_dropped_with_code(tmp_path):
+    code = compile("x = 1\n", str(tmp_path / "gone.py"), "exec")
+    key = id(code)
+    tracer._script_path = tmp_path / "other.py"
+    info = tracer._resolve_code(code)
+    assert info[0] == str((tmp_path / "gone.py").resolve())
+    assert info[1] is False
+    assert key in tracer._code_info
+    del code, info
+    gc.collect()
+    assert key not in tracer._code_info
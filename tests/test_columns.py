@@ -0,0 +1,95 @@
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+np = pytest.importorskip("numpy")
+
+from pynytprof import columns, reader
+
+HEADER = b"NYTProf 5 0\n:nv_size=8\n"
+
+
+def _chunk(tag: bytes, recs) -> bytes:
+    payload = b"".join(struct.pack("<IIIQQ", *r) for r in recs)
+    return tag + struct.pack("<I", len(payload)) + payload
+
+
+def _write(path, s_chunks, c_recs):
+    data = HEADER + b"P" + struct.pack("<IId", 1, 1, 0.0)
+    data += b"".join(_chunk(b"S", recs) for recs in s_chunks)
+    data += _chunk(b"C", c_recs) + b"E"
+    path.write_bytes(data)
+
+
+S1 = [(1, 10, 2, 500, 400), (1, 11, 1, 5, 5), (2, 3, 4, 1 << 40, 9)]
+S2 = [(1, 10, 1, 100, 50), (2, 3, 1, 7, 7)]
+C = [(1, 10, 2, 300, 200), (1, 11, 2, 10, 10), (2, 3, 1, 99, 1)]
+
+
+def test_arrays_match_reader(tmp_path):
+    out = tmp_path / "nytprof.out"
+    _write(out, [S1 + S2], C)
+    arrays = columns.read_arrays(str(out))
+    data = reader.read(str(out))
+    assert arrays["lines"].dtype.names == columns.LINE_FIELDS
+    assert arrays["lines"].tolist() == data["records"]
+    assert arrays["calls"].tolist() == data["calls"]
+    assert not arrays["lines"].flags.owndata  # a view over the mapping
+    with pytest.raises(ValueError):
+        columns.frombuffer(b"\0" * 27)
+
+
+def test_group_sort_and_top_k(tmp_path):
+    out = tmp_path / "nytprof.out"
+    _write(out, [S1, S2], C)
+    arrays = columns.read_arrays(str(out))
+    lines = arrays["lines"]
+    assert len(lines) == 5
+    grouped = columns.group_by(lines)
+    assert grouped.dtype.names == ("fid", "line", "calls", "incl", "excl")
+    assert grouped.tolist() == [
+        (1, 10, 3, 600, 450),
+        (1, 11, 1, 5, 5),
+        (2, 3, 5, (1 << 40) + 7, 16),
+    ]
+    by_sub = columns.group_by(arrays["calls"], keys=("sid",), values=("incl", "excl"))
+    assert by_sub.tolist() == [(1, 99, 1), (2, 310, 210)]
+    top = columns.top_k(grouped, "incl", 2)
+    assert top["line"].tolist() == [3, 10]
+    assert columns.top_k(grouped, "incl", 10).tolist() == columns.sort_by(grouped, "incl").tolist()
+    ties = columns.sort_by(lines, "calls")
+    assert ties[["fid", "line", "calls"]].tolist()[1:4] == [(1, 10, 2), (1, 11, 1), (1, 10, 1)]
+    assert columns.sort_by(lines, "incl", descending=False)["incl"].tolist() == sorted(
+        lines["incl"].tolist()
+    )
+    assert len(columns.group_by(lines[:0])) == 0
+
+
+def _reference(recs, keys, values):
+    totals = {}
+    for r in recs.tolist():
+        rec = dict(zip(recs.dtype.names, r))
+        key = tuple(rec[k] for k in keys)
+        acc = totals.setdefault(key, [0] * len(values))
+        for i, v in enumerate(values):
+            acc[i] = (acc[i] + rec[v]) % (1 << 64)
+    return [k + tuple(v) for k, v in sorted(totals.items())]
+
+
+@pytest.mark.parametrize("fid_hi, incl_hi", [(5, 1 << 20), (1 << 31, 1 << 20), (5, 1 << 63)])
+def test_group_by_dense_and_sparse_keys(fid_hi, incl_hi):
+    rng = np.random.default_rng(3)
+    recs = np.zeros(3000, dtype=columns.record_dtype())
+    recs["fid"] = rng.integers(1, fid_hi, len(recs))
+    recs["line"] = rng.integers(1, 40, len(recs))
+    recs["calls"] = rng.integers(0, 1 << 32, len(recs), dtype=np.uint64)
+    recs["incl"] = rng.integers(0, incl_hi, len(recs), dtype=np.uint64)
+    values = ("calls", "incl", "excl")
+    assert columns.group_by(recs).tolist() == _reference(recs, ("fid", "line"), values)
+    assert columns.group_by(recs, keys=("line",)).tolist() == _reference(recs, ("line",), values)
+    three = ("line", "fid", "calls")
+    assert columns.group_by(recs, keys=three).tolist() == _reference(recs, three, ("incl", "excl"))
@@ -0,0 +1,178 @@
+import os
+import struct
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import reader, verify
+from pynytprof._deflate import START_DEFLATE, InflateReader, deflater, inflate, start_marker
+from pynytprof._pywrite import Writer as PyWriter
+from pynytprof.writer import Writer as ChunkWriter
+
+
+def _plain_profile() -> bytes:
+    hdr = b"NYTProf 5 0\n#Perl profile database.\n:nv_size=8\n!compress=0\n"
+    p = b"P" + struct.pack("<IId", 1, 2, 3.0)
+    s = b"".join(struct.pack("<IIIQQ", 1, line, line, 10 * line, line) for line in range(1, 500))
+    c = struct.pack("<IIIQQ", 1, 3, 1, 7, 5)
+    chunks = b"S" + struct.pack("<I", len(s)) + s + b"C" + struct.pack("<I", len(c)) + c
+    return hdr + p + chunks + b"E"
+
+
+def _compressed(raw: bytes, level: int = 6) -> bytes:
+    split = raw.index(b"\nP") + 1
+    z = deflater(level)
+    head = raw[:split].replace(b"!compress=0", b"!compress=%d" % level)
+    return head + start_marker(level) + z.compress(raw[split:]) + z.flush()
+
+
+def _tail(data: bytes) -> bytes:
+    marker = data.index(b"\n#Compressed at level ") + 1
+    marker = data.index(b"\n", marker) + 1
+    assert data[marker : marker + 1] == START_DEFLATE
+    return inflate(data[marker + 1 :])
+
+
+def test_reader_and_verify_inflate(tmp_path):
+    raw = _plain_profile()
+    plain = tmp_path / "plain.out"
+    packed = tmp_path / "packed.out"
+    plain.write_bytes(raw)
+    packed.write_bytes(_compressed(raw))
+    assert packed.stat().st_size < plain.stat().st_size
+    a = reader.read(str(plain))
+    b = reader.read(str(packed))
+    assert b["records"] == a["records"] and len(b["records"]) == 499
+    assert b["calls"] == a["calls"]
+    assert verify.verify(str(packed), quiet=True)
+
+
+def test_verify_rejects_truncated_stream(tmp_path):
+    data = _compressed(_plain_profile())
+    out = tmp_path / "cut.out"
+    out.write_bytes(data[: len(data) // 2])
+    assert not verify.verify(str(out), quiet=True)
+
+
+def test_inflate_reader_small_and_unbounded_reads():
+    import io
+
+    raw = bytes(range(256)) * (3 << 12)  # 3 MiB
+    z = deflater(6)
+    packed = z.compress(raw) + z.flush()
+    stream = InflateReader(io.BytesIO(packed))
+    head = [stream.read(28) for _ in range(1000)]
+    assert b"".join(head) == raw[:28000]
+    assert stream.read(1 << 20) == raw[28000 : 28000 + (1 << 20)]
+    assert stream.read() == raw[28000 + (1 << 20) :]
+    assert stream.read(1) == b""
+
+
+def test_pywrite_deflates_after_banner(tmp_path):
+    out = tmp_path / "tok.out"
+    with PyWriter(str(out), compress=6, script_path=__file__):
+        pass
+    data = out.read_bytes()
+    assert b"\n!compress=6\n" in data
+    tail = _tail(data)
+    assert tail[:1] == b"P"
+    assert __file__.encode() in tail
+
+
+def test_pywrite_flush_leaves_inflatable_prefix(tmp_path):
+    out = tmp_path / "tok.out"
+    w = PyWriter(str(out), compress=6, script_path=__file__, buffer_size=1 << 16)
+    w.__enter__()
+    w.write_time_line(1, 10, 5, 0)
+    w.flush()
+    tail = _tail(out.read_bytes())
+    assert tail[:1] == b"P" and __file__.encode() in tail
+    w.close()
+
+
+def test_chunk_writer_uses_stream_layout(tmp_path):
+    out = tmp_path / "chunk.out"
+    with ChunkWriter(str(out), compress=6) as w:
+        for line in range(1, 200):
+            w.record_statement(0, line, 100)
+    data = out.read_bytes()
+    tail = _tail(data)
+    assert tail[:1] == b"T"  # first chunk is stored, not zlib-wrapped
+    assert b"compressed=1" not in data
+    assert verify.verify(str(out), quiet=True)
+
+
+def test_cwrite_compress(tmp_path):
+    from pynytprof import _cwrite
+
+    if getattr(_cwrite, "__build__", "") == "pystub":
+        pytest.skip("_cwrite extension not built")
+    recs = [(1, line, 1, 100, 50) for line in range(1, 300)]
+    files = [(1, 0x10, 0, 0, __file__)]
+    plain = tmp_path / "plain.out"
+    packed = tmp_path / "packed.out"
+    _cwrite.write(str(plain), files, [], [], recs, 0, 10_000_000)
+    _cwrite.write(str(packed), files, [], [], recs, 0, 10_000_000, 6)
+    data = packed.read_bytes()
+    assert b"\n!compress=6\n" in data
+    raw = plain.read_bytes()
+    # same chunks after the P record, whose timestamp differs
+    assert _tail(data)[17:] == raw[raw.index(b"\nP") + 1 + 17 :]
+    assert verify.verify(str(packed), quiet=True)
+    with pytest.raises(ValueError):
+        _cwrite.Writer(str(tmp_path / "bad.out"), compress=10)
+
+
+def test_tracer_compress_option(tmp_path):
+    script = tmp_path / "s.py"
+    script.write_text("x = 0\nfor i in range(100):\n    x += i\n")
+    out = tmp_path / "out.nyt"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[1] / "src")
+    env.pop("PYNYTPROF_COMPRESS", None)
+    subprocess.run(
+        [sys.executable, "-m", "pynytprof.tracer", "--compress", "6", "-o", str(out), str(script)],
+        env=env,
+        check=True,
+    )
+    data = out.read_bytes()
+    assert b"\n!compress=6\n" in data
+    assert _tail(data)[:1] == b"P"
+
+
+def test_cwrite_writer_shared_between_threads(tmp_path):
+    import threading
+
+    from pynytprof import _cwrite
+
+    if getattr(_cwrite, "__build__", "") == "pystub":
+        pytest.skip("_cwrite extension not built")
+    rec = struct.pack("<IIIQQ", 1, 2, 1, 10, 10)
+    out = tmp_path / "threads.out"
+    w = _cwrite.Writer(str(out), compress=6, index=True)
+
+    def work():
+        for _ in range(200):
+            w.write_chunk(b"S", rec * 64)
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    w.close()
+    with pytest.raises(ValueError):
+        w.write_chunk(b"S", rec)
+    assert len(reader.read(str(out))["records"]) == 4 * 200 * 64
+    assert verify.verify(str(out), quiet=True)
+
+    # a writer dropped without close() still releases its file
+    dropped = tmp_path / "dropped.out"
+    w = _cwrite.Writer(str(dropped), compress=6)
+    w.write_chunk(b"S", rec)
+    del w
+    assert dropped.read_bytes().count(b"\n!compress=6\n") == 1
@@ -0,0 +1,129 @@
+import sys
+from array import array
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+from pynytprof._pywrite import Writer
+from pynytprof.token_writer import TokenEncoder, TokenWriter
+from tests.utils import read_time_lines
+
+FIDS = [1, 2, 300, 0x1FFFFF, 0xFFFFFFFF]
+LINES = [1, 127, 128, 16384, 0x10000000]
+ELAPSED = [0, -11, 0x3FFF, 1 << 31, (1 << 40) + 5]
+
+
+def _encoders():
+    encs = [TokenEncoder]
+    try:
+        from pynytprof._ctoken import Encoder
+    except ImportError:
+        pass
+    else:
+        encs.append(Encoder)
+    return encs
+
+
+@pytest.mark.parametrize("cls", _encoders())
+def test_encoder_matches_token_writer(cls):
+    tw = TokenWriter()
+    enc = cls()
+    expected = bytearray()
+    for fid, line, dt in zip(FIDS, LINES, ELAPSED):
+        enc.time_line(fid, line, dt, 0)
+        expected += tw.write_time_line(fid, line, dt & 0xFFFFFFFF, 0)
+    enc.new_fid(3, 0, 0, 0x10, 1234, 99, "/tmp/é.py")
+    expected += tw.write_new_fid(3, 0, 0, 0x10, 1234, 99, "/tmp/é.py")
+    enc.new_fid(4, 1, 7, 0, 0, 0, b"raw")
+    expected += tw.write_new_fid(4, 1, 7, 0, 0, 0, b"raw")
+    assert len(enc) == len(expected)
+    assert enc.take() == bytes(expected)
+    assert len(enc) == 0
+
+
+@pytest.mark.parametrize("cls", _encoders())
+def test_time_lines_batch(cls):
+    one = cls()
+    for fid, line, dt in zip(FIDS, LINES, ELAPSED):
+        one.time_line(fid, line, dt)
+    expected = one.take()
+    for cols in (
+        (FIDS, LINES, ELAPSED),
+        (array("I", FIDS), array("I", LINES), array("q", ELAPSED)),
+        (array("Q", FIDS), array("L", LINES), array("q", ELAPSED)),
+    ):
+        batch = cls()
+        batch.time_lines(*cols)
+        assert batch.take() == expected
+    batch = cls()
+    with pytest.raises(ValueError):
+        batch.time_lines([1, 2], [1], [0, 0])
+    assert len(batch) == 0
+
+
+def test_c_encoder_rejects_bad_input():
+    _ctoken = pytest.importorskip("pynytprof._ctoken")
+    enc = _ctoken.Encoder()
+    with pytest.raises(OverflowError):
+        enc.time_line(1 << 32, 1, 0)
+    with pytest.raises(OverflowError):
+        enc.time_lines(array("q", [-1]), array("I", [1]), array("i", [0]))
+    with pytest.raises(TypeError):
+        enc.time_lines(array("d", [1.0]), array("I", [1]), array("i", [0]))
+    assert len(enc) == 0
+
+
+def test_writer_batch_and_single_lines_agree(tmp_path):
+    a, b = tmp_path / "a.out", tmp_path / "b.out"
+    for out, batch in ((a, False), (b, True)):
+        with Writer(str(out), start_ns=0, script_path=__file__) as w:
+            if batch:
+                w.write_time_lines(
+                    array("I", [1] * 3), array("I", [5, 6, 7]), array("i", [9, -1, 3])
+                )
+            else:
+                for line, dt in zip([5, 6, 7], [9, -1, 3]):
+                    w.write_time_line(1, line, dt, 0)
+    da, db = a.read_bytes(), b.read_bytes()
+    # everything but the P record timestamp and the PID_END time is identical
+    pa, pb = da.index(b"\nP") + 18, db.index(b"\nP") + 18
+    assert da[pa:-8] == db[pb:-8]
+    assert b"+" + bytes([9, 1, 5]) in da
+
+
+def test_tracer_writes_time_lines(tmp_path, monkeypatch):
+    script = tmp_path / "loop.py"
+    script.write_text("total = 0\nfor i in range(200):\n    total += i\n")
+    out = tmp_path / "out.nyt"
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "Writer", Writer)
+    monkeypatch.setattr(tracer, "_TIME_LINE_BATCH", 2)  # several batches
+    tracer.profile_script(str(script), out)
+    paths, lines = read_time_lines(out.read_bytes())
+    (fid,) = [fid for fid, path in paths.items() if path == str(script)]
+    # one token per executed line, however often it ran
+    assert lines[(fid, 1)][0] == 1
+    assert lines[(fid, 2)][0] == 1
+    assert lines[(fid, 3)][0] == 1
+    assert sum(ticks for _n, ticks in lines.values()) > 0
+
+
+def test_time_lines_are_not_expanded_per_call():
+    class _Recorder:
+        def __init__(self):
+            self.tokens = []
+
+        def write_time_lines(self, fids, lines, elapsed):
+            self.tokens.extend(zip(fids, lines, elapsed))
+
+    w = _Recorder()
+    hits = {
+        (1, 3): [100_000, 0, 0, 5_000],
+        (1, 4): [0, 0, 0, 0],
+        (1, 5): [2, 0, 0, 300 * 1_000_000_000],  # 3e9 ticks, past the i32 range
+    }
+    assert tracer._write_time_lines(w, {1: 7}, hits)
+    assert w.tokens == [(7, 3, 50), (7, 5, (1 << 31) - 1), (7, 5, 3_000_000_000 - (1 << 31) + 1)]
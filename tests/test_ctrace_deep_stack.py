@@ -0,0 +1,57 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def _recurse(n):
+    return 0 if n == 0 else 1 + _recurse(n - 1)
+
+
+def test_ctrace_records_calls_past_initial_stack():
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    depth = 3000
+    old_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(depth + 500)
+    _ctrace.enable(__file__, 0)
+    try:
+        assert _recurse(depth) == depth
+    finally:
+        defs, calls, _lines = _ctrace.dump()
+        sys.setrecursionlimit(old_limit)
+    sid = next(d[0] for d in defs if d[4].endswith("_recurse"))
+    recs = [c for c in calls if c[2] == sid]
+    # one edge from this test and one from the recursive call site
+    assert len(recs) == 2
+    assert sum(c[5] for c in recs) == depth + 1
+    assert all(c[4] <= c[3] for c in recs)
+    assert _ctrace.dropped() == 0
+
+
+def _leaf():
+    return 1
+
+
+def test_ctrace_aggregates_calls_per_site():
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    _ctrace.enable(__file__, 0)
+    try:
+        for _ in range(1000):
+            _leaf()
+    finally:
+        defs, calls, _lines = _ctrace.dump()
+    sid = next(d[0] for d in defs if d[4].endswith("_leaf"))
+    (rec,) = [c for c in calls if c[2] == sid]
+    path, line, _sid, inc, exc, count = rec
+    assert path == __file__
+    assert line == test_ctrace_aggregates_calls_per_site.__code__.co_firstlineno + 8
+    assert count == 1000
+    assert inc >= exc
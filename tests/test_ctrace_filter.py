@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def test_ctrace_filter_verdict_follows_each_enable(tmp_path, monkeypatch):
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    kept = tmp_path / "kept.py"
+    kept.write_text("def f():\n    return 1\n")
+    other = tmp_path / "other.py"
+    other.write_text("def g():\n    return 2\n")
+    ns = {}
+    exec(compile(kept.read_text(), str(kept), "exec"), ns)
+    exec(compile(other.read_text(), str(other), "exec"), ns)
+    code = compile("for _ in range(3):\n    f(); g()\n", "<driver>", "exec")
+    code_ns = {"f": ns["f"], "g": ns["g"]}
+
+    def run():
+        _ctrace.enable(__file__, 0)
+        try:
+            exec(code, code_ns)
+        finally:
+            _defs, _calls, lines = _ctrace.dump()
+        return {path for path, *_ in lines}
+
+    monkeypatch.setenv("NYTPROF_FILTER", f"*/{kept.name}")
+    assert run() == {str(kept)}
+    # cached verdicts from the previous run must not leak into this one
+    monkeypatch.setenv("NYTPROF_FILTER", f"*/{other.name}")
+    assert run() == {str(other)}
+
+
+def test_ctrace_filtered_frames_leave_no_call_records(tmp_path, monkeypatch):
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    kept = tmp_path / "kept.py"
+    kept.write_text("def f():\n    return 1\n")
+    other = tmp_path / "other.py"
+    other.write_text("def g():\n    return 2\n")
+    ns = {}
+    exec(compile(kept.read_text(), str(kept), "exec"), ns)
+    exec(compile(other.read_text(), str(other), "exec"), ns)
+    code = compile("for _ in range(3):\n    f(); g()\n", "<driver>", "exec")
+    code_ns = {"f": ns["f"], "g": ns["g"]}
+
+    monkeypatch.setenv("NYTPROF_FILTER", f"*/{kept.name}")
+    _ctrace.enable(__file__, 0)
+    try:
+        exec(code, code_ns)
+    finally:
+        defs, calls, _lines = _ctrace.dump()
+    paths = {path: sub_id for sub_id, path, *_ in defs}
+    assert str(other) not in paths
+    assert paths[str(kept)] in {sub_id for _path, _line, sub_id, *_ in calls}
@@ -0,0 +1,35 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def test_ctrace_table_grows_without_dropping(tmp_path):
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    script = tmp_path / "big.py"
+    script.write_text("\n".join(f"x{i} = {i}" for i in range(5000)) + "\n")
+    code = compile(script.read_text(), str(script), "exec")
+    _ctrace.enable(str(script), 0)
+    try:
+        exec(code, {})
+    finally:
+        _defs, _calls, lines = _ctrace.dump()
+    hits = {line for path, line, *_ in lines if path == str(script)}
+    assert len(hits) == 5000
+    assert _ctrace.dropped() == 0
+
+
+def test_header_reports_extra_attrs(tmp_path):
+    from pynytprof._pywrite import Writer
+
+    out = tmp_path / "nytprof.out"
+    with Writer(str(out), attrs={"pynytprof_dropped": 7}):
+        pass
+    banner = out.read_bytes().split(b"\nP", 1)[0]
+    assert b"\n:pynytprof_dropped=7\n" in banner
+    assert banner.index(b":pynytprof_dropped") < banner.index(b"!subs")
@@ -0,0 +1,90 @@
+import os
+import struct
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def _leaf(n):
+    return n + 1
+
+
+def test_dump_packed_matches_chunk_layout():
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    _ctrace.enable(__file__, 0)
+    try:
+        for i in range(10):
+            _leaf(i)
+    finally:
+        paths, s_payload, d_payload, c_payload = _ctrace.dump_packed()
+    fid = paths.index(__file__) + 1
+    assert len(s_payload) % 28 == 0 and len(c_payload) % 28 == 0
+    lines = {}
+    for off in range(0, len(s_payload), 28):
+        f, line, calls, _inc, _exc = struct.unpack_from("<IIIQQ", s_payload, off)
+        if f == fid:
+            lines[line] = calls
+    assert lines[_leaf.__code__.co_firstlineno + 1] == 10
+
+    subs = {}
+    off = 0
+    while off < len(d_payload):
+        sid, f, _sl, _el = struct.unpack_from("<IIII", d_payload, off)
+        end = d_payload.index(b"\0", off + 16)
+        subs[d_payload[off + 16 : end].decode()] = (sid, f)
+        off = end + 1
+    sid, def_fid = subs["_leaf"]
+    assert def_fid == fid
+
+    sites = [struct.unpack_from("<IIIQQ", c_payload, off) for off in range(0, len(c_payload), 28)]
+    # one C record per call, as readers count calls by records
+    leaf_calls = [rec for rec in sites if rec[2] == sid]
+    assert len(leaf_calls) == 10
+    assert {rec[:2] for rec in leaf_calls} == {
+        (fid, test_dump_packed_matches_chunk_layout.__code__.co_firstlineno + 8)
+    }
+
+
+def test_call_counts_survive_dump_and_read(tmp_path):
+    try:
+        from pynytprof import _ctrace  # type: ignore  # noqa: F401
+    except Exception:
+        pytest.skip("_ctrace missing")
+    from pynytprof import _cwrite
+
+    if _cwrite.__build__ == "pystub":
+        pytest.skip("_cwrite missing")
+    from pynytprof.reader import iter_chunks
+
+    script = tmp_path / "many_calls.py"
+    script.write_text("def foo(n):\n    return n + 1\n\nfor i in range(1000):\n    foo(i)\n")
+    out = tmp_path / "nytprof.out"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[1] / "src")
+    env["PYNYTPROF_WRITER"] = "c"
+    subprocess.check_call(
+        [sys.executable, "-m", "pynytprof.tracer", "-o", str(out), str(script)],
+        cwd=tmp_path,
+        env=env,
+    )
+    chunks = {tag: bytes(payload) for tag, _off, payload in iter_chunks(str(out))}
+    sids = set()
+    off = 0
+    d_payload = chunks["D"]
+    while off < len(d_payload):
+        sid = struct.unpack_from("<I", d_payload, off)[0]
+        end = d_payload.index(b"\0", off + 16)
+        if d_payload[off + 16 : end] == b"foo":
+            sids.add(sid)
+        off = end + 1
+    (sid,) = sids
+    calls = [rec for rec in struct.iter_unpack("<IIIQQ", chunks["C"]) if rec[2] == sid]
+    assert len(calls) == 1000
+    assert {rec[1] for rec in calls} == {5}
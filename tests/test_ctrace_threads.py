@@ -0,0 +1,55 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def _work(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def test_ctrace_merges_thread_tables():
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    _ctrace.enable(__file__, 0)
+    try:
+        threads = [threading.Thread(target=_work, args=(1000,)) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        _defs, _calls, lines = _ctrace.dump()
+    body = _work.__code__.co_firstlineno + 3
+    hits = {line: calls for path, line, calls, _inc, _exc in lines if path == __file__}
+    assert hits[body] == 4 * 1000
+
+
+def test_ctrace_clock_restarts_on_enable():
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    _ctrace.enable(__file__, 0)
+    try:
+        _work(10)
+    finally:
+        _ctrace.dump()
+    time.sleep(0.5)
+    _ctrace.enable(__file__, 0)
+    try:
+        _work(10)
+    finally:
+        _defs, _calls, lines = _ctrace.dump()
+    # the gap between runs must not be charged to the first line of this one
+    assert lines
+    assert max(inc for _path, _line, _calls, inc, _exc in lines) < 250_000_000
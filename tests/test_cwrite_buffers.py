@@ -0,0 +1,87 @@
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+FILES = [(1, 0x10, 10, 0, "/tmp/a.py")]
+DEFS = [(1, 1, 3, 5, "main"), (2, 1, 7, 9, "helper")]
+LINES = [(1, 3, 2, 500, 300), (1, 4, 1, 900, 900)]
+CALLS = [(1, 4, 2, 1200, 800)]
+
+
+def _cwrite():
+    from pynytprof import _cwrite
+
+    if getattr(_cwrite, "__build__", "pystub") == "pystub":
+        pytest.skip("_cwrite missing")
+    return _cwrite
+
+
+def _chunks(path):
+    data = path.read_bytes()
+    off = data.index(b"\nP") + 1 + 17
+    chunks = {}
+    while off < len(data):
+        tag = data[off : off + 1]
+        (length,) = struct.unpack_from("<I", data, off + 1)
+        chunks[tag] = data[off + 5 : off + 5 + length]
+        off += 5 + length
+    return chunks
+
+
+def _ticks(records):
+    # buffers carry ticks; the tuple path converts nanoseconds itself
+    out = array("I")
+    for a, b, c, inc, exc in records:
+        out.frombytes(struct.pack("<IIIQQ", a, b, c, inc // 100, exc // 100))
+    return out
+
+
+def test_buffer_inputs_match_tuple_path(tmp_path):
+    cw = _cwrite()
+    ref = tmp_path / "tuples.out"
+    cw.write(str(ref), FILES, DEFS, CALLS, LINES, 0, 10_000_000)
+
+    d_buf = array("I", [v for d in DEFS for v in d[:4]])
+    names = [d[4] for d in DEFS]
+    buf = tmp_path / "buffers.out"
+    cw.write(
+        str(buf),
+        FILES,
+        (memoryview(d_buf), names),
+        _ticks(CALLS),
+        memoryview(_ticks(LINES)),
+        0,
+        10_000_000,
+    )
+    got, want = _chunks(buf), _chunks(ref)
+    assert got == want
+    assert len(got[b"S"]) == 2 * 28
+
+
+def test_buffer_inputs_are_validated(tmp_path):
+    cw = _cwrite()
+    out = str(tmp_path / "bad.out")
+    with pytest.raises(ValueError):
+        cw.write(out, FILES, DEFS, CALLS, b"\0" * 27, 0, 10_000_000)
+    with pytest.raises(ValueError):
+        cw.write(out, FILES, (b"\0" * 16, []), CALLS, LINES, 0, 10_000_000)
+
+
+def test_numpy_structured_records(tmp_path):
+    np = pytest.importorskip("numpy")
+    cw = _cwrite()
+    dtype = np.dtype(
+        [("fid", "<u4"), ("line", "<u4"), ("n", "<u4"), ("inc", "<u8"), ("exc", "<u8")]
+    )
+    lines = np.array([(a, b, c, i // 100, e // 100) for a, b, c, i, e in LINES], dtype=dtype)
+    calls = np.array([(a, b, c, i // 100, e // 100) for a, b, c, i, e in CALLS], dtype=dtype)
+    ref = tmp_path / "tuples.out"
+    cw.write(str(ref), FILES, DEFS, CALLS, LINES, 0, 10_000_000)
+    out = tmp_path / "numpy.out"
+    cw.write(str(out), FILES, DEFS, calls, lines, 0, 10_000_000)
+    assert _chunks(out) == _chunks(ref)
@@ -0,0 +1,101 @@
+import struct
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import reader, verify
+from pynytprof._deflate import deflater, start_marker
+from pynytprof.convert import _parse
+from pynytprof.reader import iter_chunks
+
+HEADER = (
+    b"NYTProf 5 0\n#Perl profile database.\n:nv_size=8\n:ticks_per_sec=10000000\n!compress=0\n"
+)
+
+
+def _profile(pid: int = 7) -> bytes:
+    p = b"P" + struct.pack("<IId", pid, 1, 2.5)
+    s = b"".join(struct.pack("<IIIQQ", 1, line, 1, 10 * line, line) for line in range(1, 100))
+    c = struct.pack("<IIIQQ", 1, 3, 1, 7, 5)
+    chunks = b"S" + struct.pack("<I", len(s)) + s + b"C" + struct.pack("<I", len(c)) + c
+    return HEADER + p + chunks + b"E"
+
+
+def test_payloads_are_views_into_the_file(tmp_path):
+    raw = _profile()
+    out = tmp_path / "nytprof.out"
+    out.write_bytes(raw)
+    chunks = [(tag, off, bytes(payload)) for tag, off, payload in iter_chunks(str(out))]
+    assert [c[0] for c in chunks] == ["P", "S", "C", "E"]
+    for tag, off, payload in chunks:
+        assert raw[off : off + len(payload)] == payload
+    assert chunks[0][1] == len(HEADER) + 1
+    assert len(chunks[1][2]) == 99 * 28
+    for tag, _off, payload in iter_chunks(str(out)):
+        assert isinstance(payload, memoryview)
+
+
+def test_compressed_profile_yields_same_chunks(tmp_path):
+    raw = _profile()
+    z = deflater(6)
+    plain, packed = tmp_path / "plain.out", tmp_path / "packed.out"
+    plain.write_bytes(raw)
+    packed.write_bytes(HEADER + start_marker(6) + z.compress(raw[len(HEADER) :]) + z.flush())
+    a = [(tag, bytes(p)) for tag, _off, p in iter_chunks(str(plain))]
+    b = [(tag, bytes(p)) for tag, _off, p in iter_chunks(str(packed))]
+    assert a == b
+
+
+def test_multi_mib_compressed_profile(tmp_path):
+    # ~4 MiB of records across many chunks, read back through InflateReader
+    s = b"".join(struct.pack("<IIIQQ", 1, line, 1, 10 * line, line) for line in range(1, 2049))
+    body = b"P" + struct.pack("<IId", 7, 1, 2.5)
+    body += (b"S" + struct.pack("<I", len(s)) + s) * 75 + b"E"
+    assert len(body) > 4 << 20
+    z = deflater(6)
+    out = tmp_path / "big.out"
+    out.write_bytes(HEADER + start_marker(6) + z.compress(body) + z.flush())
+    tags = [tag for tag, _off, payload in iter_chunks(str(out)) if tag != "S" or payload == s]
+    assert tags == ["P"] + ["S"] * 75 + ["E"]
+    assert len(reader.read(str(out))["records"]) == 75 * 2048
+    assert verify.verify(str(out), quiet=True)
+
+
+def test_consumers_share_the_iterator(tmp_path):
+    out = tmp_path / "nytprof.out"
+    out.write_bytes(_profile())
+    data = reader.read(str(out))
+    assert data["attrs"]["pid"] == 7 and data["attrs"]["ticks_per_sec"] == 10_000_000
+    assert len(data["records"]) == 99 and data["calls"] == [(1, 3, 1, 7, 5)]
+    attrs, _files, _defs, calls, lines = _parse(str(out))
+    assert calls == data["calls"] and lines == data["records"]
+    assert verify.verify(str(out), quiet=True)
+
+
+def test_truncated_and_empty_files(tmp_path):
+    raw = _profile()
+    out = tmp_path / "nytprof.out"
+    out.write_bytes(raw[:-30])
+    with pytest.raises(ValueError):
+        list(iter_chunks(str(out)))
+    assert not verify.verify(str(out), quiet=True)
+    out.write_bytes(raw[:-1])  # framing intact but no E record
+    assert [tag for tag, _o, _p in iter_chunks(str(out))] == ["P", "S", "C"]
+    assert not verify.verify(str(out), quiet=True)
+    out.write_bytes(b"")
+    with pytest.raises(ValueError):
+        list(iter_chunks(str(out)))
+
+
+def test_pid_16_is_not_a_length_word(tmp_path):
+    # pid 16 starts the P record with the bytes of a 16 byte length word
+    out = tmp_path / "nytprof.out"
+    out.write_bytes(_profile(pid=16))
+    assert [tag for tag, _o, _p in iter_chunks(str(out))] == ["P", "S", "C", "E"]
+    data = reader.read(str(out))
+    assert (data["attrs"]["pid"], data["attrs"]["ppid"]) == (16, 1)
+    assert len(data["records"]) == 99
+    assert verify.verify(str(out), quiet=True)
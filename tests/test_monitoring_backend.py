@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+SCRIPT = Path(__file__).with_name("cg_example.py")
+
+pytestmark = pytest.mark.skipif(
+    not hasattr(sys, "monitoring"), reason="sys.monitoring requires Python 3.12+"
+)
+
+
+def _profile(tmp_path, monkeypatch, use_monitoring):
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "_use_monitoring", use_monitoring)
+    tracer.profile_script(str(SCRIPT), tmp_path / "out.nyt")
+    return tracer._backend, dict(tracer._line_hits), dict(tracer._calls)
+
+
+def test_monitoring_selected_automatically(tmp_path, monkeypatch):
+    backend, lines, calls = _profile(tmp_path, monkeypatch, True)
+    assert backend == "monitoring"
+    assert calls[("<module>", "foo")] == 1
+    assert calls[("foo", "bar")] == 1
+    assert sys.monitoring.get_tool(sys.monitoring.PROFILER_ID) is None
+
+
+def test_monitoring_matches_settrace_counts(tmp_path, monkeypatch):
+    _, mon_lines, _ = _profile(tmp_path, monkeypatch, True)
+    backend, st_lines, _ = _profile(tmp_path, monkeypatch, False)
+    assert backend == "settrace"
+    assert {k: v[0] for k, v in mon_lines.items()} == {k: v[0] for k, v in st_lines.items()}
+
+
+def test_monitoring_respects_filter(tmp_path, monkeypatch):
+    monkeypatch.setenv("NYTPROF_FILTER", "nonexistent/*")
+    backend, lines, calls = _profile(tmp_path, monkeypatch, True)
+    assert backend == "monitoring"
+    assert not lines
+    assert not calls
+
+
+GEN_SCRIPT = """\
+def gen():
+    try:
+        yield 1
+    except ValueError:
+        yield 2
+    yield 3
+
+
+def outer():
+    g = gen()
+    next(g)
+    g.throw(ValueError)
+    g.close()
+
+
+def main():
+    outer()
+    outer()
+
+
+main()
+"""
+
+
+def test_generator_throw_and_close_match_settrace(tmp_path, monkeypatch):
+    script = tmp_path / "gen_throw.py"
+    script.write_text(GEN_SCRIPT)
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    edges = {}
+    for use_monitoring in (True, False):
+        monkeypatch.setattr(tracer, "_use_monitoring", use_monitoring)
+        tracer.profile_script(str(script), tmp_path / "out.nyt")
+        # the module's own caller differs between the backends
+        edges[tracer._backend] = {
+            edge: n for edge, n in tracer._calls.items() if edge[1] != "<module>"
+        }
+    assert edges["monitoring"] == edges["settrace"]
+    assert edges["monitoring"][("main", "outer")] == 2
+    assert edges["monitoring"][("outer", "gen")] == 6
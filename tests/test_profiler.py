@@ -0,0 +1,101 @@
+import importlib.util
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import pynytprof
+from pynytprof import tracer
+from tests.test_streaming import _RecordingWriter, _line_counts
+
+MODULE = """\
+def work(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+def handler():
+    return work(5)
+"""
+
+
+def _load(tmp_path):
+    path = tmp_path / "service.py"
+    path.write_text(MODULE)
+    spec = importlib.util.spec_from_file_location("service", path)
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+def _dump(prof, path):
+    _RecordingWriter.instances.clear()
+    prof.dump(path)
+    (w,) = _RecordingWriter.instances
+    assert w.closed
+    return _line_counts(w.chunks)
+
+
+@pytest.mark.parametrize("use_monitoring", [False, True])
+def test_windows_accumulate(tmp_path, monkeypatch, use_monitoring):
+    if use_monitoring and not hasattr(sys, "monitoring"):
+        pytest.skip("sys.monitoring requires Python 3.12+")
+    monkeypatch.setattr(tracer, "_use_monitoring", use_monitoring)
+    monkeypatch.setattr(tracer, "Writer", _RecordingWriter)
+    svc = _load(tmp_path)
+    prof = pynytprof.Profiler(filters=[str(tmp_path / "*.py")])
+    svc.work(50)  # before any window
+    prof.start()
+    assert prof.running
+    try:
+        svc.work(10)
+    finally:
+        prof.stop()
+    assert not prof.running and sys.gettrace() is None
+    svc.work(100)  # between windows
+    with prof.region("hot"):
+        svc.handler()
+    assert not prof.running
+    counts = _dump(prof, tmp_path / "out.nyt")
+    assert counts[(1, 4)] == 10 + 5
+    assert tracer._calls[("handler", "work")] == 1
+    assert tracer._calls[("test_windows_accumulate", "hot")] == 1
+    assert tracer._call_time_ns["hot"] >= tracer._call_time_ns["handler"] > 0
+
+    with prof:
+        svc.work(7)
+    assert _dump(prof, tmp_path / "again.nyt")[(1, 4)] == 10 + 5 + 7
+
+
+def test_regions_nest_inside_a_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(tracer, "Writer", _RecordingWriter)
+    svc = _load(tmp_path)
+    prof = tracer.Profiler(filters=[str(tmp_path / "*.py")])
+    with prof.region("outer"):
+        with prof.region("inner"):
+            svc.work(3)
+        assert prof.running
+        svc.work(4)
+    assert not prof.running
+    counts = _dump(prof, tmp_path / "out.nyt")
+    assert counts[(1, 4)] == 7
+    assert tracer._calls[("test_regions_nest_inside_a_window", "outer")] == 1
+    assert sum(n for (_caller, callee), n in tracer._calls.items() if callee == "inner") == 1
+
+
+def test_one_profiler_at_a_time(tmp_path):
+    first = tracer.Profiler(filters=[str(tmp_path / "*.py")])
+    second = tracer.Profiler(filters=[str(tmp_path / "*.py")])
+    first.start()
+    try:
+        with pytest.raises(RuntimeError):
+            second.start()
+        with pytest.raises(RuntimeError):
+            second.dump(tmp_path / "out.nyt")
+    finally:
+        first.stop()
+    assert not second.running
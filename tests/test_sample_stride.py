@@ -0,0 +1,77 @@
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+from tests.test_streaming import _RecordingWriter, _line_counts
+
+SCRIPT = """\
+total = 0
+for i in range(30000):
+    total += i
+"""
+
+
+def _profile(tmp_path, monkeypatch):
+    script = tmp_path / "loop.py"
+    script.write_text(SCRIPT)
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "Writer", _RecordingWriter)
+    _RecordingWriter.instances.clear()
+    tracer.profile_script(str(script), tmp_path / "out.nyt")
+    (w,) = _RecordingWriter.instances
+    return _line_counts(w.chunks)
+
+
+def test_stride_scales_counts(tmp_path, monkeypatch):
+    monkeypatch.setenv("NYTPROF_SAMPLE_STRIDE", "3")
+    counts = _profile(tmp_path, monkeypatch)
+    # 60002 line events, the first and every third one after it timed
+    assert sum(rec[0] for rec in tracer._line_hits.values()) == 20001
+    assert counts[(1, 3)] == pytest.approx(30000, abs=3)
+    assert counts[(1, 2)] == pytest.approx(30001, abs=3)
+
+
+def test_random_stride_is_unbiased(tmp_path, monkeypatch):
+    monkeypatch.setenv("NYTPROF_SAMPLE_STRIDE", "8")
+    monkeypatch.setenv("NYTPROF_SAMPLE_RANDOM", "1")
+    random.seed(1)
+    counts = _profile(tmp_path, monkeypatch)
+    assert counts[(1, 3)] == pytest.approx(30000, rel=0.1)
+    assert counts[(1, 2)] == pytest.approx(30001, rel=0.1)
+
+
+def test_invalid_stride_traces_everything(tmp_path, monkeypatch):
+    monkeypatch.setenv("NYTPROF_SAMPLE_STRIDE", "many")
+    counts = _profile(tmp_path, monkeypatch)
+    assert counts[(1, 3)] == 30000
+
+
+def _work(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+@pytest.mark.parametrize("random_gaps", ["0", "1"])
+def test_ctrace_stride(monkeypatch, random_gaps):
+    try:
+        from pynytprof import _ctrace  # type: ignore
+    except Exception:
+        pytest.skip("_ctrace missing")
+    monkeypatch.setenv("NYTPROF_SAMPLE_STRIDE", "3")
+    monkeypatch.setenv("NYTPROF_SAMPLE_RANDOM", random_gaps)
+    _ctrace.enable(__file__, 0)
+    try:
+        _work(30000)
+    finally:
+        _defs, _calls, lines = _ctrace.dump()
+    body = _work.__code__.co_firstlineno + 3
+    hits = {line: calls for path, line, calls, _inc, _exc in lines if path == __file__}
+    assert hits[body] % 3 == 0
+    assert hits[body] == pytest.approx(30000, rel=0.05 if random_gaps == "1" else 0.001)
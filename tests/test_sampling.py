@@ -0,0 +1,124 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+pytestmark = pytest.mark.skipif(not hasattr(signal, "setitimer"), reason="needs setitimer")
+
+SCRIPT = """\
+def spin(n):
+    total = 0
+    for i in range(n):
+        total += i * i
+    return total
+
+
+def outer():
+    return spin(3_000_000)
+
+
+outer()
+"""
+
+
+def test_samples_land_on_hot_lines(tmp_path, monkeypatch):
+    script = tmp_path / "spin.py"
+    script.write_text(SCRIPT)
+    out = tmp_path / "out.nyt"
+    handler = signal.getsignal(signal.SIGPROF)
+    tracer.profile_script(str(script), out, sample_hz=1000)
+    assert signal.getsignal(signal.SIGPROF) == handler
+    assert signal.getitimer(signal.ITIMER_PROF) == (0.0, 0.0)
+    hits = tracer._line_hits
+    samples = sum(rec[0] for rec in hits.values())
+    assert samples > 10
+    # the loop dominates and every sample has the module and outer() below it
+    assert sum(hits.get((1, n), [0])[0] for n in (3, 4)) > samples // 2
+    assert hits[(1, 12)][1] == hits[(1, 9)][1] == sum(rec[2] for rec in hits.values())
+    assert tracer._calls[("outer", "spin")] == tracer._calls[("<module>", "outer")]
+    assert tracer._call_time_ns["spin"] <= tracer._call_time_ns["outer"]
+    assert out.stat().st_size > 0
+
+
+def test_recursion_counted_once_per_sample(tmp_path):
+    script = tmp_path / "rec.py"
+    script.write_text(
+        "def down(n):\n"
+        "    if n:\n"
+        "        return down(n - 1)\n"
+        "    return sum(i for i in range(2_000_000))\n"
+        "down(20)\n"
+    )
+    tracer.profile_script(str(script), tmp_path / "out.nyt", sample_hz=500)
+    calls = tracer._calls
+    assert calls[("down", "down")] == calls[("<module>", "down")] > 0
+    assert tracer._line_hits[(1, 3)][1] <= tracer._line_hits[(1, 5)][1]
+
+
+def test_cli_sample_writes_profile(tmp_path):
+    script = tmp_path / "spin.py"
+    script.write_text(SCRIPT)
+    out = tmp_path / "cli.out"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[1] / "src")
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "pynytprof.cli",
+            "profile",
+            "--sample",
+            "500",
+            "-o",
+            str(out),
+            str(script),
+        ],
+        env=env,
+        cwd=tmp_path,
+    )
+    assert proc.returncode == 0
+    assert out.read_bytes().startswith(b"NYTProf 5 0\n")
+    bad = subprocess.run(
+        [sys.executable, "-m", "pynytprof.tracer", "--sample", "0", str(script)],
+        env=env,
+        cwd=tmp_path,
+        capture_output=True,
+    )
+    assert bad.returncode != 0 and b"--sample" in bad.stderr
+
+
+POOL = """\
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def wait(i):
+    time.sleep(0.3)
+    return i
+
+
+with ThreadPoolExecutor(4) as pool:
+    list(pool.map(wait, range(4)))
+"""
+
+
+def test_wall_sampler_sees_blocked_threads(tmp_path):
+    script = tmp_path / "pool.py"
+    script.write_text(POOL)
+    tracer.profile_script(str(script), tmp_path / "out.nyt", sample_hz=200, sample_clock="wall")
+    # each worker sleeping on line 6 has its own state
+    sleepers = [st for st in tracer._thread_states if st.line_hits.get((1, 6), [0])[0]]
+    assert len(sleepers) == 4
+    sleep_ns = tracer._line_hits[(1, 6)][3]
+    assert 0.6e9 < sleep_ns < 2.4e9  # about 4 x 0.3 s of blocked time
+    assert tracer._line_hits[(1, 11)][0] > 0  # the main thread waits in the with block
+    assert tracer._calls[("<toplevel>", "wait")] >= tracer._line_hits[(1, 6)][0]
+    assert not any(t.name == "pynytprof-sampler" for t in threading.enumerate())
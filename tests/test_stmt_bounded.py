@@ -0,0 +1,17 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+
+def test_statement_records_bounded_by_distinct_lines(tmp_path, monkeypatch):
+    script = tmp_path / "busy.py"
+    script.write_text("total = 0\nfor i in range(50_000):\n    total += i\n")
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    tracer.profile_script(str(script), tmp_path / "out.nyt")
+    assert tracer._line_hits[(1, 3)][0] == 50_000
+    records = tracer._stmt_records({1: 1})
+    assert [line for _, line, _ in records] == [1, 2, 3]
+    assert all(ns > 0 for _, _, ns in records)
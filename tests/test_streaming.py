@@ -0,0 +1,109 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+from pynytprof.protocol import read_u32
+from pynytprof.writer import Writer as ChunkWriter
+from tests.utils import read_time_lines
+
+
+class _RecordingWriter:
+    """Chunk writer stand-in that remembers what was written and when."""
+
+    instances: list["_RecordingWriter"] = []
+
+    def __init__(self, path, **kwargs):
+        self.buffer_size = kwargs.get("buffer_size")
+        self.chunks: list[tuple[bytes, bytes]] = []
+        self.flushes = 0
+        self.closed = False
+        _RecordingWriter.instances.append(self)
+
+    def __enter__(self):
+        return self
+
+    def write_chunk(self, tag, payload):
+        assert not self.closed
+        self.chunks.append((tag, bytes(payload)))
+
+    def flush(self):
+        self.flushes += 1
+
+    def close(self):
+        self.closed = True
+
+
+def _line_counts(chunks):
+    counts = {}
+    for tag, payload in chunks:
+        if tag != b"S":
+            continue
+        off = 0
+        while off < len(payload):
+            fid, off = read_u32(payload, off)
+            line, off = read_u32(payload, off)
+            calls, off = read_u32(payload, off)
+            off += 16
+            counts[(fid, line)] = counts.get((fid, line), 0) + calls
+    return counts
+
+
+SCRIPT = "".join(f"def f{i}():\n    return {i}\n" for i in range(40)) + (
+    "for _ in range(25):\n" + "".join(f"    f{i}()\n" for i in range(40))
+)
+
+
+def test_stream_flushes_during_run(tmp_path, monkeypatch):
+    script = tmp_path / "many.py"
+    script.write_text(SCRIPT)
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "Writer", _RecordingWriter)
+    monkeypatch.setenv("PYNYTPROF_STREAM", "16")
+    _RecordingWriter.instances.clear()
+    tracer.profile_script(str(script), tmp_path / "out.nyt")
+    (w,) = _RecordingWriter.instances
+    assert w.closed and w.buffer_size
+    assert w.flushes > 1
+    assert sum(tag == b"S" for tag, _ in w.chunks) > 1
+    counts = _line_counts(w.chunks)
+    loop_body = 40 * 2 + 2
+    assert counts[(1, 2)] == 25  # return of f0, summed over every chunk
+    assert counts[(1, loop_body)] == 25
+    assert tracer._stream is None
+
+
+def test_stream_leaves_prefix_after_crash(tmp_path):
+    script = tmp_path / "crash.py"
+    script.write_text("import os\n" + SCRIPT + "os._exit(3)\n")
+    out = tmp_path / "out.nyt"
+    env = dict(os.environ)
+    env["PYTHONPATH"] = str(Path(__file__).resolve().parents[1] / "src")
+    env["PYNTP_FORCE_PY"] = "1"
+    env["PYNYTPROF_WRITER"] = "py"
+    env["PYNYTPROF_STREAM"] = "16"
+    proc = subprocess.run(
+        [sys.executable, "-m", "pynytprof.tracer", "-o", str(out), str(script)],
+        env=env,
+    )
+    assert proc.returncode == 3
+    paths, lines = read_time_lines(out.read_bytes())
+    (fid,) = [fid for fid, path in paths.items() if path == str(script)]
+    # every iteration but the last has been streamed out before the crash
+    for i in range(40):
+        assert 24 <= lines[(fid, 2 * i + 3)][0] <= 25  # return of f<i>
+    assert 24 <= lines[(fid, 82)][0] <= 26  # loop header
+
+
+def test_chunk_writer_bounds_pending_statements(tmp_path):
+    out = tmp_path / "out.nyt"
+    with ChunkWriter(str(out), buffer_size=20 * 100) as w:
+        for line in range(1, 1001):
+            w.record_statement(1, line, 10)
+            assert w._pending_stmts <= 100
+        size_mid_run = out.stat().st_size
+    assert size_mid_run > 0
+    assert out.stat().st_size > size_mid_run
@@ -0,0 +1,46 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+SCRIPT = """\
+import threading
+
+
+def work(n):
+    total = 0
+    for i in range(n):
+        total += i
+    return total
+
+
+threads = [threading.Thread(target=work, args=(1000,)) for _ in range(4)]
+for t in threads:
+    t.start()
+for t in threads:
+    t.join()
+"""
+
+
+@pytest.mark.parametrize("use_monitoring", [False, True])
+def test_threads_profiled_with_own_state(tmp_path, monkeypatch, use_monitoring):
+    if use_monitoring and not hasattr(sys, "monitoring"):
+        pytest.skip("sys.monitoring requires Python 3.12+")
+    script = tmp_path / "threads.py"
+    script.write_text(SCRIPT)
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "_use_monitoring", use_monitoring)
+    tracer.profile_script(str(script), tmp_path / "out.nyt")
+    # module thread plus four workers
+    assert len(tracer._thread_states) == 5
+    assert tracer._line_hits[(1, 7)][0] == 4 * 1000
+    assert sum(n for (_, callee), n in tracer._calls.items() if callee == "work") == 4
+    workers = [st for st in tracer._thread_states if (1, 7) in st.line_hits]
+    assert len(workers) == 4
+    for st in workers:
+        assert st.line_hits[(1, 7)][0] == 1000
+        assert not st.stack
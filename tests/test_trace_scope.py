@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import tracer
+
+
+def test_out_of_scope_frame_gets_no_local_trace(tmp_path):
+    tracer._script_path = tmp_path / "elsewhere.py"
+    tracer._code_info.clear()
+    assert tracer._trace(sys._getframe(), "call", None) is None
+
+
+def test_callbacks_from_library_are_traced(tmp_path, monkeypatch):
+    (tmp_path / "helperlib.py").write_text(
+        "def apply(f, xs):\n"
+        "    out = []\n"
+        "    for x in xs:\n"
+        "        out.append(f(x))\n"
+        "    return out\n"
+    )
+    script = tmp_path / "main.py"
+    script.write_text(
+        "import helperlib\n\ndef sq(x):\n    return x * x\n\nhelperlib.apply(sq, range(10))\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "helperlib", raising=False)
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    monkeypatch.setattr(tracer, "_use_monitoring", False)
+    tracer.profile_script(str(script), tmp_path / "out.nyt")
+    assert tracer._line_hits[(1, 4)][0] == 10
+    assert tracer._calls[("apply", "sq")] == 10
+    assert all(not st.stack for st in tracer._thread_states)
+
+
+def test_filter_selects_library_files(tmp_path, monkeypatch):
+    lib = tmp_path / "helperlib.py"
+    lib.write_text(
+        "def apply(f, xs):\n"
+        "    out = []\n"
+        "    for x in xs:\n"
+        "        out.append(f(x))\n"
+        "    return out\n"
+    )
+    script = tmp_path / "main.py"
+    script.write_text(
+        "import helperlib\n\ndef sq(x):\n    return x * x\n\nhelperlib.apply(sq, range(10))\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "helperlib", raising=False)
+    monkeypatch.setenv("NYTPROF_FILTER", f"{tmp_path.resolve()}/*")
+    monkeypatch.setattr(tracer, "_ctrace", None)
+    out = tmp_path / "out.nyt"
+    tracer.profile_script(str(script), out)
+    assert tracer._files.items() == [(str(script.resolve()), 1), (str(lib.resolve()), 2)]
+    assert tracer._line_hits[(2, 4)][0] == 10
+    assert tracer._line_hits[(1, 4)][0] == 10
+    assert str(lib.resolve()).encode() in out.read_bytes()
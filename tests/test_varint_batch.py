@@ -0,0 +1,62 @@
+import sys
+from array import array
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof import encoding
+from pynytprof.encoding import decode_u32_many, encode_u32, encode_u32_many
+
+EDGES = [
+    0,
+    1,
+    0x7F,
+    0x80,
+    0x3FFF,
+    0x4000,
+    0x1FFFFF,
+    0x200000,
+    0xFFFFFFF,
+    0x10000000,
+    0xFFFFFFFF,
+]
+VALUES = EDGES + [(i * 2654435761) % (1 << (i % 33)) for i in range(2000)]
+
+
+def _impls():
+    impls = [(encoding._encode_u32_many_py, encoding._decode_u32_many_py)]
+    if encoding._numpy_available():
+        impls.append((encoding._encode_u32_many_np, encoding._decode_u32_many_np))
+    if encoding._c_encode_many is not None:
+        impls.append((encoding._c_encode_many, encoding._c_decode_many))
+    return impls
+
+
+@pytest.mark.parametrize("enc, dec", _impls())
+def test_batch_matches_single_encoder(enc, dec):
+    expected = b"".join(encode_u32(v) for v in VALUES)
+    assert enc(VALUES) == expected
+    assert enc(array("I", VALUES)) == expected
+    decoded = dec(expected)
+    assert decoded.typecode == "I"
+    assert list(decoded) == VALUES
+    assert enc([]) == b""
+    assert list(dec(b"")) == []
+
+
+@pytest.mark.parametrize("enc, dec", _impls())
+def test_batch_rejects_bad_input(enc, dec):
+    with pytest.raises(OverflowError):
+        enc([1, 1 << 32])
+    with pytest.raises(OverflowError):
+        enc([-1])
+    with pytest.raises(ValueError):
+        dec(encode_u32(5) + encode_u32(0x200000)[:-1])
+
+
+def test_public_entry_points():
+    data = encode_u32_many(array("I", EDGES))
+    assert list(decode_u32_many(data)) == EDGES
+    assert list(decode_u32_many(memoryview(data))) == EDGES
@@ -6,6 +6,12 @@ import subprocess
 import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from pynytprof.nytprof_tags import NYTP_TAG_NEW_FID, NYTP_TAG_PID_END, NYTP_TAG_TIME_LINE
+from pynytprof.protocol import read_i32, read_u32
+from pynytprof.reader import header_scan
+
 
 def newest_profile_file(path: str | Path = '.') -> Path:
     base = Path(path)
@@ -34,3 +40,43 @@ def run_tracer(tmp_path: Path) -> Path:
         env=env,
     )
     return newest_profile_file(tmp_path)
+
+
+def read_time_lines(data: bytes) -> tuple[dict[int, str], dict[tuple[int, int], list[int]]]:
+    """Decode a token stream into ``fid -> path`` and ``(fid, line) -> [statements, ticks]``.
+
+    Decoding stops at the PID_END token or at a truncated tail, so the prefix
+    left by a crashed run decodes too.
+    """
+    _, _, off = header_scan(data)
+    paths: dict[int, str] = {}
+    lines: dict[tuple[int, int], list[int]] = {}
+    try:
+        while off < len(data):
+            tag = data[off]
+            off += 1
+            if tag == NYTP_TAG_NEW_FID:
+                fid, off = read_u32(data, off)
+                for _ in range(5):  # eval fid, eval line, flags, size, mtime
+                    _, off = read_u32(data, off)
+                size, off = read_u32(data, off + 1)  # skip the string tag
+                if off + size > len(data):
+                    break
+                paths[fid] = data[off : off + size].decode()
+                off += size
+            elif tag == NYTP_TAG_TIME_LINE:
+                elapsed, off = read_i32(data, off)
+                fid, off = read_u32(data, off)
+                line, off = read_u32(data, off)
+                if off > len(data):
+                    break
+                rec = lines.setdefault((fid, line), [0, 0])
+                rec[0] += 1
+                rec[1] += elapsed
+            elif tag == NYTP_TAG_PID_END:
+                break
+            else:
+                raise ValueError(f"unexpected tag {tag:#x} at offset {off - 1}")
+    except IndexError:  # truncated varint
+        pass
+    return paths, lines